@@ -36,6 +36,7 @@ class LGBPHS (Extractor):
       lbp_add_average = False,
       # histogram options
       sparse_histogram = False,
+      compact_sparse_histogram = False, # store indices and values of sparse histograms in single precision
       split_histogram = None
   ):
     """Initializes the local Gabor binary pattern histogram sequence tool chain with the given file selector object"""
@@ -62,6 +63,7 @@ class LGBPHS (Extractor):
         lbp_compare_to_average = lbp_compare_to_average,
         lbp_add_average = lbp_add_average,
         sparse_histogram = sparse_histogram,
+        compact_sparse_histogram = compact_sparse_histogram,
         split_histogram = split_histogram
     )
 
@@ -109,29 +111,26 @@ class LGBPHS (Extractor):
     self.m_sparse = sparse_histogram
     if self.m_sparse and self.m_split:
       raise ValueError("Sparse histograms cannot be split! Check your setup!")
+    if compact_sparse_histogram and not self.m_sparse:
+      raise ValueError("Only sparse histograms can be compact! Check your setup!")
+    self.m_sparse_dtype = numpy.float32 if compact_sparse_histogram else numpy.float64
 
 
-  def __fill__(self, lgbphs_array, lgbphs_blocks, j):
-    """Copies the given array into the given blocks"""
-    # fill array in the desired shape
-    if self.m_split == None:
-      start = j * self.m_n_bins * self.m_n_blocks
-      for b in range(self.m_n_blocks):
-        lgbphs_array[start + b * self.m_n_bins : start + (b+1) * self.m_n_bins] = lgbphs_blocks[b][:]
-    elif self.m_split == 'blocks':
-      for b in range(self.m_n_blocks):
-        lgbphs_array[b, j * self.m_n_bins : (j+1) * self.m_n_bins] = lgbphs_blocks[b][:]
-    elif self.m_split == 'wavelets':
-      for b in range(self.m_n_blocks):
-        lgbphs_array[j, b * self.m_n_bins : (b+1) * self.m_n_bins] = lgbphs_blocks[b][:]
-    elif self.m_split == 'both':
-      for b in range(self.m_n_blocks):
-        lgbphs_array[j * self.m_n_blocks + b, 0 : self.m_n_bins] = lgbphs_blocks[b][:]
+  def __fill__(self, lgbphs_view, lgbphs_blocks, j):
+    """Copies the histograms of all blocks of the given layer into the given (layers x blocks x bins) view of the output array"""
+    lgbphs_view[j] = lgbphs_blocks
+
+  def __output_view__(self, lgbphs_array, jet_length):
+    """Returns a view of shape (layers x blocks x bins) of the given output array, through which the histograms are written directly into the output"""
+    if self.m_split == 'blocks':
+      return lgbphs_array.reshape((self.m_n_blocks, jet_length, self.m_n_bins)).transpose((1,0,2))
+    # for all other layouts, the blocks of one layer are stored consecutively
+    return lgbphs_array.reshape((jet_length, self.m_n_blocks, self.m_n_bins))
 
   def __call__(self, image):
     """Extracts the local Gabor binary pattern histogram sequence from the given image"""
     # perform GWT on image
-    if self.m_trafo_image is None or self.m_trafo_image.shape[1:2] != image.shape:
+    if self.m_trafo_image is None or self.m_trafo_image.shape[1:3] != image.shape:
       # create trafo image
       self.m_trafo_image = self.m_gwt.empty_trafo_image(image)
 
@@ -139,47 +138,40 @@ class LGBPHS (Extractor):
     image = image.astype(numpy.complex128)
     self.m_gwt(image, self.m_trafo_image)
 
-    jet_length = self.m_gwt.number_of_kernels * (2 if self.m_use_phases else 1)
+    # compute the absolute values (and the phases) of all layers of the trafo image at once;
+    # the phase layers are stored after the absolute layers
+    layers = numpy.abs(self.m_trafo_image)
+    if self.m_use_phases:
+      layers = numpy.concatenate((layers, numpy.angle(self.m_trafo_image)))
+    jet_length = len(layers)
 
     lgbphs_array = None
-    # iterate through the layers of the trafo image
-    for j in range(self.m_gwt.number_of_kernels):
-      # compute absolute part of complex response
-      abs_image = numpy.abs(self.m_trafo_image[j])
+    # iterate through the layers
+    for j in range(jet_length):
       # Computes LBP histograms
-      abs_blocks = self.m_lgbphs_extractor(abs_image)
-
-      # Converts to Blitz array (of different dimensionalities)
-      self.m_n_bins = self.m_lgbphs_extractor.n_bins
-      self.m_n_blocks = len(abs_blocks)
-
-      if self.m_split == None:
-        shape = (self.m_n_blocks * self.m_n_bins * jet_length,)
-      elif self.m_split == 'blocks':
-        shape = (self.m_n_blocks, self.m_n_bins * jet_length)
-      elif self.m_split == 'wavelets':
-        shape = (jet_length, self.m_n_bins * self.m_n_blocks)
-      elif self.m_split == 'both':
-        shape = (jet_length * self.m_n_blocks, self.m_n_bins)
-      else:
-        raise ValueError("The split parameter must be one of ['blocks', 'wavelets', 'both'] or None")
+      blocks = self.m_lgbphs_extractor(layers[j])
 
       # create new array if not done yet
-      if lgbphs_array == None:
-        lgbphs_array = numpy.ndarray(shape, 'float64')
-
-      # fill the array with the absolute values of the Gabor wavelet transform
-      self.__fill__(lgbphs_array, abs_blocks, j)
+      if lgbphs_array is None:
+        self.m_n_bins = self.m_lgbphs_extractor.n_bins
+        self.m_n_blocks = len(blocks)
+
+        if self.m_split == None:
+          shape = (self.m_n_blocks * self.m_n_bins * jet_length,)
+        elif self.m_split == 'blocks':
+          shape = (self.m_n_blocks, self.m_n_bins * jet_length)
+        elif self.m_split == 'wavelets':
+          shape = (jet_length, self.m_n_bins * self.m_n_blocks)
+        elif self.m_split == 'both':
+          shape = (jet_length * self.m_n_blocks, self.m_n_bins)
+        else:
+          raise ValueError("The split parameter must be one of ['blocks', 'wavelets', 'both'] or None")
 
-      if self.m_use_phases:
-        # compute phase part of complex response
-        phase_image = numpy.angle(self.m_trafo_image[j])
-        # Computes LBP histograms
-        phase_blocks = self.m_lgbphs_extractor(phase_image)
-        # fill the array with the phases at the end of the blocks
-        self.__fill__(lgbphs_array, phase_blocks, j + self.m_gwt.number_of_kernels)
+        lgbphs_array = numpy.ndarray(shape, 'float64')
+        lgbphs_view = self.__output_view__(lgbphs_array, jet_length)
 
+      # fill the array with the histograms of the current layer
+      self.__fill__(lgbphs_view, blocks, j)
 
     # return the concatenated list of all histograms
-    return utils.histogram.sparsify(lgbphs_array) if self.m_sparse else lgbphs_array
-
+    return utils.histogram.sparsify(lgbphs_array, self.m_sparse_dtype) if self.m_sparse else lgbphs_array
@@ -141,6 +141,16 @@ class ToolChainExecutor:
         help = 'Try to recursively delete the dependent jobs from the SGE grid queue, when a job failed')
     other_group.add_argument('-D', '--timer', choices=('real', 'system', 'user'), nargs = '*',
         help = 'Measure and report the time required by the execution of the tool chain (only on local machine)')
+    other_group.add_argument('--parallel', metavar = 'N', type = int,
+        help = 'Run the preprocessing and the feature extraction in N parallel processes on the local machine (only without the --grid option)')
+    other_group.add_argument('--parallel-chunk-size', metavar = 'N', type = int, default = 1,
+        help = 'The number of files that are sent to one of the --parallel processes at once')
+    other_group.add_argument('--packed-storage', action='store_true',
+        help = 'Store the preprocessed data, the extracted features and the projected features in a few large container files per directory, instead of writing one file per sample')
+    other_group.add_argument('--binary-scores', action='store_true',
+        help = 'Write the score files in a compact binary format instead of the four-column text format')
+    other_group.add_argument('--score-shards', action='store_true',
+        help = 'Let each scoring job write the scores of all of its models into one shard of the group score file, instead of writing one score file per model')
 
     utils.add_logger_command_line_option(other_group)
 
@@ -73,7 +73,7 @@ def command_line_arguments(command_line_parameters):
   utils.set_verbosity_level(args.verbose)
 
   # assign the score file parser
-  args.parser = {'4column' : bob.measure.load.split_four_column, '5column' : bob.measure.load.split_five_column}[args.parser]
+  args.parser = {'4column' : utils.scores.split_four_column, '5column' : bob.measure.load.split_five_column}[args.parser]
 
   return args
 
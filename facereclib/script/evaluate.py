@@ -60,7 +60,7 @@ def command_line_arguments(command_line_parameters):
   parser.add_argument('-R', '--roc', help = "If given, ROC curves will be plotted into the given pdf file.")
   parser.add_argument('-D', '--det', help = "If given, DET curves will be plotted into the given pdf file.")
   parser.add_argument('-C', '--cmc', help = "If given, CMC curves will be plotted into the given pdf file.")
-  parser.add_argument('-p', '--parser', default = '4column', choices = ('4column', '5column'), help="The style of the resulting score files. The default fits to the usual output of FaceRecLib score files.")
+  parser.add_argument('-p', '--parser', default = '4column', choices = ('4column', '5column'), help="The style of the resulting score files. The default fits to the usual output of FaceRecLib score files, in text or in binary format.")
 
   parser.add_argument('--self-test', action='store_true', help=argparse.SUPPRESS)
 
@@ -159,7 +159,7 @@ def main(command_line_parameters=None):
   colors = [cmap(i) for i in numpy.linspace(0, 1.0, len(args.dev_files)+1)]
 
   if args.criterion or args.roc or args.det or args.cllr:
-    score_parser = {'4column' : bob.measure.load.split_four_column, '5column' : bob.measure.load.split_five_column}[args.parser]
+    score_parser = {'4column' : utils.scores.split_four_column, '5column' : bob.measure.load.split_five_column}[args.parser]
 
     # First, read the score files
     utils.info("Loading %d score files of the development set" % len(args.dev_files))
@@ -235,7 +235,7 @@ def main(command_line_parameters=None):
 
   if args.cmc:
     utils.info("Computing CMC curves on the development " + ("and on the evaluation set" if args.eval_files else "set"))
-    cmc_parser = {'4column' : bob.measure.load.cmc_four_column, '5column' : bob.measure.load.cmc_five_column}[args.parser]
+    cmc_parser = {'4column' : utils.scores.cmc_four_column, '5column' : bob.measure.load.cmc_five_column}[args.parser]
     cmcs_dev = [cmc_parser(os.path.join(args.directory, f)) for f in args.dev_files]
     if args.eval_files:
       cmcs_eval = [cmc_parser(os.path.join(args.directory, f)) for f in args.eval_files]
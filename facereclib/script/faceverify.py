@@ -56,7 +56,10 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
         enroller_file = self.m_configuration.enroller_file,
         model_directories = models_directories,
         score_directories = score_directories,
-        zt_score_directories = zt_score_directories
+        zt_score_directories = zt_score_directories,
+        packed_storage = self.m_args.packed_storage,
+        binary_scores = self.m_args.binary_scores,
+        sharded_scores = self.m_args.score_shards
     )
 
     # create the tool chain to be used to actually perform the parts of the experiments
@@ -72,6 +75,8 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
       else:
         self.m_tool_chain.preprocess_data(
               self.m_preprocessor,
+              parallel = self.m_args.parallel,
+              chunk_size = self.m_args.parallel_chunk_size,
               force = self.m_args.force)
 
     # feature extraction
@@ -91,6 +96,8 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
         self.m_tool_chain.extract_features(
               self.m_extractor,
               self.m_preprocessor,
+              parallel = self.m_args.parallel,
+              chunk_size = self.m_args.parallel_chunk_size,
               force = self.m_args.force)
 
     # feature projection
@@ -137,6 +144,12 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
     if not self.m_args.skip_score_computation:
       if self.m_args.dry_run:
         print "Would have computed the scores of groups %s ..." % self.m_args.groups
+      elif self.m_args.scores_in_memory:
+        self.m_tool_chain.compute_scores_in_memory(
+              self.m_tool,
+              self.m_args.zt_norm,
+              groups = self.m_args.groups,
+              force = self.m_args.force)
       else:
         self.m_tool_chain.compute_scores(
               self.m_tool,
@@ -145,11 +158,11 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
               preload_probes = self.m_args.preload_probes,
               force = self.m_args.force)
 
-      if self.m_args.zt_norm:
+      if self.m_args.zt_norm and not self.m_args.scores_in_memory:
         if self.m_args.dry_run:
           print "Would have computed the ZT-norm scores of groups %s ..." % self.m_args.groups
         else:
-          self.m_tool_chain.zt_norm(groups = self.m_args.groups)
+          self.m_tool_chain.zt_norm(groups = self.m_args.groups, memory_map = self.m_args.zt_norm_memory_map)
 
     # concatenation of scores
     if not self.m_args.skip_concatenation:
@@ -420,7 +433,7 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
             force = self.m_args.force)
 
       else:
-        self.m_tool_chain.zt_norm(groups = [self.m_args.group])
+        self.m_tool_chain.zt_norm(groups = [self.m_args.group], memory_map = self.m_args.zt_norm_memory_map)
 
     # concatenate
     elif self.m_args.sub_task == 'concatenate':
@@ -471,6 +484,10 @@ def parse_args(command_line_parameters):
       help = 'Force to erase former data if already exist')
   other_group.add_argument('-w', '--preload-probes', action='store_true',
       help = 'Preload probe files during score computation (needs more memory, but is faster and requires fewer file accesses). WARNING! Use this flag with care!')
+  other_group.add_argument('--scores-in-memory', action='store_true',
+      help = 'Compute all scores and the ZT-normalization in memory, without writing the intermediate score matrices (implies --preload-probes; only without the --grid option)')
+  other_group.add_argument('--zt-norm-memory-map', action='store_true',
+      help = 'Assemble the ZT-norm matrices of all T-models in memory-mapped temporary files, in case they do not fit into memory')
   other_group.add_argument('--groups', metavar = 'GROUP', nargs = '+', default = ['dev'],
       help = "The group (i.e., 'dev' or  'eval') for which the models and scores should be generated")
 
@@ -486,7 +503,10 @@ def parse_args(command_line_parameters):
   parser.add_argument('--group',
       help = argparse.SUPPRESS) #'The group for which the current action should be performed'
 
-  return parser.parse_args(command_line_parameters)
+  args = parser.parse_args(command_line_parameters)
+  if args.scores_in_memory and args.grid:
+    parser.error("The --scores-in-memory option cannot be used together with the --grid option")
+  return args
 
 
 def face_verify(args, command_line_parameters, external_dependencies = [], external_fake_job_id = 0):
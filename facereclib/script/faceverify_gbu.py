@@ -47,7 +47,10 @@ class ToolChainExecutorGBU (ToolChainExecutor.ToolChainExecutor):
         projected_directory = self.m_configuration.projected_directory,
         enroller_file = self.m_configuration.enroller_file,
         model_directories = (self.m_configuration.models_directory,),
-        score_directories = (self.m_configuration.scores_directory,)
+        score_directories = (self.m_configuration.scores_directory,),
+        packed_storage = self.m_args.packed_storage,
+        binary_scores = self.m_args.binary_scores,
+        sharded_scores = self.m_args.score_shards
     )
 
     # specify the file selector and tool chain objects to be used by this class (and its base class)
@@ -64,6 +67,8 @@ class ToolChainExecutorGBU (ToolChainExecutor.ToolChainExecutor):
       else:
         self.m_tool_chain.preprocess_data(
               self.m_preprocessor,
+              parallel = self.m_args.parallel,
+              chunk_size = self.m_args.parallel_chunk_size,
               force = self.m_args.force)
 
     # feature extraction
@@ -83,6 +88,8 @@ class ToolChainExecutorGBU (ToolChainExecutor.ToolChainExecutor):
         self.m_tool_chain.extract_features(
               self.m_extractor,
               self.m_preprocessor,
+              parallel = self.m_args.parallel,
+              chunk_size = self.m_args.parallel_chunk_size,
               force = self.m_args.force)
 
     # feature projection
@@ -52,7 +52,10 @@ class ToolChainExecutorLFW (ToolChainExecutor.ToolChainExecutor):
         projected_directory = self.m_configuration.projected_directory,
         enroller_file = self.m_configuration.enroller_file,
         model_directories = (self.m_configuration.models_directory,),
-        score_directories = (self.m_configuration.scores_directory,)
+        score_directories = (self.m_configuration.scores_directory,),
+        packed_storage = self.m_args.packed_storage,
+        binary_scores = self.m_args.binary_scores,
+        sharded_scores = self.m_args.score_shards
     )
 
     # create the tool chain to be used to actually perform the parts of the experiments
@@ -72,6 +75,8 @@ class ToolChainExecutorLFW (ToolChainExecutor.ToolChainExecutor):
       else:
         self.m_tool_chain.preprocess_data(
               self.m_preprocessor,
+              parallel = self.m_args.parallel,
+              chunk_size = self.m_args.parallel_chunk_size,
               force = self.m_args.force)
 
     # feature extraction
@@ -91,6 +96,8 @@ class ToolChainExecutorLFW (ToolChainExecutor.ToolChainExecutor):
         self.m_tool_chain.extract_features(
               self.m_extractor,
               self.m_preprocessor,
+              parallel = self.m_args.parallel,
+              chunk_size = self.m_args.parallel_chunk_size,
               force = self.m_args.force)
 
     # feature projection
@@ -368,7 +375,7 @@ class ToolChainExecutorLFW (ToolChainExecutor.ToolChainExecutor):
         self.m_file_selector.score_directories = (self.__scores_directory__('view1'),)
         res_file = self.m_file_selector.no_norm_result_file('dev')
 
-        negatives, positives = bob.measure.load.split_four_column(res_file)
+        negatives, positives = utils.scores.split_four_column(res_file)
         threshold = bob.measure.eer_threshold(negatives, positives)
 
         far, frr = bob.measure.farfrr(negatives, positives, threshold)
@@ -391,11 +398,11 @@ class ToolChainExecutorLFW (ToolChainExecutor.ToolChainExecutor):
           eval_res_file = self.m_file_selector.no_norm_result_file('eval')
 
           # compute threshold on dev data
-          dev_negatives, dev_positives = bob.measure.load.split_four_column(dev_res_file)
+          dev_negatives, dev_positives = utils.scores.split_four_column(dev_res_file)
           threshold = bob.measure.eer_threshold(dev_negatives, dev_positives)
 
           # compute FAR and FRR for eval data
-          eval_negatives, eval_positives = bob.measure.load.split_four_column(eval_res_file)
+          eval_negatives, eval_positives = utils.scores.split_four_column(eval_res_file)
 
           far, frr = bob.measure.farfrr(eval_negatives, eval_positives, threshold)
           hter = (far + frr)/2.0
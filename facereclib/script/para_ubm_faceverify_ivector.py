@@ -316,23 +316,31 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
                 **self.m_grid.training_queue)
         deps.append(job_ids['kmeans-init'])
 
-      # several iterations of E and M steps
-      for iteration in range(self.m_args.kmeans_start_iteration, self.m_args.kmeans_training_iterations):
-        # E-step
-        job_ids['kmeans-e-step'] = self.submit_grid_job(
-                'kmeans-e-step --iteration %d' % iteration,
-                name='k-e-%d' % iteration,
-                list_to_split = self.training_list(),
-                number_of_files_per_job = self.m_grid.number_of_projected_features_per_job,
-                dependencies = [job_ids['kmeans-m-step']] if iteration != self.m_args.kmeans_start_iteration else deps,
-                **self.m_grid.projection_queue)
-
-        # M-step
+      if self.m_args.local_ubm_processes:
+        # all iterations in a single job using several local processes
         job_ids['kmeans-m-step'] = self.submit_grid_job(
-                'kmeans-m-step --iteration %d' % iteration,
-                name='k-m-%d' % iteration,
-                dependencies = [job_ids['kmeans-e-step']],
+                'kmeans-local',
+                name = 'k-local',
+                dependencies = deps,
                 **self.m_grid.training_queue)
+      else:
+        # several iterations of E and M steps
+        for iteration in range(self.m_args.kmeans_start_iteration, self.m_args.kmeans_training_iterations):
+          # E-step
+          job_ids['kmeans-e-step'] = self.submit_grid_job(
+                  'kmeans-e-step --iteration %d' % iteration,
+                  name='k-e-%d' % iteration,
+                  list_to_split = self.training_list(),
+                  number_of_files_per_job = self.m_grid.number_of_projected_features_per_job,
+                  dependencies = [job_ids['kmeans-m-step']] if iteration != self.m_args.kmeans_start_iteration else deps,
+                  **self.m_grid.projection_queue)
+
+          # M-step
+          job_ids['kmeans-m-step'] = self.submit_grid_job(
+                  'kmeans-m-step --iteration %d' % iteration,
+                  name='k-m-%d' % iteration,
+                  dependencies = [job_ids['kmeans-e-step']],
+                  **self.m_grid.training_queue)
 
       # add dependence to the last m step
       deps.append(job_ids['kmeans-m-step'])
@@ -349,23 +357,31 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
                 **self.m_grid.training_queue)
         deps.append(job_ids['gmm-init'])
 
-      # several iterations of E and M steps
-      for iteration in range(self.m_args.gmm_start_iteration, self.m_args.gmm_training_iterations):
-        # E-step
-        job_ids['gmm-e-step'] = self.submit_grid_job(
-                'gmm-e-step --iteration %d' % iteration,
-                name='g-e-%d' % iteration,
-                list_to_split = self.training_list(),
-                number_of_files_per_job = self.m_grid.number_of_projected_features_per_job,
-                dependencies = [job_ids['gmm-m-step']] if iteration != self.m_args.gmm_start_iteration else deps,
-                **self.m_grid.projection_queue)
-
-        # M-step
+      if self.m_args.local_ubm_processes:
+        # all iterations in a single job using several local processes
         job_ids['gmm-m-step'] = self.submit_grid_job(
-                'gmm-m-step --iteration %d' % iteration,
-                name='g-m-%d' % iteration,
-                dependencies = [job_ids['gmm-e-step']],
+                'gmm-local',
+                name = 'g-local',
+                dependencies = deps,
                 **self.m_grid.training_queue)
+      else:
+        # several iterations of E and M steps
+        for iteration in range(self.m_args.gmm_start_iteration, self.m_args.gmm_training_iterations):
+          # E-step
+          job_ids['gmm-e-step'] = self.submit_grid_job(
+                  'gmm-e-step --iteration %d' % iteration,
+                  name='g-e-%d' % iteration,
+                  list_to_split = self.training_list(),
+                  number_of_files_per_job = self.m_grid.number_of_projected_features_per_job,
+                  dependencies = [job_ids['gmm-m-step']] if iteration != self.m_args.gmm_start_iteration else deps,
+                  **self.m_grid.projection_queue)
+
+          # M-step
+          job_ids['gmm-m-step'] = self.submit_grid_job(
+                  'gmm-m-step --iteration %d' % iteration,
+                  name='g-m-%d' % iteration,
+                  dependencies = [job_ids['gmm-e-step']],
+                  **self.m_grid.training_queue)
 
       # add dependence to the last m step
       deps.append(job_ids['gmm-m-step'])
@@ -477,6 +493,12 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
           counts = self.m_grid.number_of_projected_features_per_job,
           force = self.m_args.force)
 
+    # train the K-Means using local processes
+    elif self.m_args.sub_task == 'kmeans-local':
+      self.kmeans_local(
+          processes = self.m_args.local_ubm_processes,
+          force = self.m_args.force)
+
     elif self.m_args.sub_task == 'gmm-init':
       self.gmm_initialize(
           force = self.m_args.force)
@@ -493,6 +515,12 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
           counts = self.m_grid.number_of_projected_features_per_job,
           force = self.m_args.force)
 
+    # train the GMM using local processes
+    elif self.m_args.sub_task == 'gmm-local':
+      self.gmm_local(
+          processes = self.m_args.local_ubm_processes,
+          force = self.m_args.force)
+
     # project using the gmm ubm
     elif self.m_args.sub_task == 'gmm-project':
       self.gmm_project(
@@ -565,6 +593,8 @@ def parse_args(command_line_parameters):
       help = 'Normalize features before IVector training?')
   other_group.add_argument('-C', '--clean-intermediate', action='store_true',
       help = 'Clean up temporary files of older iterations?')
+  other_group.add_argument('--local-ubm-processes', metavar = 'N', type=int,
+      help = 'Run all iterations of the KMeans and the GMM training in a single grid job each, which computes the E-steps in N parallel processes on the executing machine')
 
   other_group.add_argument('-Q', '--ivector-training-iterations', type=int, default=25,
       help = 'Specify the number of training iterations for the IVector training')
@@ -587,12 +617,17 @@ def parse_args(command_line_parameters):
   #######################################################################################
   #################### sub-tasks being executed by this script ##########################
   parser.add_argument('--sub-task',
-      choices = ('preprocess', 'train-extractor', 'extract', 'normalize-features', 'kmeans-init', 'kmeans-e-step', 'kmeans-m-step', 'gmm-init', 'gmm-e-step', 'gmm-m-step', 'gmm-project',  'ivec-init', 'ivec-e-step', 'ivec-m-step', 'ivec-project'),
+      choices = ('preprocess', 'train-extractor', 'extract', 'normalize-features', 'kmeans-init', 'kmeans-e-step', 'kmeans-m-step', 'kmeans-local', 'gmm-init', 'gmm-e-step', 'gmm-m-step', 'gmm-local', 'gmm-project',  'ivec-init', 'ivec-e-step', 'ivec-m-step', 'ivec-project'),
       help = argparse.SUPPRESS) #'Executes a subtask (FOR INTERNAL USE ONLY!!!)'
   parser.add_argument('--iteration', type=int,
       help = argparse.SUPPRESS) #'The current iteration of KMeans or GMM training'
 
-  return parser.parse_args(command_line_parameters)
+  args = parser.parse_args(command_line_parameters)
+  # these options of the common tool chain are not supported by this script, which accesses the single files directly
+  for option in ('packed_storage', 'binary_scores', 'score_shards', 'parallel'):
+    if getattr(args, option):
+      parser.error("The --%s option is not supported by this script" % option.replace('_', '-'))
+  return args
 
 
 def face_verify(args, command_line_parameters, external_dependencies = [], external_fake_job_id = 0):
@@ -152,6 +152,21 @@ class FeatureExtractionTest(unittest.TestCase):
     feature = self.execute(extractor, data, 'lgbphs_sparse.hdf5')
     self.assertEqual(len(feature.shape), 2) # we use sparse histogram by default
 
+    # generate compact sparse histograms
+    extractor = facereclib.features.LGBPHS(
+        block_size = 10,
+        block_overlap = 0,
+        gabor_directions = 4,
+        gabor_scales = 2,
+        gabor_sigma = math.sqrt(2.) * math.pi,
+        sparse_histogram = True,
+        compact_sparse_histogram = True
+    )
+    compact = extractor(data)
+    self.assertEqual(compact.dtype, numpy.float32)
+    self.assertTrue((compact[0] == feature[0]).all())
+    self.assertTrue(numpy.allclose(compact[1], feature[1]))
+
     # generate new non-sparse extractor
     extractor = facereclib.features.LGBPHS(
         block_size = 10,
@@ -176,6 +191,20 @@ class FeatureExtractionTest(unittest.TestCase):
     self.assertTrue(len(with_phase.shape) == 1)
     self.assertEqual(no_phase.shape[0]*2, with_phase.shape[0])
 
+    # the split histograms contain the same values
+    for split in ('blocks', 'wavelets', 'both'):
+      extractor = facereclib.features.LGBPHS(
+          block_size = 10,
+          block_overlap = 0,
+          gabor_directions = 4,
+          gabor_scales = 2,
+          gabor_sigma = math.sqrt(2.) * math.pi,
+          split_histogram = split
+      )
+      feature = extractor(data)
+      self.assertEqual(feature.size, no_phase.size)
+      self.assertTrue(numpy.allclose(numpy.sort(feature.flatten()), numpy.sort(no_phase)))
+
 
   def test05_sift_key_points(self):
     # we need the preprocessor tool to actually read the data
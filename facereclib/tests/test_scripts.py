@@ -148,6 +148,171 @@ class ScriptTest (unittest.TestCase):
     self.__face_verify__(parameters, test_dir, 'test_c')
 
 
+  def test01d_faceverify_parallel_local(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+    # define dummy parameters
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'facereclib.features.Eigenface(subspace_dimension', '=', '100)',
+        '-t', 'facereclib.tools.Dummy()',
+        '--zt-norm',
+        '-b', 'test_d',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir,
+        '--parallel', '2',
+        '--parallel-chunk-size', '5'
+    ]
+
+    print ' '.join(parameters)
+
+    self.__face_verify__(parameters, test_dir, 'test_d')
+
+
+  def test01e_faceverify_packed_storage(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+    # define dummy parameters
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'facereclib.features.Eigenface(subspace_dimension', '=', '100)',
+        '-t', 'facereclib.tools.Dummy()',
+        '--zt-norm',
+        '-b', 'test_e',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir,
+        '--packed-storage',
+        '--parallel', '2'
+    ]
+
+    print ' '.join(parameters)
+
+    self.__face_verify__(parameters, test_dir, 'test_e')
+
+
+  def test01ea_packed_store(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+    def writer(data, file_name):
+      with open(file_name, 'w') as f:
+        f.write(data)
+    def reader(file_name):
+      with open(file_name) as f:
+        return f.read()
+
+    # write a file into the container that is sorted last
+    store = facereclib.toolchain.PackedStore(test_dir)
+    store.open('all')
+    store.write('old', os.path.join(test_dir, 'file.txt'), writer)
+    store.close()
+    # re-write the file into a container that is sorted first
+    store = facereclib.toolchain.PackedStore(test_dir)
+    store.open('0-50')
+    store.write('new', os.path.join(test_dir, 'file.txt'), writer)
+    store.close()
+
+    # the new version supersedes the old one
+    store = facereclib.toolchain.PackedStore(test_dir)
+    self.assertTrue(store.contains(os.path.join(test_dir, 'file.txt')))
+    self.assertEqual(store.read(os.path.join(test_dir, 'file.txt'), reader), 'new')
+    shutil.rmtree(test_dir)
+
+
+  def test01f_faceverify_preload_probes(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+    # define dummy parameters
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'facereclib.features.Eigenface(subspace_dimension', '=', '100)',
+        '-t', 'facereclib.tools.Dummy()',
+        '--zt-norm',
+        '-b', 'test_f',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir,
+        '--preload-probes'
+    ]
+
+    print ' '.join(parameters)
+
+    self.__face_verify__(parameters, test_dir, 'test_f')
+
+
+  def test01g_faceverify_scores_in_memory(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+    # define dummy parameters
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'facereclib.features.Eigenface(subspace_dimension', '=', '100)',
+        '-t', 'facereclib.tools.Dummy()',
+        '--zt-norm',
+        '-b', 'test_g',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir,
+        '--scores-in-memory'
+    ]
+
+    print ' '.join(parameters)
+
+    self.__face_verify__(parameters, test_dir, 'test_g')
+
+
+  def test01h_faceverify_binary_scores(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+    # define dummy parameters
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'facereclib.features.Eigenface(subspace_dimension', '=', '100)',
+        '-t', 'facereclib.tools.Dummy()',
+        '--zt-norm',
+        '-b', 'test_h',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir,
+        '--binary-scores'
+    ]
+
+    print ' '.join(parameters)
+
+    facereclib.script.faceverify.main([sys.argv[0]] + parameters)
+
+    # assert that the score files exist and are binary
+    score_files = (os.path.join(test_dir, 'test_h', 'scores', 'Default', 'nonorm', 'scores-dev'), os.path.join(test_dir, 'test_h', 'scores', 'Default', 'ztnorm', 'scores-dev'))
+    reference_files = (os.path.join(base_dir, 'scripts', 'scores-nonorm-dev'), os.path.join(base_dir, 'scripts', 'scores-ztnorm-dev'))
+
+    for i in (0,1):
+      self.assertTrue(facereclib.utils.scores.is_binary(score_files[i]))
+      # assert that the scores are identical to the text reference
+      a1, b1 = facereclib.utils.scores.split_four_column(score_files[i])
+      a2, b2 = facereclib.utils.scores.split_four_column(reference_files[i])
+      self.assertEqual(len(a1), len(a2))
+      self.assertEqual(len(b1), len(b2))
+      self.assertTrue((numpy.abs(numpy.sort(a1) - numpy.sort(a2)) < 1e-5).all())
+      self.assertTrue((numpy.abs(numpy.sort(b1) - numpy.sort(b2)) < 1e-5).all())
+
+    shutil.rmtree(test_dir)
+
+
+  def test01i_faceverify_score_shards(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+    # define dummy parameters
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'facereclib.features.Eigenface(subspace_dimension', '=', '100)',
+        '-t', 'facereclib.tools.Dummy()',
+        '--zt-norm',
+        '-b', 'test_i',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir,
+        '--score-shards'
+    ]
+
+    print ' '.join(parameters)
+
+    self.__face_verify__(parameters, test_dir, 'test_i')
+
+
   def test01m_faceverify_calibrate(self):
     test_dir = tempfile.mkdtemp(prefix='frltest_')
     # define dummy parameters
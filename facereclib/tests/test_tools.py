@@ -31,6 +31,30 @@ import pkg_resources
 regenerate_refs = False
 seed_value = 5489
 
+
+class _ParallelUBMGMM (facereclib.tools.ParallelUBMGMM):
+  """Parallel UBM training on the given list of feature files, writing into the given temporary directory."""
+
+  def __init__(self, tool, feature_files, temp_dir):
+    import argparse
+    self.m_tool = tool
+    self.m_tool.m_gmm_filename = os.path.join(temp_dir, 'gmm.hdf5')
+    self.m_extractor = facereclib.features.Extractor()
+    self.m_tool_chain = facereclib.toolchain.ToolChain(None)
+    self.m_args = argparse.Namespace(iteration = 0, limit_training_examples = None, clean_intermediate = False)
+    self.m_configuration = argparse.Namespace(
+        kmeans_file = os.path.join(temp_dir, 'k_means.hdf5'),
+        kmeans_intermediate_file = os.path.join(temp_dir, 'kmeans_temp', 'i_%05d', 'k_means.hdf5'),
+        kmeans_stats_file = os.path.join(temp_dir, 'kmeans_temp', 'i_%05d', 'stats_%05d-%05d.hdf5'),
+        gmm_intermediate_file = os.path.join(temp_dir, 'gmm_temp', 'i_%05d', 'gmm.hdf5'),
+        gmm_stats_file = os.path.join(temp_dir, 'gmm_temp', 'i_%05d', 'stats_%05d-%05d.hdf5')
+    )
+    self.m_feature_files = feature_files
+
+  def training_list(self):
+    return self.m_feature_files
+
+
 class ToolTest(unittest.TestCase):
 
   def input_dir(self, file):
@@ -86,6 +110,18 @@ class ToolTest(unittest.TestCase):
     self.assertAlmostEqual(sim, 1.)
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [feature, feature]), 1.)
 
+    # the vectorized similarities are identical to the ones of the jet similarity functions
+    probe = feature.copy()
+    probe[:,1,:] += numpy.linspace(0., 0.5, probe.shape[2])
+    for similarity_type in ('SCALAR_PRODUCT', 'CANBERRA', 'DISPARITY'):
+      tool = facereclib.tools.GaborJets(gabor_jet_similarity_type = getattr(bob.machine.gabor_jet_similarity_type, similarity_type), multiple_feature_scoring = 'average')
+      model = tool.enroll([feature, probe])
+      reference = [[tool.m_similarity_function(model[c,n], probe[n]) for n in range(model.shape[1])] for c in range(model.shape[0])]
+      self.assertTrue(numpy.allclose(tool.score(model, probe), numpy.average(reference)))
+      scores = tool.score_matrix([model, model], [probe, feature, probe])
+      self.assertEqual(scores.shape, (2,3))
+      self.assertTrue(numpy.allclose(scores[:,0], numpy.average(reference)))
+
 
   def test02_lgbphs(self):
     # read input
@@ -104,6 +140,17 @@ class ToolTest(unittest.TestCase):
     self.assertAlmostEqual(sim, 33600.0)
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [feature2, feature2]), sim)
 
+    # the vectorized scores are identical to the pair-wise scores
+    for distance_function, is_distance_function in ((bob.math.chi_square, True), (bob.math.histogram_intersection, False)):
+      tool = facereclib.tools.LGBPHS(distance_function = distance_function, is_distance_function = is_distance_function)
+      dense_model = tool.enroll([feature2])
+      for model in (tool.enroll([feature1]), tool.enroll([facereclib.utils.histogram.sparsify(feature2)])):
+        scores = tool.score_matrix([model, model], [feature2, facereclib.utils.histogram.sparsify(feature2)])
+        self.assertEqual(scores.shape, (2,2))
+        self.assertTrue(numpy.allclose(scores, tool.score(model, feature2)))
+      scores = tool.score_matrix([dense_model], [feature2, feature2])
+      self.assertTrue(numpy.allclose(scores, tool.score(dense_model, feature2)))
+
 
   def test03_pca(self):
     # read input
@@ -165,6 +212,14 @@ class ToolTest(unittest.TestCase):
     self.assertAlmostEqual(tool.score(model, projected), 0.)
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [projected, projected]), 0.)
 
+    # the score matrix must be identical to the single scores
+    probes = [projected, projected + 1.]
+    scores = tool.score_matrix([model, model[0]], probes)
+    self.assertEqual(scores.shape, (2,2))
+    for j in range(2):
+      self.assertAlmostEqual(scores[0,j], tool.score(model, probes[j]))
+      self.assertAlmostEqual(scores[1,j], tool.score(model[0], probes[j]))
+
 
   def test04_lda(self):
     # read input
@@ -219,6 +274,12 @@ class ToolTest(unittest.TestCase):
     # score
     sim = tool.score(model, projected)
     self.assertAlmostEqual(sim, 0.)
+    # score matrix using the scaled Euclidean distance
+    probes = [projected, projected + 1.]
+    scores = tool.score_matrix([model], probes)
+    self.assertEqual(scores.shape, (1,2))
+    self.assertAlmostEqual(scores[0,0], sim)
+    self.assertAlmostEqual(scores[0,1], tool.score(model, probes[1]))
 
     # test the calculation of the subspace dimension based on percentage of variance,
     # and the usage of a different way to compute the final score in case of multiple features per model
@@ -331,6 +392,16 @@ class ToolTest(unittest.TestCase):
     probe = tool.read_probe(self.reference_dir('gmm_feature.hdf5'))
     self.assertTrue(projected.is_similar_to(probe))
 
+    # project several features at once
+    projected_batch = tool.project_batch([feature, feature[:5]])
+    self.assertEqual(len(projected_batch), 2)
+    self.assertTrue(projected_batch[0].is_similar_to(probe))
+    self.assertTrue(projected_batch[1].is_similar_to(tool.project(feature[:5])))
+    # the frames of arrays with more dimensions are counted after flattening
+    projected_batch = tool.project_batch([feature[:4].reshape(2, 2, feature.shape[1]), feature[:5]])
+    self.assertTrue(projected_batch[0].is_similar_to(tool.project(feature[:4])))
+    self.assertTrue(projected_batch[1].is_similar_to(tool.project(feature[:5])))
+
     # enroll model with the unprojected feature
     model = tool.enroll([feature])
     if regenerate_refs:
@@ -343,6 +414,12 @@ class ToolTest(unittest.TestCase):
     self.assertAlmostEqual(sim, 0.25472347774)
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [probe, probe]), sim)
 
+    # score several models and probes at once
+    scores = tool.score_matrix([reference_model, model], [probe, projected_batch[1]])
+    self.assertEqual(scores.shape, (2,2))
+    self.assertAlmostEqual(scores[0,0], sim)
+    self.assertAlmostEqual(scores[1,1], tool.score(model, projected_batch[1]))
+
 
   def test06a_gmm_regular(self):
     # read input
@@ -379,6 +456,123 @@ class ToolTest(unittest.TestCase):
     self.assertAlmostEqual(sim, 0.143875716)
 
 
+  def test06c_gmm_out_of_core(self):
+    # read input
+    feature = bob.io.load(self.input_dir('dct_blocks.hdf5'))
+    # train the UBM reading only two training files at a time
+    tool = facereclib.tools.UBMGMM(
+        number_of_gaussians = 2,
+        k_means_training_iterations = 1,
+        gmm_training_iterations = 1,
+        training_chunk_size = 2,
+        INIT_SEED = seed_value,
+    )
+    self.assertTrue(tool.reads_training_features_on_demand)
+
+    t = tempfile.mkstemp('ubm.hdf5', prefix='frltest_')[1]
+    tool.train_projector(facereclib.utils.tests.random_training_set(feature.shape, count=5, minimum=-5., maximum=5.), t)
+    machine = bob.machine.GMMMachine(bob.io.HDF5File(t))
+    os.remove(t)
+    self.assertEqual(machine.means.shape, (2, feature.shape[1]))
+    self.assertAlmostEqual(numpy.sum(machine.weights), 1.)
+    self.assertTrue((machine.variances > 0).all())
+
+    # the trained UBM can be used as usual
+    tool.load_projector(self.reference_dir('gmm_projector.hdf5'))
+    self.assertTrue(tool.project(feature).is_similar_to(tool.read_probe(self.reference_dir('gmm_feature.hdf5'))))
+
+
+  def test06d_gmm_mini_batch(self):
+    # read input
+    feature = bob.io.load(self.input_dir('dct_blocks.hdf5'))
+    # train the UBM with the mini-batch K-Means
+    tool = facereclib.tools.UBMGMM(
+        number_of_gaussians = 2,
+        k_means_training_iterations = 10,
+        gmm_training_iterations = 1,
+        k_means_trainer = 'mini-batch',
+        k_means_mini_batch_size = 100,
+        INIT_SEED = seed_value,
+    )
+    t = tempfile.mkstemp('ubm.hdf5', prefix='frltest_')[1]
+    tool.train_projector(facereclib.utils.tests.random_training_set(feature.shape, count=5, minimum=-5., maximum=5.), t)
+    machine = bob.machine.GMMMachine(bob.io.HDF5File(t))
+    os.remove(t)
+    self.assertEqual(machine.means.shape, (2, feature.shape[1]))
+    self.assertAlmostEqual(numpy.sum(machine.weights), 1.)
+
+    # without iterations, the means of the k-means++ seeding are used
+    tool = facereclib.tools.UBMGMM(
+        number_of_gaussians = 2,
+        k_means_training_iterations = 0,
+        gmm_training_iterations = 1,
+        k_means_trainer = 'mini-batch',
+        INIT_SEED = seed_value,
+    )
+    t = tempfile.mkstemp('ubm.hdf5', prefix='frltest_')[1]
+    tool.train_projector(facereclib.utils.tests.random_training_set(feature.shape, count=5, minimum=-5., maximum=5.), t)
+    machine = bob.machine.GMMMachine(bob.io.HDF5File(t))
+    os.remove(t)
+    self.assertEqual(machine.means.shape, (2, feature.shape[1]))
+
+    # unknown K-Means trainers are not accepted
+    self.assertRaises(ValueError, facereclib.tools.UBMGMM, number_of_gaussians = 2, k_means_trainer = 'unknown')
+    # the mini-batch K-Means is not available for the out-of-core training
+    self.assertRaises(ValueError, facereclib.tools.UBMGMM, number_of_gaussians = 2, k_means_trainer = 'mini-batch', training_chunk_size = 2)
+
+
+  def test06e_gmm_parallel_local(self):
+    # write random training features
+    import shutil
+    feature = bob.io.load(self.input_dir('dct_blocks.hdf5'))
+    temp_dir = tempfile.mkdtemp(prefix='frltest_')
+    feature_files = []
+    for i, training_feature in enumerate(facereclib.utils.tests.random_training_set(feature.shape, count=5, minimum=-5., maximum=5.)):
+      feature_files.append(os.path.join(temp_dir, 'feature_%d.hdf5' % i))
+      bob.io.save(training_feature, feature_files[-1])
+    tool = facereclib.tools.UBMGMM(number_of_gaussians = 2, INIT_SEED = seed_value)
+    trainer = _ParallelUBMGMM(tool, feature_files, temp_dir)
+    configuration = trainer.m_configuration
+
+    try:
+      # one iteration of the file based K-Means and GMM training
+      trainer.kmeans_initialize()
+      trainer.kmeans_estep((0, len(feature_files)))
+      trainer.kmeans_mstep(len(feature_files))
+      trainer.gmm_initialize()
+      trainer.gmm_estep((0, len(feature_files)))
+      trainer.gmm_mstep(len(feature_files))
+
+      # the same iteration in two local processes, starting from the same initial machines
+      kmeans_machine = bob.machine.KMeansMachine(bob.io.HDF5File(configuration.kmeans_intermediate_file % 0))
+      gmm_machine = bob.machine.GMMMachine(bob.io.HDF5File(configuration.gmm_intermediate_file % 0))
+      pool, shards, data = trainer.__local_pool__(2)
+      try:
+        self.assertEqual(len(shards), 2)
+        trainer.__kmeans_iteration__(kmeans_machine, pool, shards, data)
+        trainer.__gmm_iteration__(gmm_machine, pool, shards, data)
+        pool.close()
+      except:
+        pool.terminate()
+        raise
+      finally:
+        pool.join()
+
+      # both give the same machines
+      reference = bob.machine.KMeansMachine(bob.io.HDF5File(configuration.kmeans_intermediate_file % 1))
+      self.assertTrue(numpy.allclose(kmeans_machine.means, reference.means))
+      reference = bob.machine.GMMMachine(bob.io.HDF5File(configuration.gmm_intermediate_file % 1))
+      self.assertTrue(numpy.allclose(gmm_machine.means, reference.means))
+      self.assertTrue(numpy.allclose(gmm_machine.variances, reference.variances))
+      self.assertTrue(numpy.allclose(gmm_machine.weights, reference.weights))
+
+      # the machines of an interrupted grid training do not count as a finished local training
+      self.assertTrue(os.path.exists(configuration.kmeans_file))
+      self.assertFalse(os.path.exists(trainer.__local_done_file__(configuration.kmeans_intermediate_file)))
+    finally:
+      shutil.rmtree(temp_dir)
+
+
   def notest06b_gmm_video(self):
     # assure that the config file is readable
     tool = self.config('ubm_gmm_video')
@@ -410,11 +604,20 @@ class ToolTest(unittest.TestCase):
 
     # train the projector
     t = tempfile.mkstemp('ubm.hdf5', prefix='frltest_')[1]
-    tool.train_projector(facereclib.utils.tests.random_training_set_by_id(feature.shape, count=5, minimum=-5., maximum=5.), t)
+    training_features = facereclib.utils.tests.random_training_set_by_id(feature.shape, count=5, minimum=-5., maximum=5.)
+    tool.train_projector(training_features, t)
     if regenerate_refs:
       import shutil
       shutil.copy2(t, self.reference_dir('isv_projector.hdf5'))
 
+    # the projected training features that are kept from the training are identical to the projection of the training features
+    projected_training_features = tool.projected_training_features()
+    self.assertEqual([len(client) for client in projected_training_features], [len(client) for client in training_features])
+    for training_feature, projected_training_feature in zip(training_features[0], projected_training_features[0]):
+      projected = tool.project(training_feature)
+      self.assertTrue(projected_training_feature[0].is_similar_to(projected[0]))
+      self.assertTrue(numpy.allclose(projected_training_feature[1], projected[1]))
+
     # load the projector file
     tool.load_projector(self.reference_dir('isv_projector.hdf5'))
 
@@ -458,6 +661,11 @@ class ToolTest(unittest.TestCase):
     sim = tool.score(model, probe)
     self.assertAlmostEqual(sim, 0.002739150199911455)
 
+    # score several probes at once
+    scores = tool.score_matrix([model], [probe, probe])
+    self.assertAlmostEqual(scores[0,0], sim)
+    self.assertAlmostEqual(scores[0,1], sim)
+
     # score with a concatenation of the probe
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [probe, probe]), sim, places=5)
 
@@ -491,6 +699,9 @@ class ToolTest(unittest.TestCase):
     self.assertTrue(tool.use_projected_features_for_enrollment)
     self.assertFalse(tool.split_training_features_by_client)
     self.assertTrue(tool.requires_enroller_training)
+    # the JFA scores are computed pair-wise, while the scores of the GMM base class are computed at once
+    self.assertFalse(tool.has_fast_score_matrix)
+    self.assertTrue(facereclib.tools.UBMGMM(number_of_gaussians = 2).has_fast_score_matrix)
 
     # train the projector
     t = tempfile.mkstemp('ubm.hdf5', prefix='frltest_')[1]
@@ -598,6 +809,12 @@ class ToolTest(unittest.TestCase):
     self.assertAlmostEqual(sim, 0.)
     # score with a concatenation of the probe
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [feature, feature]), 0.)
+    # the closed-form scores are identical to the scores of the PLDA machine
+    projected = numpy.ndarray(tool.m_pca_machine.shape[1], numpy.float64)
+    tool.m_pca_machine(feature, projected)
+    scores = tool.score_matrix([model], [feature, feature])
+    self.assertEqual(scores.shape, (1,2))
+    self.assertTrue(numpy.allclose(scores, model.forward(projected)))
 
 
   def test10_ivector(self):
@@ -625,11 +842,20 @@ class ToolTest(unittest.TestCase):
 
     # train the projector
     t = tempfile.mkstemp('ubm.hdf5', prefix='frltest_')[1]
-    tool.train_projector(facereclib.utils.tests.random_training_set(feature.shape, count=5, minimum=-5., maximum=5.), t)
+    training_features = facereclib.utils.tests.random_training_set(feature.shape, count=5, minimum=-5., maximum=5.)
+    tool.train_projector(training_features, t)
     if regenerate_refs:
       import shutil
       shutil.copy2(t, self.reference_dir('ivector_projector.hdf5'))
 
+    # the projected training features that are kept from the training are identical to the projection of the training features
+    projected_training_features = tool.projected_training_features()
+    self.assertEqual(len(projected_training_features), len(training_features))
+    for training_feature, projected_training_feature in zip(training_features, projected_training_features):
+      projected = tool.project(training_feature)
+      self.assertTrue(projected_training_feature[0].is_similar_to(projected[0]))
+      self.assertTrue(numpy.allclose(projected_training_feature[1], projected[1]))
+
     # load the projector file
     tool.load_projector(self.reference_dir('ivector_projector.hdf5'))
 
@@ -670,11 +896,40 @@ class ToolTest(unittest.TestCase):
     self.assertTrue(probe[0].is_similar_to(projected[0]))
     self.assertEqual(probe[1].any(), projected[1].any())
 
-    # score with projected feature and compare to the weird reference score ...
-    # This in not implemented yet
-
-    # score with a concatenation of the probe
-    # This is not implemented yet
+    # enroll a model and check that it is a normalized i-vector
+    model = tool.enroll([projected[0]])
+    self.assertAlmostEqual(numpy.linalg.norm(model), 1.)
+    # enrolling with the stored i-vectors gives the same model
+    self.assertTrue(numpy.allclose(tool.enroll([tool.read_enroll_feature(self.reference_dir('ivector_feature.hdf5'))]), model))
+    # the cosine score of the model with its own enrollment feature is 1
+    self.assertAlmostEqual(tool.score(model, probe), 1.)
+    self.assertAlmostEqual(tool.score_for_multiple_probes(model, [probe, probe]), 1.)
+    # the matrix of scores is identical to the pair-wise scores
+    scores = tool.score_matrix([model, model], [probe, probe, probe])
+    self.assertEqual(scores.shape, (2,3))
+    self.assertTrue(numpy.allclose(scores, tool.score(model, probe)))
+
+    # with whitening, the model of a probe's own i-vector still has a cosine score of 1 with this probe
+    tool = facereclib.tools.IVector(
+        number_of_gaussians = 2,
+        subspace_dimension_of_t=2,
+        update_sigma = False,
+        tv_training_iterations = 1,
+        variance_threshold = 1e-5,
+        use_whitening = True,
+        INIT_SEED = seed_value
+    )
+    t = tempfile.mkstemp('ubm.hdf5', prefix='frltest_')[1]
+    tool.train_projector(training_features, t)
+    tool.load_projector(t)
+    os.remove(t)
+    self.assertTrue(tool.m_whitening_matrix is not None)
+    probe = tool.project(feature)
+    model = tool.enroll([probe])
+    self.assertAlmostEqual(numpy.linalg.norm(model), 1.)
+    self.assertAlmostEqual(tool.score(model, probe), 1.)
+    self.assertAlmostEqual(tool.score_matrix([model], [probe])[0,0], 1.)
+    self.assertAlmostEqual(tool.score_for_multiple_probes(model, [probe, probe]), 1.)
 
 
 
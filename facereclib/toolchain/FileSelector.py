@@ -4,6 +4,7 @@
 
 import os
 from .. import utils
+from .PackedStore import PackedStore
 import bob
 
 class FileSelector:
@@ -21,7 +22,10 @@ class FileSelector:
         model_directories,
         score_directories,
         zt_score_directories = None,
-        default_extension = '.hdf5'
+        default_extension = '.hdf5',
+        packed_storage = False,
+        binary_scores = False,
+        sharded_scores = False
       ):
 
     """Initialize the file selector object with the current configuration."""
@@ -36,22 +40,39 @@ class FileSelector:
     self.score_directories = score_directories
     self.zt_score_directories = zt_score_directories
     self.default_extension = default_extension
+    self.packed_storage = packed_storage
+    self.binary_scores = binary_scores
+    self.score_extension = '.npz' if binary_scores else '.txt'
+    self.sharded_scores = sharded_scores
+    self.m_stores = {}
 
 
   def uses_probe_file_sets(self):
     """Returns true if the given protocol enables several probe files for scoring."""
     return self.m_database.uses_probe_file_sets()
 
-  def get_paths(self, files, directory_type = None, directory = None, extension = None):
-    """Returns the list of file names for the given list of File objects."""
+  def __directory__(self, directory_type):
+    """Returns the directory for the given directory type."""
     if directory_type == 'preprocessed':
-      directory = self.preprocessed_directory
+      return self.preprocessed_directory
     elif directory_type == 'features':
-      directory = self.features_directory
+      return self.features_directory
     elif directory_type == 'projected':
-      directory = self.projected_directory
-    elif directory_type is not None:
-      raise ValueError("The given directory type '%s' is not supported." % directory_type)
+      return self.projected_directory
+    raise ValueError("The given directory type '%s' is not supported." % directory_type)
+
+  def store(self, directory_type):
+    """Returns the PackedStore for the given directory type, or None if the files are stored one by one."""
+    if not self.packed_storage:
+      return None
+    if directory_type not in self.m_stores:
+      self.m_stores[directory_type] = PackedStore(self.__directory__(directory_type))
+    return self.m_stores[directory_type]
+
+  def get_paths(self, files, directory_type = None, directory = None, extension = None):
+    """Returns the list of file names for the given list of File objects."""
+    if directory_type is not None:
+      directory = self.__directory__(directory_type)
 
     if not directory:
       directory = ""
@@ -145,6 +166,22 @@ class FileSelector:
       return self.m_database.probe_files(model_id = model_id, group = group)
 
 
+  def probe_cache_file(self, group, directory_type, z_probes = False):
+    """Returns the file, in which the packed (Z-)probes of the given group are cached when the probes are preloaded."""
+    return os.path.join(self.__directory__(directory_type), "%s-%s-%s.npy" % ("z-probe-cache" if z_probes else "probe-cache", self.m_database.protocol, group))
+
+  def probe_cache_files(self, directory_type):
+    """Returns the list of all existing probe cache files in the directory of the given type."""
+    directory = self.__directory__(directory_type)
+    if not os.path.isdir(directory):
+      return []
+    return [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.npy') and (f.startswith('probe-cache-') or f.startswith('z-probe-cache-'))]
+
+  def model_cache_file(self, group, t_models = False):
+    """Returns the file, in which the packed (T-Norm-)models of the given group are cached when the models are preloaded."""
+    return os.path.join(self.model_directories[1 if t_models else 0], "%s-%s-%s.npy" % ("t-model-cache" if t_models else "model-cache", self.m_database.protocol, group))
+
+
   def t_model_ids(self, group):
     """Returns the sorted list of T-Norm-model ids from the given group."""
     return sorted(self.m_database.t_model_ids(group = group))
@@ -220,7 +257,7 @@ class FileSelector:
     """Returns the score text file for the given model id of the given group."""
     no_norm_dir = os.path.join(self.score_directories[0], group)
     utils.ensure_dir(no_norm_dir)
-    return os.path.join(no_norm_dir, str(model_id) + ".txt")
+    return os.path.join(no_norm_dir, str(model_id) + self.score_extension)
 
   def no_norm_result_file(self, group):
     """Returns the resulting score text file for the given group."""
@@ -229,11 +266,34 @@ class FileSelector:
     return os.path.join(no_norm_dir, "scores-" + group)
 
 
+  def no_norm_shard_file(self, group, model_range):
+    """Returns the score file, into which the scores of the given range of model indices of the given group are written, when score shards are enabled."""
+    return self.shard_file(self.no_norm_result_file(group), model_range)
+
+  def zt_norm_shard_file(self, group, model_range):
+    """Returns the ZT-normalized score file of the given range of model indices of the given group, when score shards are enabled."""
+    return self.shard_file(self.zt_norm_result_file(group), model_range)
+
+  def shard_file(self, result_file, model_range):
+    """Returns the score shard of the given result file for the given range of model indices."""
+    return "%s.shard-%d-%d" % ((result_file,) + tuple(model_range))
+
+  def shard_files(self, result_file):
+    """Returns the list of score shards for the given result file and the range of model indices of each shard, sorted by the first model index."""
+    directory, prefix = os.path.split(result_file + ".shard-")
+    shards = []
+    for file_name in os.listdir(directory):
+      if file_name.startswith(prefix) and not file_name.endswith('.tmp'):
+        start, end = file_name[len(prefix):].split('-')
+        shards.append((int(start), int(end), os.path.join(directory, file_name)))
+    return sorted(shards)
+
+
   def zt_norm_file(self, model_id, group):
     """Returns the score text file after ZT-normalization for the given model id of the given group."""
     zt_norm_dir = os.path.join(self.score_directories[1], group)
     utils.ensure_dir(zt_norm_dir)
-    return os.path.join(zt_norm_dir, str(model_id) + ".txt")
+    return os.path.join(zt_norm_dir, str(model_id) + self.score_extension)
 
   def zt_norm_result_file(self, group):
     """Returns the resulting score text file after ZT-normalization for the given group."""
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Manuel Guenther <Manuel.Guenther@idiap.ch>
+
+import os
+import time
+import atexit
+import shutil
+import tempfile
+from .. import utils
+
+class PackedStore:
+  """This class stores all files of one stage of the tool chain (e.g. all extracted features) in a few container files, instead of writing one file per sample.
+  Each container consists of a data file, to which the contents of the single files are appended, and an index file, which stores the offset, the length and the writing time of each file in the data file.
+  When a file is stored several times (possibly in different containers), the most recently written version is used.
+  Several processes (e.g. grid jobs) can write into the same directory, as long as they use containers with different names.
+  The single files are written and read with the usual writer and reader functions using one reusable scratch file per process and file extension,
+  which is located in memory (/dev/shm) when possible."""
+
+  def __init__(self, directory):
+    """Initializes the store that keeps its containers in the given directory."""
+    self.m_directory = directory
+    # the index of all stored files, which is read on need
+    self.m_index = None
+    # the files that are currently opened for reading (by the current process)
+    self.m_read_handles = {}
+    self.m_read_pid = None
+    # the container that is currently opened for writing
+    self.m_data_file = None
+    self.m_index_file = None
+    # the directory of the scratch files, which is shared by all processes forked from this one and removed at exit
+    self.m_scratch_directory = tempfile.mkdtemp(prefix = 'frl_', dir = '/dev/shm' if os.access('/dev/shm', os.W_OK) else None)
+    atexit.register(shutil.rmtree, self.m_scratch_directory, True)
+
+
+  def __key__(self, file_name):
+    """Returns the key of the given file, i.e., the path relative to the directory of this store."""
+    return os.path.relpath(str(file_name), self.m_directory)
+
+  def __load_index__(self):
+    """Reads the index files of all containers in the directory of this store.
+    For each file, the entry with the latest writing time is kept, regardless of the container it was written to."""
+    self.m_index = {}
+    times = {}
+    if os.path.isdir(self.m_directory):
+      for index_file in sorted([f for f in os.listdir(self.m_directory) if f.startswith('packed-') and f.endswith('.index')]):
+        data_file = os.path.join(self.m_directory, index_file[:-len('.index')] + '.data')
+        with open(os.path.join(self.m_directory, index_file), 'r') as f:
+          for line in f:
+            entry = line.rstrip('\n')
+            if '.' in entry.rsplit(' ', 1)[1]:
+              key, offset, length, write_time = entry.rsplit(' ', 3)
+              write_time = float(write_time)
+            else:
+              # entries without writing time are older than all entries with writing time
+              key, offset, length = entry.rsplit(' ', 2)
+              write_time = 0.
+            # later entries of the same container overwrite earlier ones
+            if key not in times or write_time >= times[key]:
+              self.m_index[key] = (data_file, int(offset), int(length))
+              times[key] = write_time
+
+
+  def open(self, name):
+    """Opens the container with the given name for appending files to it."""
+    self.close()
+    utils.ensure_dir(self.m_directory)
+    self.m_data_file = open(os.path.join(self.m_directory, "packed-%s.data" % name), 'ab')
+    self.m_index_file = open(os.path.join(self.m_directory, "packed-%s.index" % name), 'a')
+
+  def close(self):
+    """Closes the container that is currently opened for writing, if any."""
+    if self.m_data_file is not None:
+      self.m_data_file.close()
+      self.m_index_file.close()
+      self.m_data_file = None
+      self.m_index_file = None
+
+
+  def contains(self, file_name):
+    """Returns True if the given file is stored in one of the containers."""
+    if self.m_index is None:
+      self.__load_index__()
+    return self.__key__(file_name) in self.m_index
+
+
+  def scratch_file(self, file_name):
+    """Returns the scratch file of the current process with the same extension as the given file name.
+    The scratch file is overwritten by each read and write of a file with this extension."""
+    return os.path.join(self.m_scratch_directory, "%d%s" % (os.getpid(), os.path.splitext(str(file_name))[1]))
+
+  def pack(self, data, file_name, writer):
+    """Writes the given data using the given writer function (e.g. Extractor.save_feature) and returns the written contents, which can be added to the store."""
+    scratch_file = self.scratch_file(file_name)
+    writer(data, scratch_file)
+    with open(scratch_file, 'rb') as f:
+      return f.read()
+
+  def add(self, file_name, data):
+    """Appends the given packed contents under the given file name to the currently opened container."""
+    if self.m_data_file is None:
+      raise IOError("Please open a container before adding the file '%s' to the directory '%s'" % (file_name, self.m_directory))
+
+    # write the data first, so that the index only contains files that were completely written
+    self.m_data_file.seek(0, os.SEEK_END)
+    offset = self.m_data_file.tell()
+    self.m_data_file.write(data)
+    self.m_data_file.flush()
+    key = self.__key__(file_name)
+    self.m_index_file.write("%s %d %d %.6f\n" % (key, offset, len(data), time.time()))
+    self.m_index_file.flush()
+
+    if self.m_index is not None:
+      self.m_index[key] = (self.m_data_file.name, offset, len(data))
+
+  def write(self, data, file_name, writer):
+    """Writes the given data under the given file name, using the given writer function (e.g. Extractor.save_feature)."""
+    self.add(file_name, self.pack(data, file_name, writer))
+
+
+  def read(self, file_name, reader):
+    """Reads the data that is stored under the given file name, using the given reader function (e.g. Extractor.read_feature)."""
+    if self.m_index is None:
+      self.__load_index__()
+    key = self.__key__(file_name)
+    if key not in self.m_index:
+      raise IOError("The file '%s' cannot be found in the packed files of directory '%s'" % (key, self.m_directory))
+    data_file, offset, length = self.m_index[key]
+
+    # file handles must not be shared with forked processes, since they share the file position
+    if self.m_read_pid != os.getpid():
+      self.m_read_handles = {}
+      self.m_read_pid = os.getpid()
+    if data_file not in self.m_read_handles:
+      self.m_read_handles[data_file] = open(data_file, 'rb')
+    handle = self.m_read_handles[data_file]
+    handle.seek(offset)
+    data = handle.read(length)
+
+    scratch_file = self.scratch_file(file_name)
+    with open(scratch_file, 'wb') as f:
+      f.write(data)
+    return reader(scratch_file)
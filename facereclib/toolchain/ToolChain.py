@@ -3,16 +3,88 @@
 # Manuel Guenther <Manuel.Guenther@idiap.ch>
 
 import os
+import itertools
+import tempfile
 import numpy
 import bob
+import multiprocessing
 from .. import utils
 
+
+# The processing object (e.g., the preprocessor) that is owned by the current worker process.
+# Since the worker processes are forked, each of them works on its own copy of that object,
+# so that objects keeping internal buffers (like the FaceCrop preprocessor) do not interfere.
+_worker = None
+
+def _initialize_worker(worker):
+  """Registers the given processing object for the current worker process."""
+  global _worker
+  _worker = worker
+
+def _write_output(data, file_name, writer, store):
+  """Writes the given data to the given file using the given writer function.
+  When the output is stored in a PackedStore, the packed contents are returned instead, which are added to the store by the main process."""
+  if store is None:
+    utils.ensure_dir(os.path.dirname(file_name))
+    writer(data, file_name)
+    return None
+  return store.pack(data, file_name, writer)
+
+def _preprocess_worker(task):
+  """Preprocesses a single data file in the current worker process."""
+  data_file, annotations, preprocessed_data_file = task
+  preprocessor, output_store = _worker
+  data = preprocessor.read_original_data(data_file)
+  # call the preprocessor
+  preprocessed_data = preprocessor(data, annotations)
+  return (preprocessed_data_file, _write_output(preprocessed_data, preprocessed_data_file, preprocessor.save_data, output_store))
+
+def _extract_worker(task):
+  """Extracts the features of a single preprocessed file in the current worker process."""
+  data_file, feature_file = task
+  preprocessor, extractor, input_store, output_store = _worker
+  if input_store is None:
+    data = preprocessor.read_data(data_file)
+  else:
+    data = input_store.read(data_file, preprocessor.read_data)
+  # extract feature
+  feature = extractor(data)
+  return (feature_file, _write_output(feature, feature_file, extractor.save_feature, output_store))
+
+
+class _FeaturesOnDemand:
+  """A read-only list of features, which are read from file only when they are accessed.
+  Iterating over this list reads one feature at a time, so that not all features need to be kept in memory."""
+
+  def __init__(self, files, read):
+    self.m_files = files
+    self.m_read = read
+
+  def __len__(self):
+    return len(self.m_files)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self.m_read(f) for f in self.m_files[index]]
+    return self.m_read(self.m_files[index])
+
+  def __iter__(self):
+    for f in self.m_files:
+      yield self.m_read(f)
+
+
 class ToolChain:
   """This class includes functionalities for a default tool chain to produce verification scores"""
 
-  def __init__(self, file_selector):
-    """Initializes the tool chain object with the current file selector."""
+  def __init__(self, file_selector, probe_block_size = 1000, model_block_size = 100):
+    """Initializes the tool chain object with the current file selector.
+    When probes are not preloaded, the probe_block_size defines the number of probe files that are read and scored at once.
+    The model_block_size defines the number of models whose scores are computed with one call to the score_matrix function of the tool."""
     self.m_file_selector = file_selector
+    self.m_probe_block_size = probe_block_size
+    self.m_model_block_size = model_block_size
+    # the projected files that were written during the projector training of this process
+    self.m_projected_training_files = set()
 
 
 
@@ -30,9 +102,79 @@ class ToolChain:
     return False
 
 
-
-  def preprocess_data(self, preprocessor, indices=None, force=False):
-    """Preprocesses the original data with the given preprocessor."""
+  def __exists__(self, file_name, directory_type, force):
+    """Checks if the given file of the given directory type was already written, either as a single file or into the packed storage.
+    Packed files cannot be removed; when force is set, they are written again and the new version supersedes the old one."""
+    store = self.m_file_selector.store(directory_type)
+    if store is None:
+      return self.__check_file__(file_name, force)
+    return not force and store.contains(file_name)
+
+  def __read__(self, file_name, directory_type, reader):
+    """Reads the given file of the given directory type using the given reader function."""
+    store = self.m_file_selector.store(directory_type)
+    if store is None:
+      return reader(str(file_name))
+    return store.read(file_name, reader)
+
+  def __write__(self, data, file_name, directory_type, writer):
+    """Writes the given data to the given file of the given directory type using the given writer function."""
+    store = self.m_file_selector.store(directory_type)
+    if store is None:
+      utils.ensure_dir(os.path.dirname(file_name))
+      writer(data, str(file_name))
+    else:
+      store.write(data, file_name, writer)
+
+  def __remove_probe_caches__(self, directory_type):
+    """Removes the cached probe matrices of the given directory type, since they are outdated as soon as files are re-written."""
+    for cache_file in self.m_file_selector.probe_cache_files(directory_type):
+      utils.debug("  .. Removing outdated probe cache '%s'." % cache_file)
+      os.remove(cache_file)
+
+  def __remove_model_cache__(self, group, t_models = False):
+    """Removes the cached model matrix of the given group, since it is outdated as soon as models are re-enrolled."""
+    cache_file = self.m_file_selector.model_cache_file(group, t_models)
+    if os.path.exists(cache_file):
+      utils.debug("  .. Removing outdated model cache '%s'." % cache_file)
+      os.remove(cache_file)
+
+  def __open_store__(self, directory_type, indices):
+    """Opens the container of the packed storage of the given directory type, into which the current job writes its files.
+    Returns None, if packed storage is disabled."""
+    store = self.m_file_selector.store(directory_type)
+    if store is not None:
+      store.open('all' if indices is None else '%d-%d' % tuple(indices))
+    return store
+
+
+  def __process_parallel__(self, function, worker, tasks, parallel, stage, chunk_size = 1, finish = None):
+    """Executes the given function for all tasks in a pool of parallel processes.
+    Each process gets its own copy of the given worker object, and the tasks are sent to the processes in chunks of the given size.
+    The function needs to return the name of the output file and the packed contents of the file (if any), which are handed to the finish function (if given).
+    The results are collected in the order of the tasks, so that the progress can be reported consistently."""
+    utils.info("- %s: processing %d files using %d parallel processes" % (stage, len(tasks), parallel))
+    report_step = max(len(tasks) / 10, 1)
+    pool = multiprocessing.Pool(parallel, _initialize_worker, (worker,))
+    try:
+      for i, result in enumerate(pool.imap(function, tasks, chunk_size)):
+        if finish is not None:
+          finish(*result)
+        utils.debug("  .. Wrote file '%s'" % result[0])
+        if (i+1) % report_step == 0 or i+1 == len(tasks):
+          utils.info("  .. %s: finished %d of %d files" % (stage, i+1, len(tasks)))
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
+
+
+  def preprocess_data(self, preprocessor, indices=None, force=False, parallel=None, chunk_size=1):
+    """Preprocesses the original data with the given preprocessor.
+    If parallel is set to a number greater than 1, the files are preprocessed in the given number of local processes."""
     # get the file lists
     data_files = self.m_file_selector.original_data_list()
     preprocessed_data_files = self.m_file_selector.preprocessed_data_list()
@@ -49,27 +191,37 @@ class ToolChain:
 
     # read annotation files
     annotation_list = self.m_file_selector.annotation_list()
+    store = self.__open_store__('preprocessed', indices)
+
+    if parallel is not None and parallel > 1:
+      # collect the files that still need to be preprocessed, including their annotations
+      tasks = [(str(data_files[i]), self.m_file_selector.get_annotations(annotation_list[i]), str(preprocessed_data_files[i])) for i in index_range if not self.__exists__(preprocessed_data_files[i], 'preprocessed', force)]
+      if tasks:
+        self.__process_parallel__(_preprocess_worker, (preprocessor, store), tasks, parallel, "Preprocessing", chunk_size, store.add if store is not None else None)
 
-    for i in index_range:
-      preprocessed_data_file = preprocessed_data_files[i]
+    else:
+      for i in index_range:
+        preprocessed_data_file = preprocessed_data_files[i]
+
+        if not self.__exists__(preprocessed_data_file, 'preprocessed', force):
+          data = preprocessor.read_original_data(str(data_files[i]))
 
-      if not self.__check_file__(preprocessed_data_file, force):
-        data = preprocessor.read_original_data(str(data_files[i]))
+          # get the annotations; might be None
+          annotations = self.m_file_selector.get_annotations(annotation_list[i])
 
-        # get the annotations; might be None
-        annotations = self.m_file_selector.get_annotations(annotation_list[i])
+          # call the preprocessor
+          preprocessed_data = preprocessor(data, annotations)
 
-        # call the preprocessor
-        preprocessed_data = preprocessor(data, annotations)
+          self.__write__(preprocessed_data, preprocessed_data_file, 'preprocessed', preprocessor.save_data)
 
-        utils.ensure_dir(os.path.dirname(preprocessed_data_file))
-        preprocessor.save_data(preprocessed_data, str(preprocessed_data_file))
+    if store is not None:
+      store.close()
 
 
 
   def __read_data__(self, files, preprocessor):
     """Reads the preprocessed data from file using the given reader."""
-    return [preprocessor.read_data(str(f)) for f in files]
+    return [self.__read__(f, 'preprocessed', preprocessor.read_data) for f in files]
 
   def __read_data_by_client__(self, files, preprocessor):
     """Reads the preprocessed data from file using the given reader.
@@ -77,7 +229,7 @@ class ToolChain:
     retval = []
     for client_files in files:
       # data for the client
-      retval.append([preprocessor.read_data(str(f)) for f in client_files])
+      retval.append([self.__read__(f, 'preprocessed', preprocessor.read_data) for f in client_files])
     return retval
 
   def train_extractor(self, extractor, preprocessor, force = False):
@@ -102,8 +254,10 @@ class ToolChain:
 
 
 
-  def extract_features(self, extractor, preprocessor, indices = None, force=False):
-    """Extracts the features from the preprocessed data using the given extractor."""
+  def extract_features(self, extractor, preprocessor, indices = None, force=False, parallel=None, chunk_size=1):
+    """Extracts the features from the preprocessed data using the given extractor.
+    If parallel is set to a number greater than 1, the features are extracted in the given number of local processes,
+    where each process uses its own copy of the extractor."""
     extractor.load(str(self.m_file_selector.extractor_file))
     data_files = self.m_file_selector.preprocessed_data_list()
     feature_files = self.m_file_selector.feature_list()
@@ -117,32 +271,50 @@ class ToolChain:
 
     utils.ensure_dir(self.m_file_selector.features_directory)
     utils.info("- Extraction: extracting %d features from directory '%s' to directory '%s'" % (len(index_range), self.m_file_selector.preprocessed_directory, self.m_file_selector.features_directory))
-    for i in index_range:
-      data_file = data_files[i]
-      feature_file = feature_files[i]
 
-      if not self.__check_file__(feature_file, force):
+    store = self.__open_store__('features', indices)
+
+    if parallel is not None and parallel > 1:
+      # collect the features that still need to be extracted
+      tasks = [(str(data_files[i]), str(feature_files[i])) for i in index_range if not self.__exists__(feature_files[i], 'features', force)]
+      if tasks:
+        self.__remove_probe_caches__('features')
+        self.__process_parallel__(_extract_worker, (preprocessor, extractor, self.m_file_selector.store('preprocessed'), store), tasks, parallel, "Extraction", chunk_size, store.add if store is not None else None)
+
+    else:
+      # collect the features that still need to be extracted
+      pending = [i for i in index_range if not self.__exists__(feature_files[i], 'features', force)]
+      if pending:
+        self.__remove_probe_caches__('features')
+
+      for i in pending:
         # load data
-        data = preprocessor.read_data(str(data_file))
+        data = self.__read__(data_files[i], 'preprocessed', preprocessor.read_data)
         # extract feature
         feature = extractor(data)
         # Save feature
-        utils.ensure_dir(os.path.dirname(feature_file))
-        extractor.save_feature(feature, str(feature_file))
+        self.__write__(feature, feature_files[i], 'features', extractor.save_feature)
+
+    if store is not None:
+      store.close()
 
 
 
-  def __read_features__(self, files, reader):
-    """Reads all features from file using the given reader."""
-    return [reader.read_feature(str(file)) for file in files]
+  def __read_features__(self, files, reader, directory_type = 'features', on_demand = False):
+    """Reads all features from file using the given reader.
+    If on_demand is enabled, the features are read only when they are accessed."""
+    read = lambda file: self.__read__(file, directory_type, reader.read_feature)
+    if on_demand:
+      return _FeaturesOnDemand(files, read)
+    return [read(file) for file in files]
 
-  def __read_features_by_client__(self, files, reader):
+  def __read_features_by_client__(self, files, reader, directory_type = 'features', on_demand = False):
     """Reads all features from file using the given reader.
     In this case, the features are split up by the according client."""
     retval = []
     for client_files in files:
       # features for the client
-      retval.append([reader.read_feature(str(feature)) for feature in client_files])
+      retval.append(self.__read_features__(client_files, reader, directory_type, on_demand))
     return retval
 
   def train_projector(self, tool, extractor, force=False):
@@ -157,20 +329,49 @@ class ToolChain:
         # train projector
         if tool.split_training_features_by_client:
           train_files = self.m_file_selector.training_list('features', 'train_projector', arrange_by_client = True)
-          train_features = self.__read_features_by_client__(train_files, extractor)
+          train_features = self.__read_features_by_client__(train_files, extractor, on_demand = tool.reads_training_features_on_demand)
           utils.info("- Projection: training projector '%s' using %d identities: " %(projector_file, len(train_files)))
         else:
           train_files = self.m_file_selector.training_list('features', 'train_projector')
-          train_features = self.__read_features__(train_files, extractor)
+          train_features = self.__read_features__(train_files, extractor, on_demand = tool.reads_training_features_on_demand)
           utils.info("- Projection: training projector '%s' using %d training files: " %(projector_file, len(train_files)))
 
         # perform training
         tool.train_projector(train_features, str(projector_file))
 
+        # store the training features that the tool projected during training
+        if hasattr(tool, 'projected_training_features'):
+          self.__write_projected_training_features__(tool)
+
+
+
+  def __write_projected_training_features__(self, tool):
+    """Writes the projected training features that the given tool computed during the projector training, so that they need not be projected again.
+    Since the projector was trained anew, existing projected files are overwritten."""
+    projected = tool.projected_training_features()
+    if projected is None:
+      return
+    projected_files = self.m_file_selector.training_list('projected', 'train_projector', arrange_by_client = tool.split_training_features_by_client)
+    if tool.split_training_features_by_client:
+      projected = [feature for client in projected for feature in client]
+      projected_files = [projected_file for client in projected_files for projected_file in client]
+    if len(projected) != len(projected_files):
+      raise ValueError("The tool returned %d projected training features, but %d training files were used for the projector training" % (len(projected), len(projected_files)))
 
+    utils.info("- Projection: writing %d projected training features to directory '%s'" % (len(projected_files), self.m_file_selector.projected_directory))
+    self.__remove_probe_caches__('projected')
+    store = self.__open_store__('projected', None)
+    for projected_feature, projected_file in zip(projected, projected_files):
+      self.__write__(projected_feature, projected_file, 'projected', tool.save_feature)
+      self.m_projected_training_files.add(str(projected_file))
+    if store is not None:
+      store.close()
 
-  def project_features(self, tool, extractor, indices = None, force=False):
-    """Projects the features for all files of the database."""
+
+
+  def project_features(self, tool, extractor, indices = None, force=False, batch_size=100):
+    """Projects the features for all files of the database.
+    If the tool provides a project_batch function, the features are projected in batches of the given size."""
     # load the projector file
     if tool.performs_projection:
       tool.load_projector(str(self.m_file_selector.projector_file))
@@ -187,19 +388,30 @@ class ToolChain:
 
       utils.ensure_dir(self.m_file_selector.projected_directory)
       utils.info("- Projection: projecting %d features from directory '%s' to directory '%s'" % (len(index_range), self.m_file_selector.features_directory, self.m_file_selector.projected_directory))
-      # extract the features
-      for i in index_range:
-        feature_file = feature_files[i]
-        projected_file = projected_files[i]
-
-        if not self.__check_file__(projected_file, force):
+      store = self.__open_store__('projected', indices)
+      # collect the files that need to be projected; training files projected by this process during the projector training are skipped
+      pending = [i for i in index_range if str(projected_files[i]) not in self.m_projected_training_files and not self.__exists__(projected_files[i], 'projected', force)]
+      if pending:
+        self.__remove_probe_caches__('projected')
+
+      if hasattr(tool, 'project_batch'):
+        # project several features at once
+        for start in range(0, len(pending), batch_size):
+          batch = pending[start : start + batch_size]
+          features = [self.__read__(feature_files[i], 'features', extractor.read_feature) for i in batch]
+          for i, projected in zip(batch, tool.project_batch(features)):
+            self.__write__(projected, projected_files[i], 'projected', tool.save_feature)
+      else:
+        for i in pending:
           # load feature
-          feature = extractor.read_feature(str(feature_file))
+          feature = self.__read__(feature_files[i], 'features', extractor.read_feature)
           # project feature
           projected = tool.project(feature)
           # write it
-          utils.ensure_dir(os.path.dirname(projected_file))
-          tool.save_feature(projected, str(projected_file))
+          self.__write__(projected, projected_files[i], 'projected', tool.save_feature)
+
+      if store is not None:
+        store.close()
 
 
 
@@ -216,8 +428,9 @@ class ToolChain:
         # first, load the projector
         tool.load_projector(str(self.m_file_selector.projector_file))
         # training models
-        train_files = self.m_file_selector.training_list('projected' if tool.use_projected_features_for_enrollment else 'features', 'train_enroller', arrange_by_client = True)
-        train_features = self.__read_features_by_client__(train_files, reader)
+        directory_type = 'projected' if tool.use_projected_features_for_enrollment else 'features'
+        train_files = self.m_file_selector.training_list(directory_type, 'train_enroller', arrange_by_client = True)
+        train_features = self.__read_features_by_client__(train_files, reader, directory_type)
 
         # perform training
         utils.info("- Enrollment: training enroller '%s' using %d identities: " %(enroller_file, len(train_features)))
@@ -237,6 +450,9 @@ class ToolChain:
 
     # which tool to use to read the features...
     reader = tool if tool.use_projected_features_for_enrollment else extractor
+    directory_type = 'projected' if tool.use_projected_features_for_enrollment else 'features'
+    # some tools read their enrollment features differently, e.g., including data that was stored during projection
+    read_enroll_feature = getattr(reader, 'read_enroll_feature', reader.read_feature)
 
     # Create Models
     if 'N' in types:
@@ -254,15 +470,16 @@ class ToolChain:
 
           # Removes old file if required
           if not self.__check_file__(model_file, force):
-            enroll_files = self.m_file_selector.enroll_files(model_id, group, 'projected' if tool.use_projected_features_for_enrollment else 'features')
+            enroll_files = self.m_file_selector.enroll_files(model_id, group, directory_type)
 
             # load all files into memory
-            enroll_features = [reader.read_feature(str(enroll_file)) for enroll_file in enroll_files]
+            enroll_features = [self.__read__(enroll_file, directory_type, read_enroll_feature) for enroll_file in enroll_files]
 
             model = tool.enroll(enroll_features)
             # save the model
             utils.ensure_dir(os.path.dirname(model_file))
             tool.save_model(model, str(model_file))
+            self.__remove_model_cache__(group)
 
     # T-Norm-Models
     if 'T' in types and compute_zt_norm:
@@ -280,119 +497,278 @@ class ToolChain:
 
           # Removes old file if required
           if not self.__check_file__(t_model_file, force):
-            t_enroll_files = self.m_file_selector.t_enroll_files(t_model_id, group, 'projected' if tool.use_projected_features_for_enrollment else 'features')
+            t_enroll_files = self.m_file_selector.t_enroll_files(t_model_id, group, directory_type)
 
             # load all files into memory
-            t_enroll_features = [reader.read_feature(str(t_enroll_file)) for t_enroll_file in t_enroll_files]
+            t_enroll_features = [self.__read__(t_enroll_file, directory_type, read_enroll_feature) for t_enroll_file in t_enroll_files]
 
             t_model = tool.enroll(t_enroll_features)
             # save model
             utils.ensure_dir(os.path.dirname(t_model_file))
             tool.save_model(t_model, str(t_model_file))
+            self.__remove_model_cache__(group, t_models = True)
+
 
 
+  def __read_probe__(self, probe_file):
+    """Reads the given probe file from the projected or the features directory."""
+    return self.__read__(probe_file, 'projected' if self.m_use_projected_dir else 'features', self.m_tool.read_probe)
 
-  def __scores__(self, model, probe_files):
-    """Compute simple scores for the given model."""
-    scores = numpy.ndarray((1,len(probe_files)), 'float64')
+  def __preload_probes__(self, probe_files, group, z_probes = False):
+    """Reads all given probe files into memory.
+    If all probes are arrays of the same shape and type, they are packed into a single matrix, which is cached on disk.
+    Later calls (e.g. of other scoring jobs) memory-map this matrix, so that jobs on the same machine share the probes via the page cache."""
+    if self.m_file_selector.uses_probe_file_sets():
+      return [[self.__read_probe__(probe_file) for probe_file in file_set] for file_set in probe_files]
+
+    cache_file = self.m_file_selector.probe_cache_file(group, 'projected' if self.m_use_projected_dir else 'features', z_probes)
+    probes = self.__load_cache__(cache_file, len(probe_files), 'probe')
+    if probes is not None:
+      return probes
+
+    probes = [self.__read_probe__(probe_file) for probe_file in probe_files]
+    return self.__write_cache__(probes, cache_file, 'probe')
+
+  def __load_cache__(self, cache_file, count, name):
+    """Memory-maps the packed matrix from the given cache file, if it exists and contains the given number of items; otherwise, None is returned."""
+    if os.path.exists(cache_file):
+      # copy-on-write mode, so that the items are writable without modifying the cache
+      items = numpy.load(cache_file, mmap_mode = 'c')
+      if len(items) == count:
+        utils.debug("  .. Using cached %ss from '%s'" % (name, cache_file))
+        return items
+      utils.warn("The %s cache '%s' does not match the %s files; recreating it" % (name, cache_file, name))
+    return None
+
+  def __write_cache__(self, items, cache_file, name):
+    """Packs the given items into a single matrix, which is written to the given cache file and memory-mapped.
+    If the items are not arrays of the same shape and type, they cannot be packed and are returned unchanged."""
+    if not items or not all(isinstance(item, numpy.ndarray) and item.shape == items[0].shape and item.dtype == items[0].dtype for item in items):
+      # the items cannot be packed into one matrix
+      return items
+
+    # write the matrix to a temporary file first, so that concurrent jobs will never read an incomplete cache
+    handle, temporary_file = tempfile.mkstemp(suffix = '.npy', dir = os.path.dirname(cache_file))
+    os.close(handle)
+    cache = numpy.lib.format.open_memmap(temporary_file, mode = 'w+', dtype = items[0].dtype, shape = (len(items),) + items[0].shape)
+    for i, item in enumerate(items):
+      cache[i] = item
+    cache.flush()
+    del cache
+    os.rename(temporary_file, cache_file)
+    utils.debug("  .. Wrote %s cache '%s'" % (name, cache_file))
+    return numpy.load(cache_file, mmap_mode = 'c')
+
+  def __preload_models__(self, group, scored_model_ids, t_models = False, check_count = 10):
+    """Reads all (T-Norm-)models of the given group into one packed matrix, which is cached on disk like the probes.
+    Later calls memory-map this matrix, so that scoring jobs neither need to read each model file separately, nor to keep their own copy of the gallery.
+    The cache is only built when the given scored models are all models of the group; jobs that score only some of the models use an existing cache.
+    Returns a dictionary from model id to the model, or None if the models are not arrays of the same shape and type."""
+    model_ids = self.m_file_selector.t_model_ids(group) if t_models else self.m_file_selector.model_ids(group)
+    model_file = self.m_file_selector.t_model_file if t_models else self.m_file_selector.model_file
+    cache_file = self.m_file_selector.model_cache_file(group, t_models)
+    models = self.__load_cache__(cache_file, len(model_ids), 'model')
+    if models is None:
+      if not model_ids or len(scored_model_ids) < len(model_ids):
+        # do not read the models of other jobs
+        return None
+      # check the first few models, so that not all models are read when they cannot be packed anyways
+      models = [self.m_tool.read_model(model_file(model_id, group)) for model_id in model_ids[:check_count]]
+      if not all(isinstance(model, numpy.ndarray) and model.shape == models[0].shape and model.dtype == models[0].dtype for model in models):
+        return None
+      models = self.__write_cache__(models + [self.m_tool.read_model(model_file(model_id, group)) for model_id in model_ids[check_count:]], cache_file, 'model')
+      if not isinstance(models, numpy.ndarray):
+        return None
+    return dict(zip(model_ids, models))
+
+  def __read_model__(self, model_id, group, preloaded_models, t_models = False):
+    """Returns the given (T-Norm-)model, either from the preloaded models or read from file."""
+    if preloaded_models is not None:
+      return preloaded_models[model_id]
+    return self.m_tool.read_model((self.m_file_selector.t_model_file if t_models else self.m_file_selector.model_file)(model_id, group))
+
+  def __scores__(self, models, probe_files):
+    """Computes the scores of the given models with the given probe files, where each probe file is read only once for all models."""
+    scores = numpy.ndarray((len(models),len(probe_files)), 'float64')
     if self.m_file_selector.uses_probe_file_sets():
       assert isinstance(probe_files[0], list)
       # Loops over the probe sets
       for i in range(len(probe_files)):
         # read probes from probe sets
-        probes = [self.m_tool.read_probe(str(probe_file)) for probe_file in probe_files[i]]
+        probes = [self.__read_probe__(probe_file) for probe_file in probe_files[i]]
         # compute score
-        scores[0,i] = self.m_tool.score_for_multiple_probes(model, probes)
+        for m, model in enumerate(models):
+          scores[m,i] = self.m_tool.score_for_multiple_probes(model, probes)
     else:
-      # Loops over the probes
-      for i in range(len(probe_files)):
-        # read probe
-        probe = self.m_tool.read_probe(str(probe_files[i]))
-        # compute score
-        scores[0,i] = self.m_tool.score(model, probe)
+      # Loops over blocks of probes, so that not all probes need to be kept in memory
+      for start in range(0, len(probe_files), self.m_probe_block_size):
+        end = min(start + self.m_probe_block_size, len(probe_files))
+        # read probes
+        probes = [self.__read_probe__(probe_file) for probe_file in probe_files[start:end]]
+        # compute scores for all models and all probes of the block
+        scores[:,start:end] = self.m_tool.score_matrix(models, probes)
     # Returns the scores
     return scores
 
-  def __scores_preloaded__(self, model, preloaded_probes):
-    """Compute simple scores for the given model."""
-    scores = numpy.ndarray((1,len(preloaded_probes)), 'float64')
-
-    # Loops over the probes
-    for i in range(len(preloaded_probes)):
-      # take pre-loaded probe
-      probe = preloaded_probes[i]
-      # compute score
-      scores[0,i] = self.m_tool.score(model, probe)
+  def __score_matrix__(self, models, preloaded_probes):
+    """Computes the scores between all given models and all pre-loaded probes (or probe file sets)."""
+    if self.m_file_selector.uses_probe_file_sets():
+      scores = numpy.ndarray((len(models), len(preloaded_probes)), 'float64')
+      for i in range(len(models)):
+        for j in range(len(preloaded_probes)):
+          scores[i,j] = self.m_tool.score_for_multiple_probes(models[i], preloaded_probes[j])
+      return scores
+    if not len(preloaded_probes):
+      return numpy.ndarray((len(models),0), 'float64')
+    # compute the scores for all pre-loaded probes at once; the rows of the scores are written separately
+    return numpy.ascontiguousarray(self.m_tool.score_matrix(models, preloaded_probes))
+
+  def __model_blocks__(self, model_ids, score_file, force):
+    """Returns the given model ids, whose score files (given by the score_file function) do not exist yet, in blocks of at most m_model_block_size models."""
+    pending = []
+    for model_id in model_ids:
+      if self.__check_file__(score_file(model_id), force):
+        utils.warn("score file '%s' already exists." % (score_file(model_id)))
+      else:
+        pending.append(model_id)
+    return [pending[start : start + self.m_model_block_size] for start in range(0, len(pending), self.m_model_block_size)]
+
+  def __score_rows__(self, models, probes, probe_indices = None):
+    """Computes the scores of the given models with the given probes, or with the probes of the given indices for each model, in as few calls to the tool as possible.
+    Returns the list of score rows, each as a 2D array with one row."""
+    if probe_indices is None:
+      # all models are compared with all probes
+      scores = self.__score_matrix__(models, probes)
+      return [scores[i:i+1] for i in range(len(models))]
+
+    if not self.m_tool.has_fast_score_matrix or self.m_file_selector.uses_probe_file_sets():
+      # compute only the required scores for each model
+      return [self.__score_matrix__([model], self.__probe_split__(indices, probes)) for model, indices in zip(models, probe_indices)]
+
+    # compute the scores of all models with all probes that are required by any of the models
+    union = numpy.unique(numpy.concatenate(probe_indices))
+    if len(union) == len(probes):
+      # pass the probes themselves, so that tools can reuse data computed for them
+      scores = self.__score_matrix__(models, probes)
+      columns = probe_indices
+    else:
+      scores = self.__score_matrix__(models, self.__probe_split__(union, probes))
+      columns = [numpy.searchsorted(union, indices) for indices in probe_indices]
+    return [scores[i:i+1, columns[i]] for i in range(len(models))]
 
-    # Returns the scores
-    return scores
 
+  def __probe_index__(self, all_probe_objects):
+    """Returns a dictionary that maps the id of each of the given probe objects to its index (i.e., the column of the score matrices)."""
+    return dict((probe_object.id, index) for index, probe_object in enumerate(all_probe_objects))
 
-  def __probe_split__(self, selected_probe_objects, all_probe_objects, all_preloaded_probes):
-    """Helper function required when probe files are preloaded."""
-    res = []
-    selected_index = 0
-    for all_index in range(len(all_probe_objects)):
-      if selected_index < len(selected_probe_objects) and selected_probe_objects[selected_index].id == all_probe_objects[all_index].id:
-        res.append(all_preloaded_probes[all_index])
-        selected_index += 1
-    assert selected_index == len(selected_probe_objects)
-    assert len(selected_probe_objects) == len(res)
+  def __probe_indices__(self, selected_probe_objects, probe_index):
+    """Returns the indices of the selected probe objects as a numpy array, using the given dictionary from probe id to index."""
+    return numpy.array([probe_index[probe_object.id] for probe_object in selected_probe_objects], dtype = numpy.int64)
 
-    # return the split database
-    return res
+  def __probe_split__(self, probe_indices, all_preloaded_probes):
+    """Helper function required when probe files are preloaded; selects the probes with the given indices."""
+    if isinstance(all_preloaded_probes, numpy.ndarray):
+      # packed probes
+      return all_preloaded_probes[probe_indices]
+    return [all_preloaded_probes[index] for index in probe_indices]
 
-  def __save_scores__(self, score_file, scores, probe_objects, client_id):
-    """Saves the scores into a text file."""
+  def __save_scores__(self, score_file, scores, probe_objects, client_id, writer = None):
+    """Saves the scores into a text file, or into a binary file if binary scores are enabled.
+    If a score writer is given (e.g. of a score shard), the scores are appended to it instead."""
     assert len(probe_objects) == scores.shape[1]
-    with open(score_file, 'w') as f:
-      for i in range(len(probe_objects)):
-        probe_object = probe_objects[i]
-        f.write(str(client_id) + " " + str(probe_object.client_id) + " " + str(probe_object.path) + " " + str(scores[0,i]) + "\n")
+    if writer is None:
+      score_writer = utils.scores.ScoreWriter(score_file, self.m_file_selector.binary_scores)
+    else:
+      score_writer = writer
+    score_writer.write(client_id, [probe_object.client_id for probe_object in probe_objects], [probe_object.path for probe_object in probe_objects], scores[0,:])
+    if writer is None:
+      score_writer.close()
+
+  def __remove_shards__(self, result_file, model_range, keep = None):
+    """Removes all score shards of the given result file that overlap the given range of model indices, except for the shard to keep.
+    These are left-overs of a previous run with a different splitting of the models into scoring jobs."""
+    for start, end, shard_file in self.m_file_selector.shard_files(result_file):
+      if start < model_range[1] and end > model_range[0] and shard_file != keep:
+        utils.debug("  .. Removing outdated score shard '%s'." % shard_file)
+        try:
+          os.remove(shard_file)
+        except OSError:
+          # the shard might have been removed by a parallel scoring job in the meantime
+          pass
+
+  def __shard_writer__(self, result_file, model_range, force):
+    """Returns a writer for the score shard of the given result file and the given range of model indices, or None if the shard already exists.
+    All other shards of the result file that overlap the given range are removed."""
+    shard_file = self.m_file_selector.shard_file(result_file, model_range)
+    self.__remove_shards__(result_file, model_range, keep = shard_file)
+    if self.__check_file__(shard_file, force):
+      utils.warn("score shard '%s' already exists." % shard_file)
+      return None
+    return utils.scores.ScoreWriter(shard_file, self.m_file_selector.binary_scores)
+
+  def __scores_a__(self, model_ids, group, compute_zt_norm, force, preload_probes, model_range = None):
+    """Computes A scores. For non-ZT-norm, these are the only scores that are actually computed.
+    If score shards are enabled, the scores of all models are written to the score shard of the given range of model indices."""
+    writer = None
+    if self.m_file_selector.sharded_scores:
+      writer = self.__shard_writer__(self.m_file_selector.no_norm_result_file(group), model_range, force)
+      if writer is None:
+        if not compute_zt_norm:
+          return
+        # the shard exists, but some of the A files required for the ZT-norm might still be missing
+        model_ids = [model_id for model_id in model_ids if not self.__check_file__(self.m_file_selector.a_file(model_id, group), force)]
+        if not model_ids:
+          return
+      else:
+        # all scores of the shard need to be recomputed
+        force = True
 
-  def __scores_a__(self, model_ids, group, compute_zt_norm, force, preload_probes):
-    """Computes A scores. For non-ZT-norm, these are the only scores that are actually computed."""
     # preload the probe files for a faster access (and fewer network load)
     if preload_probes:
       utils.info("- Scoring: preloading probe files of group '%s'" % group)
       all_probe_objects = self.m_file_selector.probe_objects(group)
-      all_probe_files = self.m_file_selector.get_paths(self.m_file_selector.probe_objects(group), 'projected' if self.m_use_projected_dir else 'features')
+      all_probe_files = self.m_file_selector.get_paths(all_probe_objects, 'projected' if self.m_use_projected_dir else 'features')
+      # map from probe id to the index in the list of all probes
+      probe_index = self.__probe_index__(all_probe_objects)
       # read all probe files into memory
-      if self.m_file_selector.uses_probe_file_sets():
-        all_preloaded_probes = [[self.m_tool.read_probe(str(probe_file)) for probe_file in file_set] for file_set in all_probe_files]
-      else:
-        all_preloaded_probes = [self.m_tool.read_probe(str(probe_file)) for probe_file in all_probe_files]
+      all_preloaded_probes = self.__preload_probes__(all_probe_files, group)
+      # memory-map the packed models, if possible
+      preloaded_models = self.__preload_models__(group, model_ids)
+    else:
+      preloaded_models = None
 
     if compute_zt_norm:
       utils.info("- Scoring: computing score matrix A for group '%s'" % group)
     else:
       utils.info("- Scoring: computing scores for group '%s'" % group)
 
-    # Computes the raw scores for each model
-    for model_id in model_ids:
-      # test if the file is already there
-      score_file = self.m_file_selector.a_file(model_id, group) if compute_zt_norm else self.m_file_selector.no_norm_file(model_id, group)
-      if self.__check_file__(score_file, force):
-        utils.warn("score file '%s' already exists." % (score_file))
+    # Computes the raw scores for blocks of models
+    score_file = (lambda model_id: self.m_file_selector.a_file(model_id, group)) if compute_zt_norm else (lambda model_id: self.m_file_selector.no_norm_file(model_id, group))
+    for block_model_ids in self.__model_blocks__(model_ids, score_file, force):
+      models = [self.__read_model__(model_id, group, preloaded_models) for model_id in block_model_ids]
+      # get the probe split of each model
+      block_probe_objects = [self.m_file_selector.probe_objects_for_model(model_id, group) for model_id in block_model_ids]
+      if preload_probes:
+        # compute the A matrices of all models of the block, selecting the probes of each model from all probes
+        rows = self.__score_rows__(models, all_preloaded_probes, [self.__probe_indices__(current_probe_objects, probe_index) for current_probe_objects in block_probe_objects])
+      elif all([probe_object.id for probe_object in current_probe_objects] == [probe_object.id for probe_object in block_probe_objects[0]] for current_probe_objects in block_probe_objects):
+        # all models of the block use the same probes, which are read only once
+        a = self.__scores__(models, self.m_file_selector.get_paths(block_probe_objects[0], 'projected' if self.m_use_projected_dir else 'features'))
+        rows = [a[i:i+1] for i in range(len(models))]
       else:
-        # get the probe split
-        current_probe_objects = self.m_file_selector.probe_objects_for_model(model_id, group)
-        model = self.m_tool.read_model(self.m_file_selector.model_file(model_id, group))
-        if preload_probes:
-          # select the probe files for this model from all probes
-          current_preloaded_probes = self.__probe_split__(current_probe_objects, all_probe_objects, all_preloaded_probes)
-          # compute A matrix
-          a = self.__scores_preloaded__(model, current_preloaded_probes)
-        else:
-          current_probe_files = self.m_file_selector.get_paths(current_probe_objects, 'projected' if self.m_use_projected_dir else 'features')
-          a = self.__scores__(model, current_probe_files)
+        rows = [self.__scores__([model], self.m_file_selector.get_paths(current_probe_objects, 'projected' if self.m_use_projected_dir else 'features')) for model, current_probe_objects in zip(models, block_probe_objects)]
 
+      for model_id, a, current_probe_objects in zip(block_model_ids, rows, block_probe_objects):
         if compute_zt_norm:
           # write A matrix only when you want to compute zt norm afterwards
           bob.io.save(a, self.m_file_selector.a_file(model_id, group))
 
-        # Save scores to text file
-        self.__save_scores__(self.m_file_selector.no_norm_file(model_id, group), a, current_probe_objects, self.m_file_selector.client_id(model_id))
+        # Save scores to text file, unless they are already contained in the existing score shard
+        if writer is not None or not self.m_file_selector.sharded_scores:
+          self.__save_scores__(self.m_file_selector.no_norm_file(model_id, group), a, current_probe_objects, self.m_file_selector.client_id(model_id), writer)
+
+    if writer is not None:
+      writer.close()
 
   def __scores_b__(self, model_ids, group, force, preload_probes):
     """Computes B scores."""
@@ -403,26 +779,23 @@ class ToolChain:
     if preload_probes:
       utils.info("- Scoring: preloading Z-probe files of group '%s'" % group)
       # read all probe files into memory
-      if self.m_file_selector.uses_probe_file_sets():
-        preloaded_z_probes = [[self.m_tool.read_probe(str(z_probe_file)) for z_probe_file in file_set] for file_set in z_probe_files]
-      else:
-        preloaded_z_probes = [self.m_tool.read_probe(str(z_probe_file)) for z_probe_file in z_probe_files]
+      preloaded_z_probes = self.__preload_probes__(z_probe_files, group, z_probes = True)
+      preloaded_models = self.__preload_models__(group, model_ids)
+    else:
+      preloaded_models = None
 
     utils.info("- Scoring: computing score matrix B for group '%s'" % group)
 
-    # Loads the models
-    for model_id in model_ids:
-      # test if the file is already there
-      score_file = self.m_file_selector.b_file(model_id, group)
-      if self.__check_file__(score_file, force):
-        utils.warn("score file '%s' already exists." % (score_file))
+    # Computes the scores for blocks of models
+    score_file = lambda model_id: self.m_file_selector.b_file(model_id, group)
+    for block_model_ids in self.__model_blocks__(model_ids, score_file, force):
+      models = [self.__read_model__(model_id, group, preloaded_models) for model_id in block_model_ids]
+      if preload_probes:
+        b = self.__score_matrix__(models, preloaded_z_probes)
       else:
-        model = self.m_tool.read_model(self.m_file_selector.model_file(model_id, group))
-        if preload_probes:
-          b = self.__scores_preloaded__(model, preloaded_z_probes)
-        else:
-          b = self.__scores__(model, z_probe_files)
-        bob.io.save(b, score_file)
+        b = self.__scores__(models, z_probe_files)
+      for i, model_id in enumerate(block_model_ids):
+        bob.io.save(b[i:i+1], score_file(model_id))
 
   def __scores_c__(self, t_model_ids, group, force, preload_probes):
     """Computes C scores."""
@@ -434,26 +807,23 @@ class ToolChain:
     if preload_probes:
       utils.info("- Scoring: preloading probe files of group '%s'" % group)
       # read all probe files into memory
-      if self.m_file_selector.uses_probe_file_sets():
-        preloaded_probes = [[self.m_tool.read_probe(str(probe_file)) for probe_file in file_set] for file_set in all_probe_files]
-      else:
-        preloaded_probes = [self.m_tool.read_probe(str(probe_file)) for probe_file in probe_files]
+      preloaded_probes = self.__preload_probes__(probe_files, group)
+      preloaded_t_models = self.__preload_models__(group, t_model_ids, t_models = True)
+    else:
+      preloaded_t_models = None
 
     utils.info("- Scoring: computing score matrix C for group '%s'" % group)
 
-    # Computes the raw scores for the T-Norm model
-    for t_model_id in t_model_ids:
-      # test if the file is already there
-      score_file = self.m_file_selector.c_file(t_model_id, group)
-      if self.__check_file__(score_file, force):
-        utils.warn("score file '%s' already exists." % (score_file))
+    # Computes the raw scores for blocks of T-Norm models
+    score_file = lambda t_model_id: self.m_file_selector.c_file(t_model_id, group)
+    for block_t_model_ids in self.__model_blocks__(t_model_ids, score_file, force):
+      t_models = [self.__read_model__(t_model_id, group, preloaded_t_models, t_models = True) for t_model_id in block_t_model_ids]
+      if preload_probes:
+        c = self.__score_matrix__(t_models, preloaded_probes)
       else:
-        t_model = self.m_tool.read_model(self.m_file_selector.t_model_file(t_model_id, group))
-        if preload_probes:
-          c = self.__scores_preloaded__(t_model, preloaded_probes)
-        else:
-          c = self.__scores__(t_model, probe_files)
-        bob.io.save(c, score_file)
+        c = self.__scores__(t_models, probe_files)
+      for i, t_model_id in enumerate(block_t_model_ids):
+        bob.io.save(c[i:i+1], score_file(t_model_id))
 
   def __scores_d__(self, t_model_ids, group, force, preload_probes):
     """Computes D scores."""
@@ -465,10 +835,10 @@ class ToolChain:
     if preload_probes:
       utils.info("- Scoring: preloading Z-probe files of group '%s'" % group)
       # read all probe files into memory
-      if self.m_file_selector.uses_probe_file_sets():
-        preloaded_z_probes = [[self.m_tool.read_probe(str(z_probe_file)) for z_probe_file in file_set] for file_set in z_probe_files]
-      else:
-        preloaded_z_probes = [self.m_tool.read_probe(str(z_probe_file)) for z_probe_file in z_probe_files]
+      preloaded_z_probes = self.__preload_probes__(z_probe_files, group, z_probes = True)
+      preloaded_t_models = self.__preload_models__(group, t_model_ids, t_models = True)
+    else:
+      preloaded_t_models = None
 
     utils.info("- Scoring: computing score matrix D for group '%s'" % group)
 
@@ -477,27 +847,25 @@ class ToolChain:
     for z_probe_object in z_probe_objects:
       z_probe_ids.append(z_probe_object.client_id)
 
-    # Loads the T-Norm models
-    for t_model_id in t_model_ids:
-      # test if the file is already there
-      score_file = self.m_file_selector.d_same_value_file(t_model_id, group)
-      if self.__check_file__(score_file, force):
-        utils.warn("score file '%s' already exists." % (score_file))
+    # Computes the scores for blocks of T-Norm models
+    score_file = lambda t_model_id: self.m_file_selector.d_same_value_file(t_model_id, group)
+    for block_t_model_ids in self.__model_blocks__(t_model_ids, score_file, force):
+      t_models = [self.__read_model__(t_model_id, group, preloaded_t_models, t_models = True) for t_model_id in block_t_model_ids]
+      if preload_probes:
+        d = self.__score_matrix__(t_models, preloaded_z_probes)
       else:
-        t_model = self.m_tool.read_model(self.m_file_selector.t_model_file(t_model_id, group))
-        if preload_probes:
-          d = self.__scores_preloaded__(t_model, preloaded_z_probes)
-        else:
-          d = self.__scores__(t_model, z_probe_files)
-        bob.io.save(d, self.m_file_selector.d_file(t_model_id, group))
+        d = self.__scores__(t_models, z_probe_files)
+      for i, t_model_id in enumerate(block_t_model_ids):
+        bob.io.save(d[i:i+1], self.m_file_selector.d_file(t_model_id, group))
 
         t_client_id = [self.m_file_selector.client_id(t_model_id)]
         d_same_value_tm = bob.machine.ztnorm_same_value(t_client_id, z_probe_ids)
-        bob.io.save(d_same_value_tm, score_file)
+        bob.io.save(d_same_value_tm, score_file(t_model_id))
 
 
   def compute_scores(self, tool, compute_zt_norm, force = False, indices = None, groups = ['dev', 'eval'], types = ['A', 'B', 'C', 'D'], preload_probes = False):
-    """Computes the scores for the given groups (by default 'dev' and 'eval')."""
+    """Computes the scores for the given groups (by default 'dev' and 'eval').
+    When preload_probes is enabled, the probes and, if possible, the models are read from packed and memory-mapped caches."""
     # save tool for internal use
     self.m_tool = tool
     self.m_use_projected_dir = hasattr(tool, 'project')
@@ -519,7 +887,7 @@ class ToolChain:
           utils.info("- Scoring: splitting of index range %s" % str(indices))
         else:
           model_ids_short = model_ids
-        self.__scores_a__(model_ids_short, group, compute_zt_norm, force, preload_probes)
+        self.__scores_a__(model_ids_short, group, compute_zt_norm, force, preload_probes, indices if indices is not None else (0, len(model_ids)))
 
       if compute_zt_norm:
         # compute B scores
@@ -551,76 +919,95 @@ class ToolChain:
 
 
 
-  def __c_matrix_split_for_model__(self, selected_probe_objects, all_probe_objects, all_c_scores):
+  def __c_matrix_split_for_model__(self, probe_indices, all_c_scores):
     """Helper function to sub-select the c-scores in case not all probe files were used to compute A scores."""
-    c_scores_for_model = numpy.ndarray((all_c_scores.shape[0], len(selected_probe_objects)), numpy.float64)
-    selected_index = 0
-    for all_index in range(len(all_probe_objects)):
-      if selected_index < len(selected_probe_objects) and selected_probe_objects[selected_index].id == all_probe_objects[all_index].id:
-        c_scores_for_model[:,selected_index] = all_c_scores[:,all_index]
-        selected_index += 1
-    assert selected_index == len(selected_probe_objects)
-
-    # return the split database
-    return c_scores_for_model
-
-  def __scores_c_normalize__(self, model_ids, t_model_ids, group):
-    """Compute normalized probe scores using T-model scores."""
+    return all_c_scores[:,probe_indices]
+
+  def __allocate_matrix__(self, shape, dtype, directory, memory_map):
+    """Allocates a matrix of the given shape and data type.
+    If memory_map is enabled, the matrix is backed by a temporary file in the given directory, so that it does not need to fit into memory.
+    Returns the matrix and the name of the temporary file (or None)."""
+    if not memory_map:
+      return numpy.ndarray(shape, dtype), None
+    handle, temporary_file = tempfile.mkstemp(suffix = '.npy', dir = directory)
+    os.close(handle)
+    return numpy.lib.format.open_memmap(temporary_file, mode = 'w+', dtype = dtype, shape = shape), temporary_file
+
+  def __stack_rows__(self, files, directory, memory_map):
+    """Reads the score rows from the given files and stores them in one preallocated matrix."""
+    matrix, temporary_file = None, None
+    for i, file_name in enumerate(files):
+      row = bob.io.load(file_name)
+      if matrix is None:
+        # the size of the matrix is known after reading the first file
+        matrix, temporary_file = self.__allocate_matrix__((len(files), row.shape[-1]), row.dtype, directory, memory_map)
+      matrix[i,:] = row
+    return matrix, temporary_file
+
+  def __scores_c_normalize__(self, model_ids, t_model_ids, group, memory_map = False):
+    """Compute normalized probe scores using T-model scores.
+    If memory_map is enabled, the C matrices of the models are not written; instead, the memory-mapped C matrix of all T-models and its temporary file are returned."""
     # read all tmodel scores
-    c_for_all = None
-    for t_model_id in t_model_ids:
-      tmp = bob.io.load(self.m_file_selector.c_file(t_model_id, group))
-      if c_for_all == None:
-        c_for_all = tmp
-      else:
-        c_for_all = numpy.vstack((c_for_all, tmp))
+    c_for_all, temporary_file = self.__stack_rows__([self.m_file_selector.c_file(t_model_id, group) for t_model_id in t_model_ids], os.path.join(self.m_file_selector.zt_score_directories[2], group), memory_map)
+    if memory_map:
+      # the C matrix of each model is selected from the memory-mapped matrix when it is needed
+      return c_for_all, temporary_file
+
     # iterate over all models and generate C matrices for that specific model
-    all_probe_objects = self.m_file_selector.probe_objects(group)
+    probe_index = self.__probe_index__(self.m_file_selector.probe_objects(group))
     for model_id in model_ids:
       # select the correct probe files for the current model
       probe_objects_for_model = self.m_file_selector.probe_objects_for_model(model_id, group)
-      c_matrix_for_model = self.__c_matrix_split_for_model__(probe_objects_for_model, all_probe_objects, c_for_all)
+      c_matrix_for_model = self.__c_matrix_split_for_model__(self.__probe_indices__(probe_objects_for_model, probe_index), c_for_all)
       # Save C matrix to file
       bob.io.save(c_matrix_for_model, self.m_file_selector.c_file_for_model(model_id, group))
+    return None, None
 
-  def __scores_d_normalize__(self, t_model_ids, group):
-    """Compute normalized D scores for the given T-model ids"""
-    # initialize D and D_same_value matrices
-    d_for_all = None
-    d_same_value = None
-    for t_model_id in t_model_ids:
-      tmp = bob.io.load(self.m_file_selector.d_file(t_model_id, group))
-      tmp2 = bob.io.load(self.m_file_selector.d_same_value_file(t_model_id, group))
-      if d_for_all == None and d_same_value == None:
-        d_for_all = tmp
-        d_same_value = tmp2
-      else:
-        d_for_all = numpy.vstack((d_for_all, tmp))
-        d_same_value = numpy.vstack((d_same_value, tmp2))
+  def __scores_d_normalize__(self, t_model_ids, group, memory_map = False):
+    """Compute normalized D scores for the given T-model ids.
+    If memory_map is enabled, the D matrices are not written; instead, the memory-mapped D and D_same_value matrices and their temporary files are returned."""
+    # collect D and D_same_value matrices
+    d_for_all, d_temporary_file = self.__stack_rows__([self.m_file_selector.d_file(t_model_id, group) for t_model_id in t_model_ids], os.path.join(self.m_file_selector.zt_score_directories[3], group), memory_map)
+    d_same_value, d_same_value_temporary_file = self.__stack_rows__([self.m_file_selector.d_same_value_file(t_model_id, group) for t_model_id in t_model_ids], os.path.join(self.m_file_selector.zt_score_directories[4], group), memory_map)
+    if memory_map:
+      return d_for_all, d_same_value, [d_temporary_file, d_same_value_temporary_file]
 
     # Saves to files
     bob.io.save(d_for_all, self.m_file_selector.d_matrix_file(group))
     bob.io.save(d_same_value, self.m_file_selector.d_same_value_matrix_file(group))
+    return None, None, []
 
 
 
-  def zt_norm(self, groups = ['dev', 'eval']):
-    """Computes ZT-Norm using the previously generated A, B, C, and D files"""
+  def zt_norm(self, groups = ['dev', 'eval'], memory_map = False):
+    """Computes ZT-Norm using the previously generated A, B, C, and D files.
+    If memory_map is enabled, the C and D matrices of all T-models are assembled in memory-mapped temporary files instead of in memory,
+    which are used directly for the ZT-normalization."""
     for group in groups:
       utils.info("- Scoring: computing ZT-norm for group '%s'" % group)
       # list of models
       model_ids = self.m_file_selector.model_ids(group)
       t_model_ids = self.m_file_selector.t_model_ids(group)
 
+      writer = None
+      if self.m_file_selector.sharded_scores:
+        # the ZT-norm is always computed for all models of the group at once
+        writer = self.__shard_writer__(self.m_file_selector.zt_norm_result_file(group), (0, len(model_ids)), True)
+
       # first, normalize C and D scores
-      self.__scores_c_normalize__(model_ids, t_model_ids, group)
+      c_for_all, c_temporary_file = self.__scores_c_normalize__(model_ids, t_model_ids, group, memory_map)
       # and normalize it
-      self.__scores_d_normalize__(t_model_ids, group)
+      d, d_same_value, temporary_files = self.__scores_d_normalize__(t_model_ids, group, memory_map)
 
+      if d is None:
+        # load D matrices only once
+        d = bob.io.load(self.m_file_selector.d_matrix_file(group))
+        d_same_value = bob.io.load(self.m_file_selector.d_same_value_matrix_file(group))
+      d_same_value = numpy.asarray(d_same_value, dtype = bool)
+      if c_for_all is not None:
+        probe_index = self.__probe_index__(self.m_file_selector.probe_objects(group))
+        temporary_files.append(c_temporary_file)
 
-      # load D matrices only once
-      d = bob.io.load(self.m_file_selector.d_matrix_file(group))
-      d_same_value = bob.io.load(self.m_file_selector.d_same_value_matrix_file(group)).astype(bool)
       # Loops over the model ids
       for model_id in model_ids:
         # Loads probe files to get information about the type of access
@@ -629,50 +1016,167 @@ class ToolChain:
         # Loads A, B, and C matrices for current model id
         a = bob.io.load(self.m_file_selector.a_file(model_id, group))
         b = bob.io.load(self.m_file_selector.b_file(model_id, group))
-        c = bob.io.load(self.m_file_selector.c_file_for_model(model_id, group))
+        if c_for_all is None:
+          c = bob.io.load(self.m_file_selector.c_file_for_model(model_id, group))
+        else:
+          c = self.__c_matrix_split_for_model__(self.__probe_indices__(probe_objects, probe_index), c_for_all)
 
         # compute zt scores
         zt_scores = bob.machine.ztnorm(a, b, c, d, d_same_value)
 
         # Saves to text file
-        self.__save_scores__(self.m_file_selector.zt_norm_file(model_id, group), zt_scores, probe_objects, self.m_file_selector.client_id(model_id))
+        self.__save_scores__(self.m_file_selector.zt_norm_file(model_id, group), zt_scores, probe_objects, self.m_file_selector.client_id(model_id), writer)
 
+      if writer is not None:
+        writer.close()
+
+      # release the memory-mapped matrices before their files are removed
+      del c_for_all, d, d_same_value
+      for temporary_file in temporary_files:
+        if temporary_file is not None:
+          os.remove(temporary_file)
+
+
+  def compute_scores_in_memory(self, tool, compute_zt_norm, force = False, groups = ['dev', 'eval'], model_block_size = 100):
+    """Computes the scores for the given groups and, if desired, ZT-normalizes them, without writing the intermediate A, B, C and D score files.
+    All probes, Z-probes and T-models are kept in memory, while the models are processed in blocks of the given size.
+    Since the ZT-normalization of each score is independent of the other scores, a whole block of models is normalized in one call.
+    Only the final score text files are written, which can be concatenated as usual.
+    This function is meant to be used on a single machine; for the grid, please use compute_scores() and zt_norm()."""
+    # save tool for internal use
+    self.m_tool = tool
+    self.m_use_projected_dir = hasattr(tool, 'project')
+    directory_type = 'projected' if self.m_use_projected_dir else 'features'
+
+    # load the projector and the enroller, if needed
+    tool.load_projector(self.m_file_selector.projector_file)
+    tool.load_enroller(self.m_file_selector.enroller_file)
 
-  def concatenate(self, compute_zt_norm, groups = ['dev', 'eval']):
-    """Concatenates all results into one (or two) score files per group."""
+    for group in groups:
+      writers = (None, None)
+      if self.m_file_selector.sharded_scores:
+        # write all scores into one shard per group
+        model_ids = self.m_file_selector.model_ids(group)
+        shard_files = (self.m_file_selector.no_norm_shard_file(group, (0, len(model_ids))), self.m_file_selector.zt_norm_shard_file(group, (0, len(model_ids))) if compute_zt_norm else None)
+        if self.__check_file__(shard_files[0], force) and (not compute_zt_norm or self.__check_file__(shard_files[1], force)):
+          model_ids = []
+        else:
+          result_files = (self.m_file_selector.no_norm_result_file(group), self.m_file_selector.zt_norm_result_file(group) if compute_zt_norm else None)
+          writers = tuple(self.__shard_writer__(result_file, (0, len(model_ids)), True) if result_file is not None else None for result_file in result_files)
+      else:
+        # get the models for which the score files need to be computed
+        model_ids = [model_id for model_id in self.m_file_selector.model_ids(group) if not (self.__check_file__(self.m_file_selector.no_norm_file(model_id, group), force) and (not compute_zt_norm or self.__check_file__(self.m_file_selector.zt_norm_file(model_id, group), force)))]
+      if not model_ids:
+        utils.info("- Scoring: all score files of group '%s' already exist" % group)
+        continue
+
+      utils.info("- Scoring: loading probe files of group '%s'" % group)
+      probe_objects = self.m_file_selector.probe_objects(group)
+      probes = self.__preload_probes__(self.m_file_selector.get_paths(probe_objects, directory_type), group)
+      probe_index = self.__probe_index__(probe_objects)
+
+      if compute_zt_norm:
+        utils.info("- Scoring: loading T-models and Z-probe files of group '%s'" % group)
+        t_model_ids = self.m_file_selector.t_model_ids(group)
+        preloaded_t_models = self.__preload_models__(group, t_model_ids, t_models = True)
+        t_models = [self.__read_model__(t_model_id, group, preloaded_t_models, t_models = True) for t_model_id in t_model_ids]
+        z_probe_objects = self.m_file_selector.z_probe_objects(group)
+        z_probes = self.__preload_probes__(self.m_file_selector.get_paths(z_probe_objects, directory_type), group, z_probes = True)
+
+        utils.info("- Scoring: computing score matrices C and D for group '%s'" % group)
+        c = self.__score_matrix__(t_models, probes)
+        d = self.__score_matrix__(t_models, z_probes)
+        del t_models
+        d_same_value = numpy.array(bob.machine.ztnorm_same_value([self.m_file_selector.client_id(t_model_id) for t_model_id in t_model_ids], [z_probe_object.client_id for z_probe_object in z_probe_objects]), dtype = bool)
+
+      utils.info("- Scoring: computing scores of %d models for group '%s'" % (len(model_ids), group))
+      # if the tool computes the score matrix more efficiently than pair-wise, the scores of all probes are computed for all models of a block
+      fast_score_matrix = tool.has_fast_score_matrix
+      preloaded_models = self.__preload_models__(group, model_ids)
+      for start in range(0, len(model_ids), model_block_size):
+        block_model_ids = model_ids[start : start + model_block_size]
+        models = [self.__read_model__(model_id, group, preloaded_models) for model_id in block_model_ids]
+        block_probe_objects = [self.m_file_selector.probe_objects_for_model(model_id, group) for model_id in block_model_ids]
+        block_probe_indices = [self.__probe_indices__(current_probe_objects, probe_index) for current_probe_objects in block_probe_objects]
+
+        # compute the A matrix of this block; only the scores of the probes that belong to each model are used
+        if fast_score_matrix or all(len(indices) == len(probes) for indices in block_probe_indices):
+          # compute all scores of the block at once
+          a = self.__score_matrix__(models, probes)
+        else:
+          # the scores of probes that do not belong to a model are not computed
+          a = numpy.zeros((len(models), len(probes)), numpy.float64)
+          for i in range(len(models)):
+            a[i, block_probe_indices[i]] = self.__score_matrix__([models[i]], self.__probe_split__(block_probe_indices[i], probes))[0]
+
+        if compute_zt_norm:
+          b = self.__score_matrix__(models, z_probes)
+          zt_scores = bob.machine.ztnorm(a, b, c, d, d_same_value)
+
+        # write the score files of the models
+        for i, model_id in enumerate(block_model_ids):
+          client_id = self.m_file_selector.client_id(model_id)
+          self.__save_scores__(self.m_file_selector.no_norm_file(model_id, group), a[i:i+1, block_probe_indices[i]], block_probe_objects[i], client_id, writers[0])
+          if compute_zt_norm:
+            self.__save_scores__(self.m_file_selector.zt_norm_file(model_id, group), zt_scores[i:i+1, block_probe_indices[i]], block_probe_objects[i], client_id, writers[1])
+
+      for writer in writers:
+        if writer is not None:
+          writer.close()
+
+
+
+  def __concatenate__(self, model_files, result_file, prefetch = 4):
+    """Concatenates the given score files of all models into the given result file.
+    Text files are copied in chunks, while up to prefetch of the upcoming files are read in parallel."""
+    for model_file in model_files:
+      if not os.path.exists(model_file):
+        raise IOError("The score file '%s' cannot be found. Aborting!" % model_file)
+
+    if self.m_file_selector.binary_scores:
+      utils.scores.merge_binary(model_files, result_file)
+    else:
+      utils.scores.concatenate_text(model_files, result_file, prefetch = prefetch)
+
+  def __shards__(self, result_file, model_count):
+    """Returns the score shards for the given result file, after checking that they cover all models exactly once."""
+    shards = self.m_file_selector.shard_files(result_file)
+    end = 0
+    for shard in shards:
+      if shard[0] != end:
+        raise IOError("The score shards of '%s' do not cover model %d exactly once (found '%s'); please re-run the scoring, which removes outdated shards. Aborting!" % (result_file, end, shard[2]))
+      end = shard[1]
+    if end != model_count:
+      raise IOError("The score shards of '%s' cover only %d of %d models. Aborting!" % (result_file, end, model_count))
+    return [shard[2] for shard in shards]
+
+  def concatenate(self, compute_zt_norm, groups = ['dev', 'eval'], prefetch = 4):
+    """Concatenates all results into one (or two) score files per group.
+    If score shards are enabled, only the few shards are concatenated, instead of the score files of all models."""
     for group in groups:
       utils.info("- Scoring: concatenating score files for group '%s'" % group)
       # (sorted) list of models
       model_ids = self.m_file_selector.model_ids(group)
 
-      with open(self.m_file_selector.no_norm_result_file(group), 'w') as f:
-        # Concatenates the scores
-        for model_id in model_ids:
-          model_file = self.m_file_selector.no_norm_file(model_id, group)
-          if not os.path.exists(model_file):
-            f.close()
-            os.remove(self.m_file_selector.no_norm_result_file(group))
-            raise IOError("The score file '%s' cannot be found. Aborting!" % model_file)
-
-          with open(model_file, 'r') as res_file:
-            f.write(res_file.read())
-
+      result_files = [self.m_file_selector.no_norm_result_file(group)]
       if compute_zt_norm:
-        with open(self.m_file_selector.zt_norm_result_file(group), 'w') as f:
-          # Concatenates the scores
-          for model_id in model_ids:
-            model_file = self.m_file_selector.zt_norm_file(model_id, group)
-            if not os.path.exists(model_file):
-              f.close()
-              os.remove(self.m_file_selector.zt_norm_result_file(group))
-              raise IOError("The score file '%s' cannot be found. Aborting!" % model_file)
+        result_files.append(self.m_file_selector.zt_norm_result_file(group))
+
+      for result_file, model_file in zip(result_files, (self.m_file_selector.no_norm_file, self.m_file_selector.zt_norm_file)):
+        if self.m_file_selector.sharded_scores:
+          score_files = self.__shards__(result_file, len(model_ids))
+        else:
+          score_files = [model_file(model_id, group) for model_id in model_ids]
+        self.__concatenate__(score_files, result_file, prefetch)
 
-            with open(model_file, 'r') as res_file:
-              f.write(res_file.read())
 
+  def __calibrate__(self, llr_machine, scores):
+    """Applies the given (linear) calibration machine to all given scores at once."""
+    return (numpy.asarray(scores, numpy.float64) - llr_machine.input_subtract[0]) / llr_machine.input_divide[0] * llr_machine.weights[0,0] + llr_machine.biases[0]
 
-  def calibrate_scores(self, norms = ['nonorm', 'ztnorm'], groups = ['dev', 'eval'], prior = 0.5):
-    """Calibrates the score files by learning a linear calibration from the dev files (first element of the groups) and executing the on all groups, separately for all given norms."""
+  def calibrate_scores(self, norms = ['nonorm', 'ztnorm'], groups = ['dev', 'eval'], prior = 0.5, block_size = 100000):
+    """Calibrates the score files by learning a linear calibration from the dev files (first element of the groups) and executing the on all groups, separately for all given norms.
+    Text score files are calibrated and written in blocks of the given number of lines."""
     # read score files of the first group
     for norm in norms:
       training_score_file = self.m_file_selector.no_norm_result_file(groups[0]) if norm == 'nonorm' else self.m_file_selector.zt_norm_result_file(groups[0]) if norm is 'ztnorm' else None
@@ -681,7 +1185,7 @@ class ToolChain:
       utils.info(" - Calibration: Training calibration for type %s from group %s" % (norm, groups[0]))
       llr_trainer = bob.trainer.CGLogRegTrainer(prior, 1e-16, 100000)
 
-      training_scores = list(bob.measure.load.split_four_column(training_score_file))
+      training_scores = list(utils.scores.split_four_column(training_score_file))
       for i in (0,1):
         h = numpy.array(training_scores[i])
         h.shape = (len(training_scores[i]), 1)
@@ -698,12 +1202,22 @@ class ToolChain:
 
         utils.info(" - Calibration: calibrating scores from '%s' to '%s'" % (score_file, calibrated_file))
 
-        # iterate through the score file and calibrate scores
-        scores = bob.measure.load.four_column(score_file)
-        with open(calibrated_file, 'w') as f:
-          for line in scores:
-            assert len(line) == 4
-            calibrated_score = llr_machine([line[3]])
-            f.write('%s %s %s ' % line[0:3] + str(calibrated_score[0]) + "\n")
+        if utils.scores.is_binary(score_file):
+          # calibrate the score column and keep the other columns
+          data = utils.scores.load_binary(score_file)
+          data['scores'] = self.__calibrate__(llr_machine, data['scores'])
+          utils.scores.save_binary_data(calibrated_file, data)
+          continue
+
+        # iterate through the score file and calibrate blocks of scores
+        with open(score_file, 'r') as scores, open(calibrated_file, 'w') as f:
+          while True:
+            block = list(itertools.islice(scores, block_size))
+            if not block:
+              break
+            lines = [line.split() for line in block if line.strip()]
+            assert all(len(line) == 4 for line in lines)
+            calibrated_scores = self.__calibrate__(llr_machine, [line[3] for line in lines])
+            f.write(''.join(['%s %s %s ' % tuple(lines[i][0:3]) + str(calibrated_scores[i]) + "\n" for i in range(len(lines))]))
 
 
@@ -5,4 +5,5 @@
 """Tool chain for computing verification scores"""
 
 from FileSelector import FileSelector
+from PackedStore import PackedStore
 from ToolChain import ToolChain
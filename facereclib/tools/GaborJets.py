@@ -61,6 +61,22 @@ class GaborJets (Tool):
     # jet comparison function
     self.m_similarity_function = bob.machine.GaborJetSimilarity(gabor_jet_similarity_type, gwt)
 
+    # vectorized implementation of the jet comparison function, if available for the given similarity type
+    self.m_similarity_type = str(gabor_jet_similarity_type)
+    if self.m_similarity_type not in ('SCALAR_PRODUCT', 'CANBERRA', 'DISPARITY'):
+      self.m_similarity_type = None
+    # only these similarities are computed for several models and probes at once
+    self.has_fast_score_matrix = self.m_similarity_type is not None
+    # the frequencies of the Gabor kernels (with kernel index scale * gabor_directions + direction), which are required for the disparity estimation
+    self.m_gabor_scales = gabor_scales
+    self.m_gabor_directions = gabor_directions
+    self.m_kernel_frequencies = numpy.array([
+        [gabor_maximum_frequency * gabor_frequency_step**scale * math.cos(math.pi * direction / gabor_directions),
+         gabor_maximum_frequency * gabor_frequency_step**scale * math.sin(math.pi * direction / gabor_directions)]
+        for scale in range(gabor_scales) for direction in range(gabor_directions)])
+    # the maximum number of jet entries of the model and the probes that are compared at once
+    self.m_maximum_block_size = 10**7
+
     # how to proceed with multiple features per model
     self.m_jet_scoring = {
         'average_model' : None, # compute an average model
@@ -110,8 +126,101 @@ class GaborJets (Tool):
       return model
 
 
+  def __estimate_disparities__(self, confidences, phase_differences):
+    """Estimates the disparity vectors of all given pairs of jets at once, starting from the lowest frequency scale.
+    The confidences and phase differences are of shape (..., kernels); the disparities of shape (..., 2) are returned."""
+    shape = confidences.shape[:-1] + (self.m_gabor_scales, self.m_gabor_directions)
+    confidences = confidences.reshape(shape)
+    phase_differences = phase_differences.reshape(shape)
+    frequencies = self.m_kernel_frequencies.reshape((self.m_gabor_scales, self.m_gabor_directions, 2))
+
+    disparities = numpy.zeros(shape[:-2] + (2,))
+    gamma_x_x = numpy.zeros(shape[:-2])
+    gamma_x_y = numpy.zeros(shape[:-2])
+    gamma_y_y = numpy.zeros(shape[:-2])
+    phi_x = numpy.zeros(shape[:-2])
+    phi_y = numpy.zeros(shape[:-2])
+    for scale in range(self.m_gabor_scales-1, -1, -1):
+      k_x = frequencies[scale,:,0]
+      k_y = frequencies[scale,:,1]
+      confidence = confidences[...,scale,:]
+      # unwrap the phase differences to the phase shift that is predicted by the current disparity estimate
+      predicted = disparities[...,0:1] * k_x + disparities[...,1:2] * k_y
+      difference = phase_differences[...,scale,:] - predicted
+      difference = predicted + difference - 2. * math.pi * numpy.round(difference / (2. * math.pi))
+
+      gamma_x_x += numpy.sum(confidence * k_x * k_x, axis=-1)
+      gamma_x_y += numpy.sum(confidence * k_x * k_y, axis=-1)
+      gamma_y_y += numpy.sum(confidence * k_y * k_y, axis=-1)
+      phi_x += numpy.sum(confidence * difference * k_x, axis=-1)
+      phi_y += numpy.sum(confidence * difference * k_y, axis=-1)
+
+      # update the disparities, where they can be computed
+      determinant = gamma_x_x * gamma_y_y - gamma_x_y * gamma_x_y
+      valid = determinant != 0.
+      determinant[~valid] = 1.
+      disparities[...,0] = numpy.where(valid, (gamma_y_y * phi_x - gamma_x_y * phi_y) / determinant, disparities[...,0])
+      disparities[...,1] = numpy.where(valid, (gamma_x_x * phi_y - gamma_x_y * phi_x) / determinant, disparities[...,1])
+
+    return disparities
+
+
+  def __jet_similarities__(self, model, probes):
+    """Computes the similarities of all jets of the given model graph(s) with the according jets of all given probe graphs at once.
+    The model is of shape ([graphs,] nodes, [2,] kernels), the probes of shape (probes, nodes, [2,] kernels),
+    and the returned similarities of shape (probes, [graphs,] nodes)."""
+    with_phases = probes.ndim == 4
+    if model.ndim == probes.ndim:
+      # several model graphs; add the according axes for broadcasting
+      model = model[numpy.newaxis]
+      probes = probes[:,numpy.newaxis]
+
+    if with_phases:
+      # split the absolute values and phases
+      model_absolute, model_phase = model[...,0,:], model[...,1,:]
+      probe_absolute, probe_phase = probes[...,0,:], probes[...,1,:]
+    else:
+      model_absolute, probe_absolute = model, probes
+
+    if self.m_similarity_type == 'SCALAR_PRODUCT':
+      similarities = numpy.sum(model_absolute * probe_absolute, axis=-1)
+    elif self.m_similarity_type == 'CANBERRA':
+      similarities = numpy.mean(1. - numpy.abs(model_absolute - probe_absolute) / (model_absolute + probe_absolute), axis=-1)
+    else: # 'DISPARITY'
+      confidences = model_absolute * probe_absolute
+      phase_differences = model_phase - probe_phase
+      disparities = self.__estimate_disparities__(confidences, phase_differences)
+      phase_shifts = numpy.dot(disparities, self.m_kernel_frequencies.T)
+      similarities = numpy.sum(confidences * numpy.cos(phase_differences - phase_shifts), axis=-1)
+    return similarities
+
+
+  def __vectorized__(self, probes):
+    """Checks if the similarities of the given array of probe graphs can be computed at once; the disparity similarity requires jets with phases"""
+    return self.m_similarity_type is not None and (self.m_similarity_type != 'DISPARITY' or probes.ndim == 4)
+
+
+  def __score_graphs__(self, model, probes):
+    """Computes the fused scores of the given model and each of the given probe graphs, which are stacked into one array, in blocks of probes"""
+    block_size = max(1, self.m_maximum_block_size // model.size)
+    scores = numpy.ndarray((len(probes),), numpy.float64)
+    for start in range(0, len(probes), block_size):
+      similarities = self.__jet_similarities__(model, probes[start:start+block_size])
+      if self.m_jet_scoring is None:
+        # average of the Gabor jet similarities between averaged model graph and probe graph
+        scores[start:start+block_size] = numpy.average(similarities, axis=-1)
+      else:
+        # for each jet location, compute the desired score averaging; then, fuse the similarities of all locations
+        scores[start:start+block_size] = self.m_graph_scoring(self.m_jet_scoring(similarities, axis=1), axis=1)
+    return scores
+
+
   def score(self, model, probe):
     """Computes the score of the probe and the model"""
+    if self.m_similarity_type is not None:
+      probes = numpy.asarray([probe], dtype=numpy.float64)
+      if self.__vectorized__(probes):
+        return float(self.__score_graphs__(model, probes)[0])
     if self.m_jet_scoring is None:
       # compute sum of Gabor jet similarities between averaged model graph and probe graph
       return numpy.average([self.m_similarity_function(model[n], probe[n]) for n in range(model.shape[0])])
@@ -122,11 +231,33 @@ class GaborJets (Tool):
       return self.m_graph_scoring(self.m_jet_scoring(scores, axis=0))
 
 
+  def score_matrix(self, models, probes):
+    """Computes the scores of all models and probes, where all jets of all probes are compared to each model at once"""
+    if self.m_similarity_type is None or not len(models) or not len(probes):
+      return Tool.score_matrix(self, models, probes)
+    # convert the probes only once for all models
+    probe_array = numpy.asarray(probes, dtype=numpy.float64)
+    if not self.__vectorized__(probe_array):
+      return Tool.score_matrix(self, models, probes)
+    scores = numpy.ndarray((len(models), len(probes)), numpy.float64)
+    for i, model in enumerate(models):
+      scores[i] = self.__score_graphs__(model, probe_array)
+    return scores
+
+
   def score_for_multiple_probes(self, model, probes):
     """This function computes the score between the given model graph(s) and several given probe graphs."""
+    if self.m_similarity_type is not None:
+      probe_array = numpy.asarray(probes, dtype=numpy.float64)
+      if self.__vectorized__(probe_array):
+        similarities = self.__jet_similarities__(model, probe_array)
+        if self.m_jet_scoring is None:
+          return numpy.average(similarities)
+        # handle the graphs of all probes as if they were different model graphs
+        return self.m_graph_scoring(self.m_jet_scoring(similarities.reshape((-1, similarities.shape[-1])), axis=0))
     if self.m_jet_scoring is None:
       # compute sum of Gabor jet similarities between averaged model graph and probe graphs
-      return numpy.average([self.m_similarity_function(model[n], probes[p][n]) for n in range(model.shape[0]) for p in len(probes)])
+      return numpy.average([self.m_similarity_function(model[n], probes[p][n]) for n in range(model.shape[0]) for p in range(len(probes))])
     else:
       # compute all Gabor jet similarities
       scores = [[self.m_similarity_function(model[c,n], probes[p][n]) for n in range(model.shape[1])] for p in range(len(probes)) for c in range(model.shape[0])]
@@ -14,6 +14,9 @@ from .. import utils
 class ISV (UBMGMM):
   """Tool for computing Unified Background Models and Gaussian Mixture Models of the features"""
 
+  # the score_matrix function computes the scores of several models and probes at once
+  has_fast_score_matrix = True
+
 
   def __init__(
       self,
@@ -44,6 +47,7 @@ class ISV (UBMGMM):
         use_projected_features_for_enrollment = True,
         requires_enroller_training = False, # not needed anymore because it's done while training the projector
         split_training_features_by_client = True,
+        reads_training_features_on_demand = self.m_training_chunk_size is not None,
 
         subspace_dimension_of_u = subspace_dimension_of_u,
         isv_training_iterations = isv_training_iterations,
@@ -95,15 +99,29 @@ class ISV (UBMGMM):
       data.append(list)
 
     self._train_isv(data)
+    # keep the GMM statistics of the training data, so that the training features need not be projected again
+    self.m_training_gmm_stats = data
+
+  def projected_training_features(self):
+    """Returns the projected features of the last projector training, arranged by client, or None if they are not available.
+    The GMM statistics are reused from the training; only the Ux vectors are computed."""
+    data = getattr(self, 'm_training_gmm_stats', None)
+    self.m_training_gmm_stats = None
+    if data is None:
+      return None
+    return [[[gmm_stats, self._project_isv(gmm_stats)] for gmm_stats in client_stats] for client_stats in data]
 
   def train_projector(self, train_features, projector_file):
     """Train Projector and Enroller at the same time"""
 
-    data1 = numpy.vstack([feature for client in train_features for feature in client])
+    if self.m_training_chunk_size is not None:
+      UBMGMM._train_projector_using_chunks(self, lambda: (feature for client in train_features for feature in client))
+    else:
+      data1 = numpy.vstack([feature for client in train_features for feature in client])
 
-    UBMGMM._train_projector_using_array(self, data1)
-    # to save some memory, we might want to delete these data
-    del data1
+      UBMGMM._train_projector_using_array(self, data1)
+      # to save some memory, we might want to delete these data
+      del data1
 
     # train ISV
     self._load_train_isv(train_features)
@@ -230,6 +248,10 @@ class ISV (UBMGMM):
     projected_isv = self._project_isv(projected_ubm)
     return [projected_ubm, projected_isv]
 
+  def project_batch(self, feature_arrays):
+    """Computes GMM statistics against a UBM for several feature arrays at once, then the corresponding Ux vectors"""
+    return [[projected_ubm, self._project_isv(projected_ubm)] for projected_ubm in UBMGMM.project_batch(self, feature_arrays)]
+
   #######################################################
   ################## ISV model enroll ####################
 
@@ -306,6 +328,14 @@ class ISV (UBMGMM):
     Ux = probe[1]
     return model.forward_ux(gmmstats, Ux)
 
+  def score_matrix(self, models, probes):
+    """Computes the scores between all given models and all given probes at once.
+    The mean supervectors m + Dz of the models are scored linearly against the GMM statistics of the probes, using their Ux vectors as channel offsets."""
+    if not len(models) or not len(probes):
+      return Tool.score_matrix(self, models, probes)
+    supervectors = [self.m_ubm.mean_supervector + self.m_isvbase.d * model.z for model in models]
+    return self._linear_scoring_matrix(supervectors, [probe[0] for probe in probes], [probe[1] for probe in probes])
+
   def score_for_multiple_probes(self, model, probes):
     """This function computes the score between the given model and several given probe files."""
     # create GMM statistics from first probe statistics
@@ -412,6 +442,10 @@ class ISVVideo (ISV, UBMGMMVideo):
     """Computes GMM statistics against a UBM, given an input video.FrameContainer"""
     return UBMGMMVideo.project(self,frame_container)
 
+  def project_batch(self, frame_containers):
+    """Computes GMM statistics against a UBM for each of the given video.FrameContainers"""
+    return UBMGMMVideo.project_batch(self, frame_containers)
+
   def train_projector(self, train_files, projector_file):
     """Computes the Universal Background Model from the training ("world") data"""
     return UBMGMMVideo.train_projector(self,train_files, projector_file)
@@ -14,6 +14,9 @@ from .. import utils
 class IVector (UBMGMM):
   """Tool for extracting I-Vectors"""
 
+  # the score_matrix function computes the scores of several models and probes at once
+  has_fast_score_matrix = True
+
   def __init__(
       self,
       # IVector training
@@ -21,6 +24,8 @@ class IVector (UBMGMM):
       update_sigma = True,
       tv_training_iterations = 25,  # Number of EM iterations for the JFA training
       variance_threshold = 1e-5,
+      # IVector scoring
+      use_whitening = False,        # whiten the i-vectors (using the training i-vectors) before the cosine scoring
       # Parameters when splitting GMM and IVector files
       gmm_ivec_split = False,
       projected_toreplace = 'projected', # 'Magic' string in path that will be replaced by the GMM or IVector one
@@ -43,11 +48,13 @@ class IVector (UBMGMM):
         use_projected_features_for_enrollment = True,
         requires_enroller_training = False, # not needed anymore because it's done while training the projector
         split_training_features_by_client = False,
+        reads_training_features_on_demand = self.m_training_chunk_size is not None,
 
         subspace_dimension_of_t = subspace_dimension_of_t,
         update_sigma = update_sigma,
         tv_training_iterations = tv_training_iterations,
         variance_threshold = variance_threshold,
+        use_whitening = use_whitening,
         gmm_ivec_split = gmm_ivec_split,
         projected_toreplace = projected_toreplace,
         projected_gmm = projected_gmm,
@@ -65,6 +72,9 @@ class IVector (UBMGMM):
     self.m_subspace_dimension_of_t = subspace_dimension_of_t
     self.m_tv_training_iterations = tv_training_iterations
     self.m_variance_threshold = variance_threshold
+    self.m_use_whitening = use_whitening
+    self.m_whitening_mean = None
+    self.m_whitening_matrix = None
 
     self.m_gmm_ivec_split = gmm_ivec_split
     self.m_projected_toreplace = projected_toreplace
@@ -94,18 +104,50 @@ class IVector (UBMGMM):
       data.append(UBMGMM.project(self, feature))
 
     self._train_ivector(data)
+    # keep the GMM statistics of the training data, so that the training features need not be projected again
+    self.m_training_gmm_stats = data
+    self.m_training_ivectors = None
+
+  def _train_whitening(self):
+    """Computes the mean and the whitening matrix of the i-vectors of the training data"""
+    utils.info("  -> Training i-vector whitening")
+    self.m_training_ivectors = [self._project_ivector(gmm_stats) for gmm_stats in self.m_training_gmm_stats]
+    ivectors = numpy.vstack(self.m_training_ivectors)
+    self.m_whitening_mean = numpy.mean(ivectors, axis=0)
+    # the whitening matrix is the inverse square root of the covariance matrix, computed via its eigen-decomposition
+    eigenvalues, eigenvectors = numpy.linalg.eigh(numpy.cov(ivectors, rowvar=0))
+    eigenvalues = numpy.maximum(eigenvalues, 1e-10)
+    self.m_whitening_matrix = numpy.dot(eigenvectors / numpy.sqrt(eigenvalues), eigenvectors.T)
+
+  def projected_training_features(self):
+    """Returns the projected features of the last projector training, or None if they are not available.
+    The GMM statistics (and the i-vectors, when computed for the whitening) are reused from the training."""
+    data = getattr(self, 'm_training_gmm_stats', None)
+    ivectors = getattr(self, 'm_training_ivectors', None)
+    self.m_training_gmm_stats = None
+    self.m_training_ivectors = None
+    if data is None:
+      return None
+    if ivectors is None:
+      ivectors = [self._project_ivector(gmm_stats) for gmm_stats in data]
+    return [[gmm_stats, ivector] for gmm_stats, ivector in zip(data, ivectors)]
 
   def train_projector(self, train_features, projector_file):
     """Train Projector and Enroller at the same time"""
 
-    data = numpy.vstack(train_features)
+    if self.m_training_chunk_size is not None:
+      UBMGMM._train_projector_using_chunks(self, lambda: iter(train_features))
+    else:
+      data = numpy.vstack(train_features)
 
-    UBMGMM._train_projector_using_array(self, data)
-    # to save some memory, we might want to delete these data
-    del data
+      UBMGMM._train_projector_using_array(self, data)
+      # to save some memory, we might want to delete these data
+      del data
 
     # train IVector
     self._load_train_ivector(train_features)
+    if self.m_use_whitening:
+      self._train_whitening()
 
     # Save the IVector base AND the UBM into the same file
     self._save_projector(projector_file)
@@ -122,6 +164,25 @@ class IVector (UBMGMM):
     hdf5file.create_group('Enroller')
     hdf5file.cd('Enroller')
     self.m_tv.save(hdf5file)
+    self._save_whitening(hdf5file)
+
+  def _save_whitening(self, hdf5file):
+    """Saves the whitening (if trained) into the '/Whitening' group of the given HDF5 file"""
+    if self.m_whitening_matrix is not None:
+      hdf5file.cd('/')
+      hdf5file.create_group('Whitening')
+      hdf5file.cd('Whitening')
+      hdf5file.set('Mean', self.m_whitening_mean)
+      hdf5file.set('Matrix', self.m_whitening_matrix)
+
+  def _load_whitening(self, hdf5file):
+    """Loads the whitening from the '/Whitening' group of the given HDF5 file, if requested"""
+    if self.m_use_whitening:
+      if not hdf5file.has_group('/Whitening'):
+        raise IOError("The projector file does not contain the i-vector whitening; please re-train the projector with use_whitening = True")
+      hdf5file.cd('/Whitening')
+      self.m_whitening_mean = hdf5file.read('Mean')
+      self.m_whitening_matrix = hdf5file.read('Matrix')
 
 
   def _resolve_gmm_filename(self, projector_file):
@@ -145,7 +206,9 @@ class IVector (UBMGMM):
     self._save_projector_gmm_resolved(gmm_filename)
 
   def _save_projector_ivector_resolved(self, ivec_filename):
-    self.m_tv.save(bob.io.HDF5File(ivec_filename, "w"))
+    hdf5file = bob.io.HDF5File(ivec_filename, "w")
+    self.m_tv.save(hdf5file)
+    self._save_whitening(hdf5file)
 
   def _save_projector_ivector(self, projector_file):
     ivec_filename = self._resolve_ivector_filename(projector_file)
@@ -172,9 +235,11 @@ class IVector (UBMGMM):
     self._load_projector_gmm_resolved(gmm_filename)
 
   def _load_projector_ivector_resolved(self, ivec_filename):
-    self.m_tv = bob.machine.IVectorMachine(bob.io.HDF5File(ivec_filename))
+    hdf5file = bob.io.HDF5File(ivec_filename)
+    self.m_tv = bob.machine.IVectorMachine(hdf5file)
     # add UBM model from base class
     self.m_tv.ubm = self.m_ubm
+    self._load_whitening(hdf5file)
 
   def _load_projector_ivector(self, projector_file):
     ivec_filename = self._resolve_ivector_filename(projector_file)
@@ -197,6 +262,7 @@ class IVector (UBMGMM):
     self.m_tv = bob.machine.IVectorMachine(hdf5file)
     # add UBM model from base class
     self.m_tv.ubm = self.m_ubm
+    self._load_whitening(hdf5file)
 
   def load_projector(self, projector_file):
     """Reads the UBM model from file"""
@@ -222,6 +288,10 @@ class IVector (UBMGMM):
     projected_ivec = self._project_ivector(projected_ubm)
     return [projected_ubm, projected_ivec]
 
+  def project_batch(self, feature_arrays):
+    """Computes GMM statistics against a UBM for several feature arrays at once, then the corresponding i-vectors"""
+    return [[projected_ubm, self._project_ivector(projected_ubm)] for projected_ubm in UBMGMM.project_batch(self, feature_arrays)]
+
   #######################################################
   ################## ISV model enroll ####################
 
@@ -262,23 +332,43 @@ class IVector (UBMGMM):
     return gmmstats
 
 
+  def _normalize_ivectors(self, ivectors):
+    """Whitens (if enabled) and L2-normalizes the given list of raw i-vectors, which are returned as the rows of a contiguous 2D array"""
+    ivectors = numpy.vstack(ivectors).astype(numpy.float64)
+    if self.m_use_whitening:
+      ivectors = numpy.dot(ivectors - self.m_whitening_mean, self.m_whitening_matrix)
+    return self._l2_normalize(ivectors)
+
+  def _l2_normalize(self, ivectors):
+    """L2-normalizes the rows of the given 2D array of (already whitened) i-vectors in-place"""
+    norms = numpy.sqrt(numpy.sum(ivectors * ivectors, axis=1))
+    ivectors /= numpy.maximum(norms, 1e-12)[:,numpy.newaxis]
+    return ivectors
+
+  def read_enroll_feature(self, feature_file):
+    """Reads the GMM statistics and the stored i-vector of the given projected file, so that the i-vector need not be computed again during enrollment"""
+    return self.read_probe(feature_file)
+
   def enroll(self, enroll_features):
-    """Performs IVector enrollment"""
-    raise NotImplementedError('Enrollment is not yet supported')
+    """Enrolls a model as the normalized average of the normalized i-vectors of the given features.
+    The features are either pairs of GMM statistics and their stored i-vector (see read_enroll_feature), or GMM statistics, which are projected to i-vectors."""
+    ivectors = self._normalize_ivectors([feature[1] if isinstance(feature, (list, tuple)) else self._project_ivector(feature) for feature in enroll_features])
+    # the average is already whitened, hence it is only L2-normalized
+    return self._l2_normalize(numpy.mean(ivectors, axis=0)[numpy.newaxis])[0]
 
 
   ######################################################
   ################ Feature comparison ##################
   def read_model(self, model_file):
-    """Reads the IVector Machine that holds the model"""
-    raise NotImplementedError('Enrollment model is not yet supported')
+    """Reads the normalized i-vector that holds the model"""
+    return bob.io.load(model_file)
 
   def read_probe(self, probe_file):
     """Read the type of features that we require, namely GMMStats"""
     if self.m_gmm_ivec_split:
       probe_file_gmm = self._resolve_projected_gmm(probe_file)
       gmmstats = bob.machine.GMMStats(bob.io.HDF5File(str(probe_file_gmm)))
-      probe_file_ivec = self._resolve_projected_ivec(probe_file)
+      probe_file_ivec = self._resolve_projected_ivector(probe_file)
       ivector = bob.io.load(str(probe_file_ivec))
     else:
       hdf5file = bob.io.HDF5File(probe_file)
@@ -289,10 +379,18 @@ class IVector (UBMGMM):
     return [gmmstats, ivector]
 
   def score(self, model, probe):
-    """Computes the score for the given model and the given probe."""
-    raise NotImplementedError('Scoring is not yet supported')
+    """Computes the cosine similarity between the given model and the i-vector of the given probe."""
+    return float(numpy.dot(model, self._normalize_ivectors([probe[1]])[0]))
+
+  def score_matrix(self, models, probes):
+    """Computes the cosine similarities of all models and probes with a single matrix product.
+    The probe i-vectors are normalized only once for all models."""
+    if not len(models) or not len(probes):
+      return Tool.score_matrix(self, models, probes)
+    return numpy.dot(numpy.vstack(models), self._normalize_ivectors([probe[1] for probe in probes]).T)
 
   def score_for_multiple_probes(self, model, probes):
-    """This function computes the score between the given model and several given probe files."""
-    raise NotImplementedError('Multiple probes is not yet supported')
+    """This function computes the score between the given model and the normalized average i-vector of several given probe files."""
+    ivectors = self._normalize_ivectors([probe[1] for probe in probes])
+    return float(numpy.dot(model, self._l2_normalize(numpy.mean(ivectors, axis=0)[numpy.newaxis])[0]))
 
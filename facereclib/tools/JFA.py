@@ -13,6 +13,9 @@ from .. import utils
 class JFA (UBMGMM):
   """Tool for computing Unified Background Models and Gaussian Mixture Models of the features and project it via JFA"""
 
+  # the JFA scores are computed pair-wise
+  has_fast_score_matrix = False
+
   def __init__(
       self,
       # JFA training
@@ -118,6 +121,10 @@ class JFA (UBMGMM):
     """Computes the score for the given model and the given probe"""
     return model.forward(probe)
 
+  def score_matrix(self, models, probes):
+    """The JFA scores are computed pair-wise"""
+    return Tool.score_matrix(self, models, probes)
+
   def score_for_multiple_probes(self, model, probes):
     """This function computes the score between the given model and several given probe files."""
     # TODO: Check if this is correct
@@ -12,6 +12,9 @@ from .. import utils
 class LDA (Tool):
   """Tool for computing linear discriminant analysis (so-called Fisher faces)"""
 
+  # the score_matrix function computes the scores of several models and probes at once
+  has_fast_score_matrix = True
+
   def __init__(
       self,
       lda_subspace_dimension = 0, # if set, the LDA subspace will be truncated to the given number of dimensions; by default it is limited to the number of classes in the training set
@@ -169,3 +172,8 @@ class LDA (Tool):
     else:
       # single model, single probe (multiple probes have already been handled)
       return self.m_factor * self.m_distance_function(model, probe)
+
+
+  def score_matrix(self, models, probes):
+    """Computes the scores of all given models and probes, where the distances to all probes are computed at once for each model"""
+    return utils.distance_score_matrix(models, probes, self.m_distance_function, self.m_factor, self.m_model_fusion_function, self.m_variances if self.m_uses_variances else None)
@@ -33,36 +33,34 @@ class LGBPHS (Tool):
     # remember distance function
     self.m_distance_function = distance_function
     self.m_factor =  -1. if is_distance_function else 1
+    # the histogram measures that can be computed for several models and probes at once
+    if distance_function == bob.math.chi_square:
+      self.m_histogram_measure = 'chi_square'
+    elif distance_function == bob.math.histogram_intersection:
+      self.m_histogram_measure = 'histogram_intersection'
+    else:
+      self.m_histogram_measure = None
+    # only these histogram measures are computed for several models and probes at once
+    self.has_fast_score_matrix = self.m_histogram_measure is not None
+    # the maximum number of dense histogram bins that are compared at once
+    self.m_maximum_block_size = 10**7
 
   def enroll(self, enroll_features):
     """Enrolling model by taking the average of all features"""
     sparse = len(enroll_features) > 0 and enroll_features[0].shape[0] == 2
     if sparse:
-      # get all indices for the sparse model
-      values = {}
       # assert that we got sparse features
-      assert enroll_features[0].shape[0] == 2
-      # iterate through all sparse features
-      for i in range(len(enroll_features)):
-        feature = enroll_features[i]
-        # collect the values by index
-        for j in range(feature.shape[1]):
-          index = int(feature[0,j])
-          value = feature[1,j] / float(len(enroll_features))
-          # add up values
-          if index in values:
-            values[index] += value
-          else:
-            values[index] = value
+      assert all(feature.shape[0] == 2 for feature in enroll_features)
+      # collect the indices and values of all sparse features
+      indices = numpy.concatenate([feature[0] for feature in enroll_features]).astype(numpy.int64)
+      values = numpy.concatenate([feature[1] for feature in enroll_features]).astype(numpy.float64) / float(len(enroll_features))
+      # add up the values by index
+      model_indices, positions = numpy.unique(indices, return_inverse = True)
 
       # create model containing all the used indices
-      model = numpy.ndarray((2, len(values)), dtype = numpy.float64)
-
-      i = 0
-      for index in sorted(values.keys()):
-        model[0,i] = index
-        model[1,i] = values[index]
-        i += 1
+      model = numpy.ndarray((2, len(model_indices)), dtype = numpy.float64)
+      model[0] = model_indices
+      model[1] = numpy.bincount(positions, values, minlength = len(model_indices))
     else:
       model = numpy.zeros(enroll_features[0].shape, dtype = numpy.float64)
       # add up models
@@ -79,10 +77,74 @@ class LGBPHS (Tool):
     """Computes the score using the specified histogram measure; returns a similarity value (bigger -> better)"""
     sparse = model.shape[0] == 2
     if sparse:
-      # assure that the probe is sparse as well
+      # assure that the probe is sparse as well; compact (float32) histograms are converted, but sparse ones are used without a copy
       sparse_probe = utils.histogram.sparsify(probe)
+      if sparse_probe.dtype != numpy.float64:
+        sparse_probe = sparse_probe.astype(numpy.float64)
       return self.m_factor * self.m_distance_function(model[0,:], model[1,:], sparse_probe[0,:], sparse_probe[1,:])
     else:
       return self.m_factor * self.m_distance_function(model.flatten(), probe.flatten())
 
 
+  def __sparse_matrix__(self, histograms):
+    """Sparsifies each of the given histograms once and stores them as a CSR-style matrix.
+    Returned are the concatenated indices and values of all histograms, and the row (i.e., the histogram) of each entry."""
+    sparse = [utils.histogram.sparsify(histogram) for histogram in histograms]
+    rows = numpy.repeat(numpy.arange(len(sparse)), [histogram.shape[1] for histogram in sparse])
+    indices = numpy.concatenate([histogram[0] for histogram in sparse])
+    values = numpy.concatenate([histogram[1] for histogram in sparse])
+    return rows, indices, values
+
+  def __sparse_measures__(self, model, sparse_probes, probe_count):
+    """Computes the histogram measure between the given sparse model and all sparse probes of the given CSR-style matrix"""
+    rows, indices, values = sparse_probes
+    model_indices, model_values = model[0], model[1]
+    if not len(model_indices):
+      model_indices, model_values = numpy.array([-1.]), numpy.zeros((1,))
+    # find the model entries with the same indices as the probe entries
+    positions = numpy.minimum(numpy.searchsorted(model_indices, indices), len(model_indices) - 1)
+    matched = model_indices[positions] == indices
+    matched_values = numpy.where(matched, model_values[positions], 0.)
+
+    if self.m_histogram_measure == 'histogram_intersection':
+      # only the bins that are used by both histograms contribute
+      return numpy.bincount(rows, numpy.where(matched, numpy.minimum(matched_values, values), 0.), minlength = probe_count)
+    else: # 'chi_square'
+      # bins that are used by one histogram only contribute their value; for the bins used by both, correct for the according values
+      sums = matched_values + values
+      corrections = numpy.where(matched, (matched_values - values)**2 / numpy.where(sums != 0., sums, 1.) - sums, 0.)
+      return numpy.sum(model_values) + numpy.bincount(rows, values + corrections, minlength = probe_count)
+
+  def __dense_measures__(self, model, probes):
+    """Computes the histogram measure between the given flattened dense model and the rows of the given probe matrix"""
+    if self.m_histogram_measure == 'histogram_intersection':
+      return numpy.sum(numpy.minimum(probes, model), axis = 1)
+    else: # 'chi_square'
+      sums = probes + model
+      return numpy.sum(numpy.where(sums != 0., (probes - model)**2 / numpy.where(sums != 0., sums, 1.), 0.), axis = 1)
+
+  def score_matrix(self, models, probes):
+    """Computes the scores of all models and probes at once.
+    For sparse models, each probe is sparsified only once, and the measures of each model with all probes are computed by vectorized sparse operations.
+    For dense models, the probes are compared to all models in blocks of probes."""
+    if self.m_histogram_measure is None or not len(models) or not len(probes):
+      return Tool.score_matrix(self, models, probes)
+
+    scores = numpy.ndarray((len(models), len(probes)), numpy.float64)
+    sparse_models = [i for i in range(len(models)) if models[i].shape[0] == 2]
+    dense_models = [i for i in range(len(models)) if models[i].shape[0] != 2]
+
+    if sparse_models:
+      sparse_probes = self.__sparse_matrix__(probes)
+      for i in sparse_models:
+        scores[i] = self.__sparse_measures__(models[i], sparse_probes, len(probes))
+
+    if dense_models:
+      flat_models = [models[i].flatten() for i in dense_models]
+      block_size = max(1, self.m_maximum_block_size // flat_models[0].size)
+      for start in range(0, len(probes), block_size):
+        block = numpy.vstack([probe.flatten() for probe in probes[start:start+block_size]]).astype(numpy.float64)
+        for i, model in zip(dense_models, flat_models):
+          scores[i, start:start+block_size] = self.__dense_measures__(model, block)
+
+    return self.m_factor * scores
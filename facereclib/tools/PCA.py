@@ -12,6 +12,9 @@ from .. import utils
 class PCA (Tool):
   """Tool for computing eigenfaces"""
 
+  # the score_matrix function computes the scores of several models and probes at once
+  has_fast_score_matrix = True
+
   def __init__(
       self,
       subspace_dimension,  # if int, number of subspace dimensions; if float, percentage of variance to keep
@@ -114,3 +117,8 @@ class PCA (Tool):
     else:
       # single model, single probe (multiple probes have already been handled)
       return self.m_factor * self.m_distance_function(model, probe)
+
+
+  def score_matrix(self, models, probes):
+    """Computes the scores of all given models and probes, where the distances to all probes are computed at once for each model"""
+    return utils.distance_score_matrix(models, probes, self.m_distance_function, self.m_factor, self.m_model_fusion_function, self.m_variances if self.m_uses_variances else None)
@@ -12,6 +12,9 @@ from .. import utils
 class PLDA (Tool):
   """Tool chain for computing PLDA (over PCA-dimensionality reduced) features"""
 
+  # the score_matrix function computes the scores of several models and probes at once
+  has_fast_score_matrix = True
+
   def __init__(
       self,
       subspace_dimension_of_f, # Size of subspace F
@@ -59,6 +62,7 @@ class PLDA (Tool):
 
     # TODO: refactor
     self.m_init = (INIT_SEED, INIT_F_METHOD, INIT_F_RATIO, INIT_G_METHOD, INIT_G_RATIO, INIT_S_METHOD, INIT_S_RATIO)
+    self.m_cached_probes = (None, None)
 
 
   def __train_pca__(self, training_set):
@@ -89,6 +93,14 @@ class PLDA (Tool):
     client_data = numpy.vstack(client_data_list)
     return client_data
 
+  def __project_probes__(self, probes):
+    """Stacks the given probes into a 2D array and projects them into the PCA subspace (if any) at once"""
+    data = numpy.vstack(probes).astype(numpy.float64)
+    if self.m_subspace_dimension_pca is not None:
+      machine = self.m_pca_machine
+      data = numpy.dot((data - machine.input_subtract) / machine.input_divide, machine.weights) + machine.biases
+    return data
+
   def __perform_pca__(self, machine, training_set):
     """Perform PCA on data"""
     data = []
@@ -152,6 +164,29 @@ class PLDA (Tool):
     #self.m_plda_base = bob.machine.PLDABase(bob.io.HDF5File(projector_file))
     self.m_plda_machine = bob.machine.PLDAMachine(self.m_plda_base)
     self.m_plda_trainer = bob.trainer.PLDATrainer()
+    self.__prepare_scoring__()
+    # the last probes that were scored with score_matrix, and their projection
+    self.m_cached_probes = (None, None)
+
+  def __prepare_scoring__(self):
+    """Precomputes the terms of the closed-form PLDA log-likelihood that are shared by all models and probes"""
+    self.m_mu = numpy.array(self.m_plda_base.mu)
+    f = numpy.array(self.m_plda_base.f)
+    g = numpy.array(self.m_plda_base.g)
+    # covariance of a sample given its identity, i.e., the within-class subspace plus the residual noise
+    alpha_inv = numpy.diag(self.m_plda_base.sigma) + numpy.dot(g, g.T)
+    self.m_ft_beta = numpy.dot(f.T, numpy.linalg.inv(alpha_inv))
+    self.m_ft_beta_f = numpy.dot(self.m_ft_beta, f)
+    self.m_log_det_alpha_inv = numpy.linalg.slogdet(alpha_inv)[1]
+    self.m_gammas = {}
+
+  def __gamma__(self, count):
+    """Returns (and caches) the matrix gamma and the constant term of the log-likelihood of 'count' samples of the same identity"""
+    if count not in self.m_gammas:
+      gamma = numpy.linalg.inv(numpy.eye(self.m_ft_beta_f.shape[0]) + count * self.m_ft_beta_f)
+      constant = -0.5 * count * (len(self.m_mu) * numpy.log(2. * numpy.pi) + self.m_log_det_alpha_inv) + 0.5 * numpy.linalg.slogdet(gamma)[1]
+      self.m_gammas[count] = (gamma, constant)
+    return self.m_gammas[count]
 
   def enroll(self, enroll_features):
     """Enrolls the model by computing an average of the given input vectors"""
@@ -170,34 +205,51 @@ class PLDA (Tool):
 
   def score(self, model, probe):
     """Computes the PLDA score for the given model and probe"""
-    return self.score_for_multiple_probes(model, [probe])
+    return float(self.__score_projected__([model], self.__project_probes__([probe]))[0,0])
+
+  def __score_projected__(self, models, projected_probes):
+    """Computes the PLDA log-likelihood ratios of all models and the given (PCA-projected) probes in closed form.
+    For a model enrolled with n samples with weighted sum s_m and a probe with s_p = F^T.beta.(x_p - mu), the score is:
+    c(n+1) - c(n) - c(1) + 1/2 s_m^T (gamma(n+1) - gamma(n)) s_m + s_m^T gamma(n+1) s_p + 1/2 s_p^T (gamma(n+1) - gamma(1)) s_p"""
+    # probe-side terms, which are shared by all models
+    probe_terms = numpy.dot(projected_probes - self.m_mu, self.m_ft_beta.T)
+    gamma_1, constant_1 = self.__gamma__(1)
+    quadratic_probe_terms = {}
+
+    # model-side terms, which are shared by all probes
+    model_constants = numpy.ndarray((len(models),), numpy.float64)
+    model_terms = numpy.ndarray((len(models), probe_terms.shape[1]), numpy.float64)
+    quadratic_terms = numpy.ndarray((len(models), len(projected_probes)), numpy.float64)
+    for i, model in enumerate(models):
+      count = model.n_samples
+      weighted_sum = numpy.array(model.weighted_sum)
+      gamma_n, constant_n = self.__gamma__(count)
+      gamma_n1, constant_n1 = self.__gamma__(count + 1)
+      model_constants[i] = constant_n1 - constant_n - constant_1 + 0.5 * numpy.dot(weighted_sum, numpy.dot(gamma_n1 - gamma_n, weighted_sum))
+      model_terms[i] = numpy.dot(gamma_n1, weighted_sum)
+      if count not in quadratic_probe_terms:
+        quadratic_probe_terms[count] = 0.5 * numpy.sum(numpy.dot(probe_terms, gamma_n1 - gamma_1) * probe_terms, axis=1)
+      quadratic_terms[i] = quadratic_probe_terms[count]
+
+    return numpy.dot(model_terms, probe_terms.T) + model_constants[:,numpy.newaxis] + quadratic_terms
+
+  def score_matrix(self, models, probes):
+    """Computes the PLDA scores of all models and probes at once.
+    The probes are PCA-projected only once, and the model-side terms of the log-likelihood ratio are shared by all probes.
+    The projection of the probes is kept, so that it is reused when the same probes (e.g. all probes of a group) are scored with the next models."""
+    if not len(models) or not len(probes):
+      return Tool.score_matrix(self, models, probes)
+    if probes is not self.m_cached_probes[0]:
+      self.m_cached_probes = (probes, self.__project_probes__(probes))
+    return self.__score_projected__(models, self.m_cached_probes[1])
 
   def score_for_multiple_probes(self, model, probes):
     """This function computes the score between the given model and several given probe files.
-    In this base class implementation, it computes the scores for each probe file using the 'score' method,
-    and fuses the scores using the fusion method specified in the constructor of this class."""
-    n_probes = len(probes)
-    if self.m_subspace_dimension_pca is not None:
-      # project probe
-      probe_ = numpy.ndarray((n_probes, self.m_pca_machine.shape[1]), numpy.float64)
-      projected_probe = numpy.ndarray(self.m_pca_machine.shape[1], numpy.float64)
-      for i in range(n_probes):
-        self.m_pca_machine(probes[i], projected_probe)
-        probe_[i,:] = projected_probe
-      # forward
-      if self.m_score_set == 'joint_likelihood':
-        return model.forward(probe_)
-      else:
-        scores = [model.forward(probe_[i,:]) for i in range(n_probes)]
-        return self.m_score_set(scores)
+    The probes are PCA-projected at once; their scores are either computed jointly,
+    or computed separately and fused using the fusion method specified in the constructor of this class."""
+    projected_probes = self.__project_probes__(probes)
+    if self.m_score_set == 'joint_likelihood':
+      return model.forward(projected_probes)
     else:
-      # just forward
-      if self.m_score_set == 'joint_likelihood':
-        probe_ = numpy.ndarray((n_probes, self.m_pca_machine.shape[1]), numpy.float64)
-        for i in range(n_probes):
-          probe_[i,:] = probes[i]
-        return model.forward(probe_)
-      # forward
-      else:
-        scores = [model.forward(probes[i]) for i in range(n_probes)]
-        return self.m_score_set(scores)
+      scores = self.__score_projected__([model], projected_probes)[0]
+      return self.m_score_set(list(scores))
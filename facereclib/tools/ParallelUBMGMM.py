@@ -20,11 +20,52 @@
 
 import sys, os, shutil
 import argparse
+import multiprocessing
+import multiprocessing.sharedctypes
 import bob
 import numpy
 from . import UBMGMM
 from .. import utils
 
+
+# The training data and the training configuration of the processes of the local UBM training.
+# They are set by the initializer of the process pool; the training data lies in shared memory and is not copied.
+_shared = {}
+
+def _initialize_shared(data, shape, configuration):
+  _shared['data'] = numpy.frombuffer(data, numpy.float64).reshape(shape)
+  _shared['configuration'] = configuration
+
+def _kmeans_estep(task):
+  """Performs the K-Means E-step on the given shard of the shared training data and returns the zeroeth and first order statistics and the summed minimum distances."""
+  start, end, means = task
+  data = _shared['data'][start:end]
+  kmeans_machine = bob.machine.KMeansMachine(means.shape[0], means.shape[1])
+  kmeans_machine.means = means
+  kmeans_trainer = bob.trainer.KMeansTrainer()
+  t = bob.machine.KMeansMachine(means.shape[0], means.shape[1]) # Temporary Kmeans machine required for trainer initialization
+  kmeans_trainer.initialize(t, data)
+  kmeans_trainer.e_step(kmeans_machine, data)
+  return (kmeans_trainer.zeroeth_order_statistics, kmeans_trainer.first_order_statistics, kmeans_trainer.average_min_distance * (end - start))
+
+def _gmm_estep(task):
+  """Performs the GMM E-step on the given shard of the shared training data and returns the contents of the GMM statistics."""
+  start, end, means, variances, weights, variance_thresholds = task
+  update_means, update_variances, update_weights, responsibility_threshold = _shared['configuration']
+  data = _shared['data'][start:end]
+  gmm_machine = bob.machine.GMMMachine(means.shape[0], means.shape[1])
+  gmm_machine.means = means
+  gmm_machine.variances = variances
+  gmm_machine.weights = weights
+  gmm_machine.set_variance_thresholds(variance_thresholds)
+  gmm_trainer = bob.trainer.ML_GMMTrainer(update_means, update_variances, update_weights)
+  gmm_trainer.responsibilities_threshold = responsibility_threshold
+  gmm_trainer.initialize(gmm_machine, data)
+  gmm_trainer.e_step(gmm_machine, data)
+  gmm_stats = gmm_trainer.gmm_statistics
+  return (gmm_stats.t, gmm_stats.n, gmm_stats.sum_px, gmm_stats.sum_pxx, gmm_stats.log_likelihood)
+
+
 class ParallelUBMGMM():
   
   def __init__(self):
@@ -186,6 +227,8 @@ class ParallelUBMGMM():
       utils.ensure_dir(os.path.dirname(new_machine_file))
       kmeans_machine.save(bob.io.HDF5File(new_machine_file, 'w'))
       shutil.copy(new_machine_file, self.m_configuration.kmeans_file)
+      # the K-Means machine is no longer the result of a local training
+      self.m_tool_chain.__check_file__(self.__local_done_file__(self.m_configuration.kmeans_intermediate_file), True)
       utils.info("UBM training: Wrote new KMeans machine '%s'" % new_machine_file)
 
     if self.m_args.clean_intermediate and self.m_args.iteration > 0:
@@ -304,6 +347,8 @@ class ParallelUBMGMM():
       gmm_machine.save(bob.io.HDF5File(new_machine_file, 'w'))
       import shutil
       shutil.copy(new_machine_file, self.m_tool.m_gmm_filename)
+      # the GMM is no longer the result of a local training
+      self.m_tool_chain.__check_file__(self.__local_done_file__(self.m_configuration.gmm_intermediate_file), True)
 
     if self.m_args.clean_intermediate and self.m_args.iteration > 0:
       old_file = self.m_configuration.gmm_intermediate_file % (self.m_args.iteration-1)
@@ -311,6 +356,134 @@ class ParallelUBMGMM():
       shutil.rmtree(os.path.dirname(old_file))
 
 
+  def __local_pool__(self, processes):
+    """Reads all training features into shared memory and starts the given number of local processes that work on shards of these features.
+    Returns the process pool, the (start, end) frame indices of the shards and the first shard of the data."""
+    training_list = self.training_list()
+    utils.info("UBM training: loading %d training files into shared memory" % len(training_list))
+    features = [self.m_extractor.read_feature(str(feature_file)) for feature_file in training_list]
+    shape = (sum(feature.shape[0] for feature in features), features[0].shape[1])
+    shared_data = multiprocessing.sharedctypes.RawArray('d', shape[0] * shape[1])
+    data = numpy.frombuffer(shared_data, numpy.float64).reshape(shape)
+    offset = 0
+    while features:
+      # release the features as soon as they are copied
+      feature = features.pop(0)
+      data[offset : offset + feature.shape[0]] = feature
+      offset += feature.shape[0]
+
+    # split the frames into one shard per process
+    boundaries = numpy.linspace(0, shape[0], processes + 1).astype(int)
+    shards = [(boundaries[i], boundaries[i+1]) for i in range(processes) if boundaries[i+1] > boundaries[i]]
+    configuration = (self.m_tool.m_update_means, self.m_tool.m_update_variances, self.m_tool.m_update_weights, self.m_tool.m_responsibility_threshold)
+    utils.info("UBM training: starting %d local processes for %d feature vectors" % (processes, shape[0]))
+    pool = multiprocessing.Pool(processes, _initialize_shared, (shared_data, shape, configuration))
+    return pool, shards, data[shards[0][0]:shards[0][1]]
+
+
+  def __local_training__(self, processes, start_iteration, iterations, intermediate_file, result_file, done_file, load, iterate):
+    """Runs the iterations of the K-Means or GMM training in a local process pool, starting with the machine of the given iteration.
+    When finished, the final machine is copied to the result file, and the done file is written.
+    The given iterate function performs one E- and M-step on the given machine and returns the new value of the optimization criterion."""
+    new_machine_file = intermediate_file % start_iteration
+    machine = load(bob.io.HDF5File(new_machine_file))
+    pool, shards, data = self.__local_pool__(processes)
+    try:
+      previous = None
+      for iteration in range(start_iteration, iterations):
+        criterion = iterate(machine, pool, shards, data)
+        utils.info("UBM training: Performed iteration %d with result %f" % (iteration, criterion))
+
+        # save the machine of this iteration to be able to restart the training
+        new_machine_file = intermediate_file % (iteration + 1)
+        utils.ensure_dir(os.path.dirname(new_machine_file))
+        machine.save(bob.io.HDF5File(new_machine_file, 'w'))
+        if self.m_args.clean_intermediate and iteration > 0:
+          old_file = intermediate_file % (iteration-1)
+          utils.info("Removing old intermediate directory '%s'" % os.path.dirname(old_file))
+          shutil.rmtree(os.path.dirname(old_file))
+
+        # check for convergence
+        if previous is not None and abs((previous - criterion) / previous) < self.m_tool.m_training_threshold:
+          utils.info("UBM training: converged after iteration %d" % iteration)
+          break
+        previous = criterion
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
+    shutil.copy(new_machine_file, result_file)
+    utils.info("UBM training: Wrote machine '%s'" % result_file)
+    with open(done_file, 'w') as f:
+      f.write("%s\n" % new_machine_file)
+
+
+  def __local_done_file__(self, intermediate_file):
+    """Returns the name of the file that marks a finished local training with the given intermediate files.
+    The existence of the final machine file is no indicator, since the M-steps of the grid training write their machines to the same file."""
+    return os.path.join(os.path.dirname(os.path.dirname(intermediate_file)), 'local_training_done.txt')
+
+
+  def __kmeans_iteration__(self, kmeans_machine, pool, shards, data):
+    """Performs one K-Means E-step in the given process pool and the M-step on the accumulated statistics, and returns the average minimum distance."""
+    results = pool.map(_kmeans_estep, [(start, end, kmeans_machine.means) for start, end in shards])
+    # Creates the KMeansTrainer with the accumulated statistics
+    kmeans_trainer = bob.trainer.KMeansTrainer()
+    kmeans_trainer.initialize(bob.machine.KMeansMachine(kmeans_machine.dim_c, kmeans_machine.dim_d), data)
+    kmeans_trainer.zeroeth_order_statistics = sum(result[0] for result in results)
+    kmeans_trainer.first_order_statistics = sum(result[1] for result in results)
+    average_min_distance = sum(result[2] for result in results) / shards[-1][1]
+    kmeans_trainer.average_min_distance = average_min_distance
+    # Performs the M-step
+    kmeans_trainer.m_step(kmeans_machine, data) # data is not used in M-step
+    return average_min_distance
+
+
+  def __gmm_iteration__(self, gmm_machine, pool, shards, data):
+    """Performs one GMM E-step in the given process pool and the M-step on the accumulated statistics, and returns the average log likelihood."""
+    results = pool.map(_gmm_estep, [(start, end, gmm_machine.means, gmm_machine.variances, gmm_machine.weights, gmm_machine.variance_thresholds) for start, end in shards])
+    # accumulate the statistics of all shards
+    gmm_stats = bob.machine.GMMStats(gmm_machine.dim_c, gmm_machine.dim_d)
+    gmm_stats.t = int(sum(result[0] for result in results))
+    gmm_stats.n = sum(result[1] for result in results)
+    gmm_stats.sum_px = sum(result[2] for result in results)
+    gmm_stats.sum_pxx = sum(result[3] for result in results)
+    gmm_stats.log_likelihood = sum(result[4] for result in results)
+    # initialize the trainer with the accumulated statistics
+    gmm_trainer = bob.trainer.ML_GMMTrainer(self.m_tool.m_update_means, self.m_tool.m_update_variances, self.m_tool.m_update_weights)
+    gmm_trainer.responsibilities_threshold = self.m_tool.m_responsibility_threshold
+    gmm_trainer.initialize(gmm_machine, data)
+    gmm_trainer.gmm_statistics = gmm_stats
+    # Calls M-step
+    gmm_trainer.m_step(gmm_machine, data)
+    return gmm_stats.log_likelihood / gmm_stats.t
+
+
+  def kmeans_local(self, processes, force=False):
+    """Performs all iterations of the K-Means training in the given number of local processes (non-parallel).
+    The E-steps work on shards of the training data that are kept in shared memory, and their statistics are accumulated in memory."""
+    done_file = self.__local_done_file__(self.m_configuration.kmeans_intermediate_file)
+    if self.m_tool_chain.__check_file__(done_file, force) and os.path.exists(self.m_configuration.kmeans_file):
+      utils.info("UBM training: Skipping KMeans training since the file '%s' already exists" % done_file)
+      return
+
+    self.__local_training__(processes, self.m_args.kmeans_start_iteration, self.m_args.kmeans_training_iterations, self.m_configuration.kmeans_intermediate_file, self.m_configuration.kmeans_file, done_file, bob.machine.KMeansMachine, self.__kmeans_iteration__)
+
+
+  def gmm_local(self, processes, force=False):
+    """Performs all iterations of the GMM training in the given number of local processes (non-parallel).
+    The E-steps work on shards of the training data that are kept in shared memory, and their statistics are accumulated in memory."""
+    done_file = self.__local_done_file__(self.m_configuration.gmm_intermediate_file)
+    if self.m_tool_chain.__check_file__(done_file, force) and os.path.exists(self.m_tool.m_gmm_filename):
+      utils.info("UBM training: Skipping GMM training since the file '%s' already exists" % done_file)
+      return
+
+    self.__local_training__(processes, self.m_args.gmm_start_iteration, self.m_args.gmm_training_iterations, self.m_configuration.gmm_intermediate_file, self.m_tool.m_gmm_filename, done_file, bob.machine.GMMMachine, self.__gmm_iteration__)
+
+
   def gmm_project(self, indices, force=False):
     """Performs GMM projection"""
     # read UBM into the IVector class
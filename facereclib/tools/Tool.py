@@ -27,6 +27,10 @@ class Tool:
   It defines the minimum requirements for all derived tool classes.
   """
 
+  # Set this to True in derived classes, whose score_matrix function computes the scores of several models and probes more efficiently than pair-wise.
+  # The tool chain computes complete score matrices only for these tools.
+  has_fast_score_matrix = False
+
   def __init__(
       self,
       performs_projection = False, # enable if your tool will project the features
@@ -34,6 +38,7 @@ class Tool:
       split_training_features_by_client = False, # enable if your projector training needs the training files sorted by client
       use_projected_features_for_enrollment = True, # by default, the enroller used projected features for enrollment, if projection is enabled.
       requires_enroller_training = False, # enable if your enroller needs training
+      reads_training_features_on_demand = False, # enable if your projector training can handle lists of training features that are read from file only when they are accessed
 
       multiple_model_scoring = 'average', # by default, compute the average between several models and the probe
       multiple_probe_scoring = 'average', # by default, compute the average between the model and several probes
@@ -50,6 +55,7 @@ class Tool:
     self.split_training_features_by_client = split_training_features_by_client
     self.use_projected_features_for_enrollment = performs_projection and use_projected_features_for_enrollment
     self.requires_enroller_training = requires_enroller_training
+    self.reads_training_features_on_demand = reads_training_features_on_demand
     self.m_model_fusion_function = utils.score_fusion_strategy(multiple_model_scoring)
     self.m_probe_fusion_function = utils.score_fusion_strategy(multiple_probe_scoring)
     self._kwargs = kwargs
@@ -99,6 +105,17 @@ class Tool:
       return self.score(model, probes)
 
 
+  def score_matrix(self, models, probes):
+    """This function computes the scores between all given models and all given probes and returns them as a 2D numpy.ndarray of shape (len(models), len(probes)).
+    In this base class implementation, it calls the 'score' method for each pair of model and probe.
+    Overwrite this function in derived classes, if the scores for several models and probes can be computed more efficiently at once."""
+    scores = numpy.ndarray((len(models), len(probes)), numpy.float64)
+    for i, model in enumerate(models):
+      for j, probe in enumerate(probes):
+        scores[i,j] = self.score(model, probe)
+    return scores
+
+
   ############################################################
   ### Special functions that might be overwritten on need
   ############################################################
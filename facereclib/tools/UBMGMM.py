@@ -4,6 +4,8 @@
 
 import bob
 import numpy
+import random
+import time
 
 from .Tool import Tool
 from .. import utils
@@ -11,6 +13,9 @@ from .. import utils
 class UBMGMM (Tool):
   """Tool for computing Universal Background Models and Gaussian Mixture Models of the features"""
 
+  # the score_matrix function computes the linear scores of several models and probes at once
+  has_fast_score_matrix = True
+
   def __init__(
       self,
       # parameters for the GMM
@@ -24,6 +29,10 @@ class UBMGMM (Tool):
       update_means = True,
       update_variances = True,
       normalize_before_k_means = True,  # Normalize the input features before running K-Means
+      training_chunk_size = None,       # If given, the UBM is trained out-of-core, reading only this number of training files at a time
+      k_means_trainer = 'batch',        # The K-Means training algorithm, 'batch' or 'mini-batch' (the latter is not available for the out-of-core training)
+      k_means_mini_batch_size = 10000,  # The number of feature vectors per iteration of the mini-batch K-Means
+      k_means_seeding_size = 100000,    # The number of feature vectors used for the k-means++ seeding of the mini-batch K-Means
       # parameters of the GMM enrollment
       relevance_factor = 4,         # Relevance factor as described in Reynolds paper
       gmm_enroll_iterations = 1,    # Number of iterations for the enrollment phase
@@ -39,6 +48,7 @@ class UBMGMM (Tool):
         self,
         performs_projection = True,
         use_projected_features_for_enrollment = False,
+        reads_training_features_on_demand = training_chunk_size is not None,
 
         number_of_gaussians = number_of_gaussians,
         k_means_training_iterations = k_means_training_iterations,
@@ -49,6 +59,10 @@ class UBMGMM (Tool):
         update_means = update_means,
         update_variances = update_variances,
         normalize_before_k_means = normalize_before_k_means,
+        training_chunk_size = training_chunk_size,
+        k_means_trainer = k_means_trainer,
+        k_means_mini_batch_size = k_means_mini_batch_size,
+        k_means_seeding_size = k_means_seeding_size,
         relevance_factor = relevance_factor,
         gmm_enroll_iterations = gmm_enroll_iterations,
         responsibility_threshold = responsibility_threshold,
@@ -69,70 +83,87 @@ class UBMGMM (Tool):
     self.m_update_means = update_means
     self.m_update_variances = update_variances
     self.m_normalize_before_k_means = normalize_before_k_means
+    self.m_training_chunk_size = training_chunk_size
+    if k_means_trainer not in ('batch', 'mini-batch'):
+      raise ValueError("The K-Means trainer '%s' is not known; use 'batch' or 'mini-batch'" % k_means_trainer)
+    if k_means_trainer == 'mini-batch' and training_chunk_size is not None:
+      raise ValueError("The mini-batch K-Means requires all training data in memory and cannot be combined with the out-of-core training; set training_chunk_size = None or use the 'batch' K-Means trainer")
+    self.m_k_means_trainer = k_means_trainer
+    self.m_k_means_mini_batch_size = k_means_mini_batch_size
+    self.m_k_means_seeding_size = k_means_seeding_size
     self.m_relevance_factor = relevance_factor
     self.m_gmm_enroll_iterations = gmm_enroll_iterations
     self.m_init_seed = INIT_SEED
     self.m_responsibility_threshold = responsibility_threshold
     self.m_scoring_function = scoring_function
+    # the scores are computed at once with the linear scoring only
+    if scoring_function is not bob.machine.linear_scoring:
+      self.has_fast_score_matrix = False
     
 
 
   #######################################################
   ################ UBM training #########################
-  def __normalize_std_array__(self, array):
-    """Applies a unit variance normalization to an array"""
-
-    # Initializes variables
-    n_samples = array.shape[0]
-    length = array.shape[1]
-    mean = numpy.ndarray((length,), 'float64')
-    std = numpy.ndarray((length,), 'float64')
-
-    mean.fill(0)
-    std.fill(0)
-
-    # Computes mean and variance
-    for k in range(n_samples):
-      x = array[k,:].astype('float64')
-      mean += x
-      std += (x ** 2)
-
-    mean /= n_samples
-    std /= n_samples
-    std -= (mean ** 2)
-    std = std ** 0.5 # sqrt(std)
-
-    ar_std_list = []
-    for k in range(n_samples):
-      ar_std_list.append(array[k,:].astype('float64') / std)
-    ar_std = numpy.vstack(ar_std_list)
+  def __std_statistics__(self, array, statistics = None, chunk_size = 100000):
+    """Accumulates the number, the sum and the sum of squares of the feature vectors in the given array, in chunks of the given number of feature vectors.
+    To compute the statistics of data that does not fit into memory, pass the returned statistics again with the next part of the data."""
+    if statistics is None:
+      statistics = (0, numpy.zeros((array.shape[1],), 'float64'), numpy.zeros((array.shape[1],), 'float64'))
+    count, sums, squares = statistics
+    for start in range(0, array.shape[0], chunk_size):
+      chunk = array[start : start + chunk_size].astype('float64')
+      sums += numpy.sum(chunk, axis=0)
+      chunk **= 2
+      squares += numpy.sum(chunk, axis=0)
+    return (count + array.shape[0], sums, squares)
+
+
+  def __std_from_statistics__(self, statistics):
+    """Computes the standard deviation from the accumulated statistics"""
+    count, sums, squares = statistics
+    mean = sums / count
+    return (squares / count - mean ** 2) ** 0.5
+
+
+  def __normalize_std_array__(self, array, in_place = False):
+    """Applies a unit variance normalization to an array.
+    If in_place is enabled and the array is of type float64, the array itself is normalized, otherwise a normalized copy is returned."""
+    std = self.__std_from_statistics__(self.__std_statistics__(array))
+
+    if in_place and array.dtype == numpy.float64:
+      ar_std = array
+    else:
+      ar_std = array.astype('float64')
+    ar_std /= std
 
     return (ar_std,std)
 
 
   def __multiply_vectors_by_factors__(self, matrix, vector):
     """Used to unnormalize some data"""
-    for i in range(0, matrix.shape[0]):
-      for j in range(0, matrix.shape[1]):
-        matrix[i, j] *= vector[j]
+    matrix *= vector
 
 
   #######################################################
   ################ UBM training #########################
 
   def _train_projector_using_array(self, array):
+    """Trains the UBM using all feature vectors in the given array.
+    To avoid a normalized copy of all training data, a float64 array is normalized in-place before K-Means and unnormalized afterwards.
+    Hence, the caller's array is modified during the training and, up to rounding errors, restored before the GMM training.
+    Pass a copy if the caller needs the exact values, or if the array is shared with other threads."""
 
     utils.debug(" .... Training with %d feature vectors" % array.shape[0])
 
     # Computes input size
     input_size = array.shape[1]
 
-    # Normalizes the array if required
+    # Normalizes the array if required; the normalization of the given array is undone in-place before the GMM training
     utils.debug(" .... Normalizing the array")
     if not self.m_normalize_before_k_means:
       normalized_array = array
     else:
-      normalized_array, std_array = self.__normalize_std_array__(array)
+      normalized_array, std_array = self.__normalize_std_array__(array, in_place = True)
 
 
     # Creates the machines (KMeans and GMM)
@@ -140,15 +171,21 @@ class UBMGMM (Tool):
     kmeans = bob.machine.KMeansMachine(self.m_gaussians, input_size)
     self.m_ubm = bob.machine.GMMMachine(self.m_gaussians, input_size)
 
-    # Creates the KMeansTrainer
-    kmeans_trainer = bob.trainer.KMeansTrainer()
-    kmeans_trainer.rng = bob.core.random.mt19937(self.m_init_seed)
-    kmeans_trainer.convergence_threshold = self.m_training_threshold
-    kmeans_trainer.max_iterations = self.m_gmm_training_iterations
-
-    # Trains using the KMeansTrainer
     utils.info("  -> Training K-Means")
-    kmeans_trainer.train(kmeans, normalized_array)
+    start_time = time.time()
+    if self.m_k_means_trainer == 'mini-batch':
+      kmeans.means, iterations = self.__mini_batch_k_means__(normalized_array)
+      utils.info("  -> Mini-batch K-Means finished after %d iterations in %.2f seconds" % (iterations, time.time() - start_time))
+    else:
+      # Creates the KMeansTrainer
+      kmeans_trainer = bob.trainer.KMeansTrainer()
+      kmeans_trainer.rng = bob.core.random.mt19937(self.m_init_seed)
+      kmeans_trainer.convergence_threshold = self.m_training_threshold
+      kmeans_trainer.max_iterations = self.m_gmm_training_iterations
+
+      # Trains using the KMeansTrainer
+      kmeans_trainer.train(kmeans, normalized_array)
+      utils.info("  -> K-Means finished in %.2f seconds with an average distance of %f" % (time.time() - start_time, kmeans_trainer.average_min_distance))
 
     [variances, weights] = kmeans.get_variances_and_weights_for_each_cluster(normalized_array)
     means = kmeans.means
@@ -158,6 +195,9 @@ class UBMGMM (Tool):
     if self.m_normalize_before_k_means:
       self.__multiply_vectors_by_factors__(means, std_array)
       self.__multiply_vectors_by_factors__(variances, std_array ** 2)
+      if normalized_array is array:
+        self.__multiply_vectors_by_factors__(array, std_array)
+      del normalized_array
 
     # Initializes the GMM
     self.m_ubm.means = means
@@ -174,6 +214,183 @@ class UBMGMM (Tool):
     trainer.train(self.m_ubm, array)
 
 
+  def __training_chunks__(self, features):
+    """Iterates over the given features and returns them in chunks of m_training_chunk_size features, each stacked into one float64 array."""
+    chunk = []
+    for feature in features:
+      chunk.append(feature)
+      if len(chunk) == self.m_training_chunk_size:
+        yield numpy.vstack(chunk).astype(numpy.float64)
+        chunk = []
+    if chunk:
+      yield numpy.vstack(chunk).astype(numpy.float64)
+
+
+  def __kmeans_statistics__(self, means, data, frames_per_block = 10000):
+    """Assigns each feature vector of the given data to its closest mean.
+    Returns the number, the sum and the sum of squares of the assigned feature vectors per mean, as well as the sum of the squared distances to the closest means."""
+    zeroeth = numpy.zeros((means.shape[0],))
+    first = numpy.zeros(means.shape)
+    second = numpy.zeros(means.shape)
+    distance = 0.
+    squared_means = numpy.sum(means ** 2, axis=1)
+    for start in range(0, data.shape[0], frames_per_block):
+      x = data[start : start + frames_per_block]
+      # squared Euclidean distances between all feature vectors and all means
+      distances = squared_means - 2. * numpy.dot(x, means.T) + numpy.sum(x ** 2, axis=1)[:,numpy.newaxis]
+      labels = numpy.argmin(distances, axis=1)
+      distance += numpy.sum(distances[numpy.arange(len(labels)), labels])
+      # sum up the feature vectors per mean, by sorting them according to their means
+      counts = numpy.bincount(labels, minlength = means.shape[0])
+      used = numpy.flatnonzero(counts)
+      offsets = (numpy.cumsum(counts) - counts)[used]
+      sorted_x = x[numpy.argsort(labels, kind = 'mergesort')]
+      zeroeth += counts
+      first[used] += numpy.add.reduceat(sorted_x, offsets)
+      second[used] += numpy.add.reduceat(sorted_x ** 2, offsets)
+    return (zeroeth, first, second, distance)
+
+
+  def __k_means_plus_plus__(self, data, random_state):
+    """Selects the initial means from the given data using the k-means++ seeding, i.e., each new mean is selected with a probability proportional to the squared distance to the closest already selected mean."""
+    means = numpy.ndarray((self.m_gaussians, data.shape[1]), 'float64')
+    squared_norms = numpy.sum(data ** 2, axis=1)
+    means[0] = data[random_state.randint(data.shape[0])]
+    distances = squared_norms - 2. * numpy.dot(data, means[0]) + numpy.sum(means[0] ** 2)
+    for k in range(1, self.m_gaussians):
+      cumulative = numpy.cumsum(numpy.maximum(distances, 0.))
+      index = numpy.searchsorted(cumulative, random_state.uniform(0., cumulative[-1]))
+      means[k] = data[min(index, data.shape[0] - 1)]
+      distances = numpy.minimum(distances, squared_norms - 2. * numpy.dot(data, means[k]) + numpy.sum(means[k] ** 2))
+    return means
+
+
+  def __mini_batch_k_means__(self, data):
+    """Trains the K-Means means on randomly selected mini-batches of the given data, after the k-means++ seeding on a quasi-random subset of the data.
+    Each mean is the running average of all feature vectors that were assigned to it so far.
+    Returns the means and the number of performed iterations."""
+    random_state = numpy.random.RandomState(self.m_init_seed)
+    subset = data[utils.quasi_random_indices(data.shape[0], self.m_k_means_seeding_size)]
+    seeding_time = time.time()
+    means = self.__k_means_plus_plus__(subset, random_state)
+    utils.debug(" .... k-means++ seeding on %d feature vectors took %.2f seconds" % (subset.shape[0], time.time() - seeding_time))
+    del subset
+
+    batch_size = min(self.m_k_means_mini_batch_size, data.shape[0])
+    # the weight of each mini-batch in the smoothed average distance that is used to check convergence
+    smoothing = min(2. * batch_size / (data.shape[0] + 1), 1.)
+    counts = numpy.zeros((self.m_gaussians,))
+    average_distance = None
+    iterations = 0
+    for iteration in range(self.m_k_means_training_iterations):
+      iterations += 1
+      batch = data[random_state.randint(0, data.shape[0], batch_size)]
+      zeroeth, first, second, distance = self.__kmeans_statistics__(means, batch)
+      # update the running averages of the means that got feature vectors assigned
+      used = zeroeth > 0
+      counts[used] += zeroeth[used]
+      means[used] += (first[used] - zeroeth[used,numpy.newaxis] * means[used]) / counts[used,numpy.newaxis]
+
+      # check for convergence
+      if average_distance is None:
+        average_distance = distance / batch_size
+      else:
+        previous = average_distance
+        average_distance = (1. - smoothing) * average_distance + smoothing * distance / batch_size
+        if abs((previous - average_distance) / previous) < self.m_training_threshold:
+          break
+    if average_distance is not None:
+      utils.debug(" .... Mini-batch K-Means: smoothed average distance %f" % average_distance)
+    return (means, iterations)
+
+
+  def _train_projector_using_chunks(self, iterate_features):
+    """Trains the UBM out-of-core, reading the training features in chunks of m_training_chunk_size files during several passes over the data.
+    Hence, the required memory does not depend on the number of training features.
+    The given function needs to return a new iterator over all training features, it is called once for each pass."""
+    # first pass: count the feature vectors and compute the normalization factors
+    statistics = None
+    for chunk in self.__training_chunks__(iterate_features()):
+      statistics = self.__std_statistics__(chunk, statistics)
+      if statistics[0] == chunk.shape[0]:
+        # keep the first non-empty chunk as sample data for the initialization of the GMM trainer
+        sample_chunk = chunk
+    if statistics is None or not statistics[0]:
+      raise ValueError("The UBM cannot be trained since no training feature vectors were given")
+    count, input_size = statistics[0], len(statistics[1])
+    utils.debug(" .... Training out-of-core with %d feature vectors" % count)
+    if self.m_normalize_before_k_means:
+      std_array = self.__std_from_statistics__(statistics)
+    else:
+      std_array = numpy.ones((input_size,))
+
+    # second pass: initialize K-Means with randomly selected feature vectors
+    utils.debug(" .... Selecting initial means")
+    selected = numpy.array(sorted(random.Random(self.m_init_seed).sample(xrange(count), self.m_gaussians)))
+    initial_means = []
+    offset = 0
+    for chunk in self.__training_chunks__(iterate_features()):
+      indices = selected[(selected >= offset) & (selected < offset + chunk.shape[0])]
+      initial_means.append(chunk[indices - offset] / std_array)
+      offset += chunk.shape[0]
+    means = numpy.vstack(initial_means)
+
+    # K-Means iterations
+    utils.info("  -> Training K-Means")
+    previous = None
+    for iteration in range(self.m_k_means_training_iterations):
+      zeroeth, first, distance = 0., 0., 0.
+      for chunk in self.__training_chunks__(iterate_features()):
+        statistics = self.__kmeans_statistics__(means, chunk / std_array)
+        zeroeth += statistics[0]
+        first += statistics[1]
+        distance += statistics[3]
+      # M-step; means without any assigned feature vector are kept
+      used = zeroeth > 0
+      means[used] = first[used] / zeroeth[used,numpy.newaxis]
+      average_distance = distance / count
+      utils.debug(" .... K-Means iteration %d: average distance %f" % (iteration, average_distance))
+      if previous is not None and abs((previous - average_distance) / previous) < self.m_training_threshold:
+        break
+      previous = average_distance
+
+    # last pass: compute variances and weights of the clusters
+    zeroeth, first, second = 0., 0., 0.
+    for chunk in self.__training_chunks__(iterate_features()):
+      statistics = self.__kmeans_statistics__(means, chunk / std_array)
+      zeroeth += statistics[0]
+      first += statistics[1]
+      second += statistics[2]
+    counts = numpy.maximum(zeroeth, 1)[:,numpy.newaxis]
+    variances = second / counts - (first / counts) ** 2
+    weights = zeroeth / count
+
+    # Initializes the GMM, undoing the normalization
+    self.m_ubm = bob.machine.GMMMachine(self.m_gaussians, input_size)
+    self.m_ubm.means = means * std_array
+    self.m_ubm.variances = variances * std_array ** 2
+    self.m_ubm.weights = weights
+    self.m_ubm.set_variance_thresholds(self.m_variance_threshold)
+
+    # Trains the GMM, accumulating the statistics of all chunks for each E-step
+    utils.info("  -> Training GMM")
+    trainer = bob.trainer.ML_GMMTrainer(self.m_update_means, self.m_update_variances, self.m_update_weights)
+    previous = None
+    for iteration in range(self.m_gmm_training_iterations):
+      gmm_stats = bob.machine.GMMStats(self.m_gaussians, input_size)
+      for chunk in self.__training_chunks__(iterate_features()):
+        self.m_ubm.acc_statistics(chunk, gmm_stats)
+      average_log_likelihood = gmm_stats.log_likelihood / gmm_stats.t
+      utils.debug(" .... GMM iteration %d: average log-likelihood %f" % (iteration, average_log_likelihood))
+      # M-step
+      trainer.initialize(self.m_ubm, sample_chunk)
+      trainer.gmm_statistics = gmm_stats
+      trainer.m_step(self.m_ubm, sample_chunk)
+      if previous is not None and abs((previous - average_log_likelihood) / previous) < self.m_training_threshold:
+        break
+      previous = average_log_likelihood
+
+
   def _save_projector(self, projector_file):
     """Save projector to file"""
     # Saves the UBM to file
@@ -186,10 +403,13 @@ class UBMGMM (Tool):
 
     utils.info("  -> Training UBM model with %d training files" % len(train_features))
 
-    # Loads the data into an array
-    array = numpy.vstack(train_features)
+    if self.m_training_chunk_size is not None:
+      self._train_projector_using_chunks(lambda: iter(train_features))
+    else:
+      # Loads the data into an array
+      array = numpy.vstack(train_features)
 
-    self._train_projector_using_array(array)
+      self._train_projector_using_array(array)
 
     self._save_projector(projector_file)
 
@@ -231,6 +451,69 @@ class UBMGMM (Tool):
 
     return self._project_using_array(feature_array)
 
+
+  def _project_using_arrays(self, arrays, frames_per_block = 10000):
+    """Computes the GMM statistics of several 2D arrays of feature vectors at once.
+    The frames of all arrays are stacked, and the log-likelihoods of blocks of frames for all Gaussians are computed with matrix products.
+    The responsibilities are obtained with a vectorized log-sum-exp and accumulated separately for each array."""
+    utils.debug(" .... Projecting %d arrays of feature vectors" % len(arrays))
+    means = self.m_ubm.means
+    variances = self.m_ubm.variances
+    inverse_variances = 1. / variances
+    scaled_means = means * inverse_variances
+    # the parts of the log-likelihoods that do not depend on the frames, including the log-weights
+    log_constants = numpy.log(self.m_ubm.weights) - 0.5 * (means.shape[1] * numpy.log(2. * numpy.pi) + numpy.sum(numpy.log(variances), axis=1) + numpy.sum(means * scaled_means, axis=1))
+
+    arrays = [numpy.reshape(array, (-1, means.shape[1])) for array in arrays]
+    data = numpy.vstack(arrays).astype(numpy.float64)
+    # the first frame of each array in the stacked data
+    boundaries = numpy.cumsum([0] + [array.shape[0] for array in arrays])
+
+    n = numpy.zeros((len(arrays), means.shape[0]))
+    sum_px = numpy.zeros((len(arrays),) + means.shape)
+    sum_pxx = numpy.zeros((len(arrays),) + means.shape)
+    log_likelihood = numpy.zeros((len(arrays),))
+
+    for start in range(0, data.shape[0], frames_per_block):
+      end = min(start + frames_per_block, data.shape[0])
+      x = data[start:end]
+      xx = x ** 2
+      # log-likelihoods of the weighted Gaussians for all frames in the block
+      log_p = log_constants + numpy.dot(x, scaled_means.T) - 0.5 * numpy.dot(xx, inverse_variances.T)
+      maximum = numpy.max(log_p, axis=1)
+      log_px = maximum + numpy.log(numpy.sum(numpy.exp(log_p - maximum[:,numpy.newaxis]), axis=1))
+      responsibilities = numpy.exp(log_p - log_px[:,numpy.newaxis])
+
+      # accumulate the statistics of all arrays that have frames in this block
+      first = numpy.searchsorted(boundaries, start, side='right') - 1
+      last = numpy.searchsorted(boundaries, end - 1, side='right') - 1
+      for i in range(first, last+1):
+        s = max(boundaries[i], start) - start
+        e = min(boundaries[i+1], end) - start
+        gamma = responsibilities[s:e]
+        n[i] += numpy.sum(gamma, axis=0)
+        sum_px[i] += numpy.dot(gamma.T, x[s:e])
+        sum_pxx[i] += numpy.dot(gamma.T, xx[s:e])
+        log_likelihood[i] += numpy.sum(log_px[s:e])
+
+    # create independent statistics objects
+    retval = []
+    for i in range(len(arrays)):
+      gmm_stats = bob.machine.GMMStats(self.m_ubm.dim_c, self.m_ubm.dim_d)
+      gmm_stats.t = int(boundaries[i+1] - boundaries[i])
+      gmm_stats.n = n[i]
+      gmm_stats.sum_px = sum_px[i]
+      gmm_stats.sum_pxx = sum_pxx[i]
+      gmm_stats.log_likelihood = log_likelihood[i]
+      retval.append(gmm_stats)
+    return retval
+
+
+  def project_batch(self, feature_arrays):
+    """Computes GMM statistics against a UBM for a list of 2D numpy.ndarray's of feature vectors at once.
+    In opposition to project(), this function returns a list of independent GMMStats objects."""
+    return self._project_using_arrays(feature_arrays)
+
   def _enroll_using_array(self, array):
     utils.debug(" .... Enrolling with %d feature vectors" % array.shape[0])
 
@@ -260,6 +543,25 @@ class UBMGMM (Tool):
     """Computes the score for the given model and the given probe using the scoring function from the config file"""
     return self.m_scoring_function([model], self.m_ubm, [probe], [], frame_length_normalisation = True)[0][0]
 
+  def _linear_scoring_matrix(self, model_supervectors, probe_stats, channel_offsets = None):
+    """Computes the frame-length normalized linear scores between all given model mean supervectors and all given GMM statistics with a single matrix product.
+    If given, the channel offset supervectors of the probes are subtracted from the first order statistics."""
+    ubm_means = self.m_ubm.mean_supervector
+    # the mean offsets of all models, scaled by the UBM variances
+    models = (numpy.vstack(model_supervectors) - ubm_means) / self.m_ubm.variance_supervector
+    # the centered and normalized first order statistics of all probes
+    n = numpy.vstack([numpy.repeat(stats.n, self.m_ubm.dim_d) for stats in probe_stats])
+    centers = ubm_means if channel_offsets is None else ubm_means + numpy.vstack(channel_offsets)
+    probes = (numpy.vstack([stats.sum_px.flatten() for stats in probe_stats]) - n * centers) / numpy.array([[stats.t] for stats in probe_stats], numpy.float64)
+    return numpy.dot(models, probes.T)
+
+  def score_matrix(self, models, probes):
+    """Computes the linear scores between all given models and all given probes at once.
+    For other scoring functions than bob.machine.linear_scoring, the scores are computed pair-wise."""
+    if self.m_scoring_function is not bob.machine.linear_scoring or not len(models) or not len(probes):
+      return Tool.score_matrix(self, models, probes)
+    return self._linear_scoring_matrix([model.mean_supervector for model in models], probes)
+
   def score_for_multiple_probes(self, model, probes):
     """This function computes the score between the given model and several given probe files."""
     utils.warn("Please verify that this function is correct")
@@ -272,6 +574,9 @@ class UBMGMM (Tool):
 class UBMGMMRegular (UBMGMM):
   """Tool chain for computing Universal Background Models and Gaussian Mixture Models of the features"""
 
+  # the probes are feature arrays, which are scored pair-wise
+  has_fast_score_matrix = False
+
   def __init__(self, **kwargs):
     """Initializes the local UBM-GMM tool chain with the given file selector object"""
     utils.warn("This class must be checked. Please verify that I didn't do any mistake here. I had to rename 'train_projector' into a 'train_enroller'!")
@@ -315,6 +620,10 @@ class UBMGMMRegular (UBMGMM):
       score += model.forward(probe[i,:]) - self.m_ubm.forward(probe[i,:])
     return score/probe.shape[0]
 
+  def score_matrix(self, models, probes):
+    """The probes are feature arrays, so the scores are computed pair-wise"""
+    return Tool.score_matrix(self, models, probes)
+
 
 
 
@@ -369,6 +678,11 @@ class UBMGMMVideo(UBMGMM):
     array = numpy.vstack([data for data in frame_selector(frame_container)])
     return self._project_using_array(array)
 
+  def project_batch(self, frame_containers):
+    """Computes GMM statistics against a UBM for each of the given video.FrameContainers"""
+    # the statistics of project() are shared, so they need to be copied
+    return [bob.machine.GMMStats(self.project(frame_container)) for frame_container in frame_containers]
+
 
   def enroll(self, frame_containers):
     """Enrolls a GMM using MAP adaptation, given a list of video.FrameContainers"""
@@ -5,6 +5,7 @@
 
 import video
 import histogram
+import scores
 import tests
 import resources
 from logger import add_logger_command_line_option, set_verbosity_level, add_bob_handlers, debug, info, warn, error
@@ -14,6 +15,7 @@ from grid import GridParameters
 import os
 import bob
 import numpy
+import scipy.spatial
 
 def ensure_dir(dirname):
   """ Creates the directory dirname if it does not already exist,
@@ -28,8 +30,8 @@ def score_fusion_strategy(strategy_name = 'avarage'):
   try:
     return {
         'average' : numpy.average,
-        'min' : min,
-        'max' : max,
+        'min' : numpy.min,
+        'max' : numpy.max,
         'median' : numpy.median
     }[strategy_name]
   except KeyError:
@@ -37,6 +39,37 @@ def score_fusion_strategy(strategy_name = 'avarage'):
     return None
 
 
+def distance_matrix(distance_function, a, b, variances = None):
+  """Computes the distances between all rows of the 2D arrays a and b using the given distance function.
+  Distance functions of scipy.spatial.distance are evaluated for all pairs of rows at once.
+  If variances are given, they are passed as third argument to the distance function."""
+  name = getattr(distance_function, '__name__', None)
+  if distance_function is getattr(scipy.spatial.distance, str(name), None):
+    if variances is None and name in ('braycurtis', 'canberra', 'chebyshev', 'cityblock', 'correlation', 'cosine', 'euclidean', 'sqeuclidean'):
+      return scipy.spatial.distance.cdist(a, b, name)
+    if variances is not None and name == 'seuclidean':
+      return scipy.spatial.distance.cdist(a, b, name, V = variances)
+  # any other distance function is called for each pair of rows
+  if variances is None:
+    return scipy.spatial.distance.cdist(a, b, distance_function)
+  return scipy.spatial.distance.cdist(a, b, lambda x, y: distance_function(x, y, variances))
+
+
+def distance_score_matrix(models, probes, distance_function, factor, model_fusion_function, variances = None):
+  """Computes the scores of all given models and probes as the (factorized) distances, where the distances to all probes are computed at once for each model.
+  Models containing several features (i.e., 2D models) are scored by fusing the scores of their features with the given model fusion function."""
+  probe_matrix = numpy.vstack(probes)
+  scores = numpy.ndarray((len(models), len(probes)), numpy.float64)
+  for i, model in enumerate(models):
+    distances = factor * distance_matrix(distance_function, numpy.atleast_2d(model), probe_matrix, variances)
+    if len(model.shape) == 2:
+      # we have multiple models, so we fuse the scores of all features of the model
+      scores[i,:] = model_fusion_function(distances, axis=0)
+    else:
+      scores[i,:] = distances[0]
+  return scores
+
+
 def gray_channel(image, channel = 'gray'):
   """Returns the desired channel of the given image. Currently, gray, red, green and blue channels are supported."""
   if image.ndim == 2:
@@ -19,16 +19,17 @@
 
 import numpy
 
-def sparsify(array):
-  """This function generates a sparse histogram from a non-sparse one."""
+def sparsify(array, dtype = numpy.float64):
+  """This function generates a sparse histogram from a non-sparse one.
+  The sparse histogram is a 2D array containing the indices of the non-zero bins in the first row and their values in the second row.
+  With dtype = numpy.float32, a compact sparse histogram of half the size is generated; all indices need to be exactly representable in the given data type."""
   if len(array.shape) == 2 and array.shape[0] == 2:
     return array
   assert len(array.shape) == 1
-  indices = []
-  values = []
-  for i in range(array.shape[0]):
-    if array[i] != 0.:
-      indices.append(i)
-      values.append(array[i])
-
-  return numpy.array([indices, values], dtype = numpy.float64)
+  if array.shape[0] > 2**(numpy.finfo(dtype).nmant + 1):
+    raise ValueError("The histogram with %d bins is too long to store its indices in a sparse histogram of type %s" % (array.shape[0], numpy.dtype(dtype).name))
+  indices = numpy.nonzero(array)[0]
+  sparse = numpy.ndarray((2, len(indices)), dtype = dtype)
+  sparse[0] = indices
+  sparse[1] = array[indices]
+  return sparse
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Manuel Guenther <Manuel.Guenther@idiap.ch>
+
+"""Reading and writing of score files.
+Besides the usual four-column text format, score files can be stored in a compact binary format.
+The binary format stores the four columns separately: the claimed client id (i.e., the client id of the model), the real client id of the probe and the path of the probe are stored as indices into tables of unique values, and the scores are stored as float64.
+All reader functions of this module detect the format automatically, so that they can be used as a replacement of the according functions in bob.measure.load."""
+
+import os
+import threading
+import Queue
+import numpy
+import bob
+
+# binary score files are written with numpy.savez, which creates zip archives
+BINARY_MAGIC = 'PK\x03\x04'
+
+def is_binary(file_name):
+  """Returns True if the given score file is stored in the binary format."""
+  with open(file_name, 'rb') as f:
+    return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+class _Table:
+  """Incrementally builds a table of unique values (stored as strings) and translates values into indices of this table.
+  The values are kept in the order in which they are added first."""
+
+  def __init__(self):
+    self.m_index = {}
+    self.m_values = []
+
+  def index(self, value):
+    """Returns the index of the given value, which is added to the table if required."""
+    index = self.m_index.get(value)
+    if index is None:
+      index = self.m_index[value] = len(self.m_values)
+      self.m_values.append(str(value))
+    return index
+
+  def indices(self, values):
+    """Returns the indices of all given values as an int32 array."""
+    return numpy.array([self.index(value) for value in values], dtype = numpy.int32)
+
+  def table(self):
+    """Returns the table of all values that were added so far."""
+    return numpy.array(self.m_values, dtype = str)
+
+def save_binary(file_name, claimed_ids, real_ids, paths, scores):
+  """Writes the given columns of scores to the given file in binary format."""
+  tables = (_Table(), _Table(), _Table())
+  save_binary_data(file_name, {
+      'claimed' : tables[0].indices(claimed_ids), 'claimed_table' : tables[0].table(),
+      'real' : tables[1].indices(real_ids), 'real_table' : tables[1].table(),
+      'path' : tables[2].indices(paths), 'path_table' : tables[2].table(),
+      'scores' : numpy.asarray(scores, dtype = numpy.float64)
+  })
+
+def save_binary_data(file_name, data):
+  """Writes the given dictionary of tables, indices and scores, as returned by load_binary, to the given file in binary format."""
+  with open(file_name, 'wb') as f:
+    numpy.savez(f, **data)
+
+def load_binary(file_name):
+  """Reads the given binary score file.
+  It returns a dictionary with the tables of claimed ids, real ids and paths ('claimed_table', 'real_table', 'path_table'),
+  the indices into these tables ('claimed', 'real', 'path') and the 'scores'."""
+  with open(file_name, 'rb') as f:
+    data = numpy.load(f)
+    return dict((key, data[key]) for key in data.files)
+
+def merge_binary(file_names, output_file):
+  """Concatenates the given binary score files into the given output file.
+  The tables of the files are merged, and the indices of each file are remapped to the merged tables."""
+  tables = dict((key, _Table()) for key in ('claimed', 'real', 'path'))
+  columns = dict((key, []) for key in tables)
+  scores = []
+  for file_name in file_names:
+    data = load_binary(file_name)
+    for key in tables:
+      # map the indices of the table of the current file to the indices of the merged table
+      remap = tables[key].indices(data[key + '_table'])
+      columns[key].append(remap[data[key]] if len(remap) else data[key].astype(numpy.int32))
+    scores.append(data['scores'])
+
+  merged = {'scores' : numpy.concatenate(scores) if scores else numpy.ndarray((0,), numpy.float64)}
+  for key in tables:
+    merged[key] = numpy.concatenate(columns[key]) if columns[key] else numpy.ndarray((0,), numpy.int32)
+    merged[key + '_table'] = tables[key].table()
+  save_binary_data(output_file, merged)
+
+
+def _positives(data):
+  """Returns a boolean array that defines, which scores of the given binary data are client scores."""
+  # compare the tables only, instead of all claimed and real ids
+  claimed_index = dict((value, index) for index, value in enumerate(data['claimed_table']))
+  real_to_claimed = numpy.array([claimed_index.get(value, -1) for value in data['real_table']], dtype = numpy.int32)
+  if not len(real_to_claimed):
+    return numpy.ndarray((0,), bool)
+  return real_to_claimed[data['real']] == data['claimed']
+
+
+def split_four_column(file_name):
+  """Reads the given score file (in text or in binary format) and returns the negative and the positive scores."""
+  if not is_binary(file_name):
+    return bob.measure.load.split_four_column(file_name)
+  data = load_binary(file_name)
+  positives = _positives(data)
+  return (data['scores'][~positives], data['scores'][positives])
+
+def cmc_four_column(file_name):
+  """Reads the given score file (in text or in binary format) and returns the negative and the positive scores for each probe, as required to compute CMC curves."""
+  if not is_binary(file_name):
+    return bob.measure.load.cmc_four_column(file_name)
+  data = load_binary(file_name)
+  positives = _positives(data)
+  # sort scores by probe
+  order = numpy.argsort(data['path'], kind = 'mergesort')
+  paths = data['path'][order]
+  boundaries = numpy.flatnonzero(numpy.diff(paths)) + 1
+  retval = []
+  for indices in numpy.split(order, boundaries) if len(order) else []:
+    retval.append((data['scores'][indices[~positives[indices]]], data['scores'][indices[positives[indices]]]))
+  return retval
+
+def four_column(file_name):
+  """Reads the given score file (in text or in binary format) and returns the claimed id, the real id, the probe path and the score for each line."""
+  if not is_binary(file_name):
+    for line in bob.measure.load.four_column(file_name):
+      yield line
+  else:
+    data = load_binary(file_name)
+    for claimed, real, path, score in zip(data['claimed_table'][data['claimed']], data['real_table'][data['real']], data['path_table'][data['path']], data['scores']):
+      yield (claimed, real, path, score)
+
+
+class ScoreWriter:
+  """Writes the scores of one or several models into one score file (in text or in binary format).
+  The scores are written to a temporary file, which is renamed when the writer is closed, so that other jobs will never read incomplete score files."""
+
+  def __init__(self, file_name, binary = False):
+    self.m_file_name = file_name
+    self.m_temporary_file = file_name + '.tmp'
+    self.m_binary = binary
+    if binary:
+      # binary files are written at once when closing the writer; until then, the tables are built incrementally
+      self.m_tables = (_Table(), _Table(), _Table())
+      self.m_columns = ([], [], [], [])
+      # the indices of the last probes, which are usually identical for several models
+      self.m_last_probes = None
+    else:
+      self.m_file = open(self.m_temporary_file, 'w')
+
+  def write(self, claimed_id, real_ids, paths, scores):
+    """Appends the scores of the model with the given claimed id for the probes with the given real ids and paths."""
+    assert len(real_ids) == len(paths) == len(scores)
+    if self.m_binary:
+      if self.m_last_probes is None or self.m_last_probes[0] != real_ids or self.m_last_probes[1] != paths:
+        self.m_last_probes = (list(real_ids), list(paths), self.m_tables[1].indices(real_ids), self.m_tables[2].indices(paths))
+      self.m_columns[0].append(numpy.repeat(numpy.int32(self.m_tables[0].index(claimed_id)), len(scores)))
+      self.m_columns[1].append(self.m_last_probes[2])
+      self.m_columns[2].append(self.m_last_probes[3])
+      self.m_columns[3].append(numpy.asarray(scores, dtype = numpy.float64))
+    else:
+      for real_id, path, score in zip(real_ids, paths, scores):
+        self.m_file.write(str(claimed_id) + " " + str(real_id) + " " + str(path) + " " + str(score) + "\n")
+
+  def close(self):
+    """Finishes writing the score file."""
+    if self.m_binary:
+      data = {}
+      for key, table, column, dtype in zip(('claimed', 'real', 'path', 'scores'), self.m_tables + (None,), self.m_columns, (numpy.int32, numpy.int32, numpy.int32, numpy.float64)):
+        data[key] = numpy.concatenate(column) if column else numpy.ndarray((0,), dtype)
+        if table is not None:
+          data[key + '_table'] = table.table()
+      save_binary_data(self.m_temporary_file, data)
+    else:
+      self.m_file.close()
+    os.rename(self.m_temporary_file, self.m_file_name)
+
+
+def _read_chunks(file_names, buffer_size, queue):
+  """Reads the given files in chunks of the given size and puts the chunks into the given queue.
+  The end of each file is marked by None; errors are forwarded through the queue."""
+  try:
+    for file_name in file_names:
+      with open(file_name, 'rb') as f:
+        while True:
+          chunk = f.read(buffer_size)
+          if not chunk:
+            break
+          queue.put(chunk)
+      queue.put(None)
+  except Exception as e:
+    queue.put(e)
+
+def concatenate_text(file_names, output_file, buffer_size = 1048576, prefetch = 4, queue_size = 4):
+  """Concatenates the given text score files into the given output file.
+  The upcoming files are read in up to prefetch parallel threads, while the files are written in their original order.
+  At most queue_size chunks of buffer_size bytes per thread are kept in memory."""
+  readers = max(min(prefetch, len(file_names)), 1)
+  queues = [Queue.Queue(queue_size) for k in range(readers)]
+  # thread k reads the files k, k+readers, k+2*readers, ...
+  threads = [threading.Thread(target = _read_chunks, args = (file_names[k::readers], buffer_size, queues[k])) for k in range(readers)]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+
+  with open(output_file, 'wb') as f:
+    for i in range(len(file_names)):
+      queue = queues[i % readers]
+      while True:
+        chunk = queue.get()
+        if chunk is None:
+          break
+        if isinstance(chunk, Exception):
+          raise chunk
+        f.write(chunk)
+
+  for thread in threads:
+    thread.join()